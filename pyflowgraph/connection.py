@@ -4,6 +4,7 @@
 #
 
 from qtpy import QtGui, QtWidgets, QtCore
+from .level_of_detail import LOD_FULL, LOD_FAR
 
 
 class Connection(QtWidgets.QGraphicsPathItem):
@@ -15,6 +16,7 @@ class Connection(QtWidgets.QGraphicsPathItem):
         self.__graph = graph
         self.__srcPortCircle = srcPortCircle
         self.__dstPortCircle = dstPortCircle
+        self.__levelOfDetail = LOD_FULL
         penStyle = QtCore.Qt.DashLine
 
         self.__connectionColor = QtGui.QColor(0, 0, 0)
@@ -35,19 +37,50 @@ class Connection(QtWidgets.QGraphicsPathItem):
         self.setZValue(-1)
 
         self.setAcceptHoverEvents(True)
+
+        self.__endPoints = None
+        self.__shape = None
         self.connect()
+        self.updatePath()
 
 
     def setPenStyle(self, penStyle):
         self.__defaultPen.setStyle(penStyle)
         self.__hoverPen.setStyle(penStyle)
-        self.setPen(self.__defaultPen) # Force a redraw
+        self.setPen(self.__lodPen(self.__defaultPen)) # Force a redraw
 
 
     def setPenWidth(self, width):
         self.__defaultPen.setWidthF(width)
         self.__hoverPen.setWidthF(width)
-        self.setPen(self.__defaultPen) # Force a redraw
+        self.setPen(self.__lodPen(self.__defaultPen)) # Force a redraw
+        self.__shape = None
+
+
+    def getLevelOfDetail(self):
+        return self.__levelOfDetail
+
+
+    def setLevelOfDetail(self, lod):
+        if lod == self.__levelOfDetail:
+            return
+
+        wasFar = self.__levelOfDetail == LOD_FAR
+        self.__levelOfDetail = lod
+        self.setPen(self.__lodPen(self.__defaultPen))
+
+        if wasFar != (lod == LOD_FAR):
+            self.__endPoints = None
+            self.updatePath()
+
+
+    def __lodPen(self, pen):
+        # Dash patterns are expensive to stroke, only use them at full detail.
+        if self.__levelOfDetail == LOD_FULL:
+            return pen
+        pen = QtGui.QPen(pen)
+        pen.setStyle(QtCore.Qt.SolidLine)
+        return pen
 
 
     def getSrcPortCircle(self):
@@ -66,43 +99,54 @@ class Connection(QtWidgets.QGraphicsPathItem):
         return self.__dstPortCircle.getPort()
 
 
-    def boundingRect(self):
-        srcPoint = self.mapFromScene(self.__srcPortCircle.centerInSceneCoords())
-        dstPoint = self.mapFromScene(self.__dstPortCircle.centerInSceneCoords())
-        penWidth = self.__defaultPen.width()
+    def updatePath(self):
+        """Rebuilds the cached curve if one of the end points moved.
 
-        return QtCore.QRectF(
-            min(srcPoint.x(), dstPoint.x()),
-            min(srcPoint.y(), dstPoint.y()),
-            abs(dstPoint.x() - srcPoint.x()),
-            abs(dstPoint.y() - srcPoint.y()),
-            ).adjusted(-penWidth/2, -penWidth/2, +penWidth/2, +penWidth/2)
+        The path, and with it the bounding rect and shape, is only rebuilt here
+        so that painting the connection never constructs any geometry.
 
+        """
 
-    def paint(self, painter, option, widget):
         srcPoint = self.mapFromScene(self.__srcPortCircle.centerInSceneCoords())
         dstPoint = self.mapFromScene(self.__dstPortCircle.centerInSceneCoords())
 
-        dist_between = dstPoint - srcPoint
+        endPoints = (srcPoint.x(), srcPoint.y(), dstPoint.x(), dstPoint.y())
+        if endPoints == self.__endPoints:
+            return
+        self.__endPoints = endPoints
+
+        path = QtGui.QPainterPath()
+        path.moveTo(srcPoint)
+        if self.__levelOfDetail == LOD_FAR:
+            path.lineTo(dstPoint)
+        else:
+            dist_between = dstPoint - srcPoint
+            path.cubicTo(
+                srcPoint + QtCore.QPointF(dist_between.x() * 0.4, 0),
+                dstPoint - QtCore.QPointF(dist_between.x() * 0.4, 0),
+                dstPoint
+                )
+
+        # setPath notifies the scene of the geometry change.
+        self.setPath(path)
+        self.__shape = None
 
-        self.__path = QtGui.QPainterPath()
-        self.__path.moveTo(srcPoint)
-        self.__path.cubicTo(
-            srcPoint + QtCore.QPointF(dist_between.x() * 0.4, 0),
-            dstPoint - QtCore.QPointF(dist_between.x() * 0.4, 0),
-            dstPoint
-            )
-        self.setPath(self.__path)
-        super(Connection, self).paint(painter, option, widget)
+
+    def shape(self):
+        if self.__shape is None:
+            stroker = QtGui.QPainterPathStroker()
+            stroker.setWidth(self.__defaultPen.widthF())
+            self.__shape = stroker.createStroke(self.path())
+        return self.__shape
 
 
     def hoverEnterEvent(self, event):
-        self.setPen(self.__hoverPen)
+        self.setPen(self.__lodPen(self.__hoverPen))
         super(Connection, self).hoverEnterEvent(event)
 
 
     def hoverLeaveEvent(self, event):
-        self.setPen(self.__defaultPen)
+        self.setPen(self.__lodPen(self.__defaultPen))
         super(Connection, self).hoverLeaveEvent(event)
 
 
@@ -134,10 +178,13 @@ class Connection(QtWidgets.QGraphicsPathItem):
 
 
     def disconnect(self):
+        self.__graph._unregisterConnection(self)
         self.__srcPortCircle.removeConnection(self)
         self.__dstPortCircle.removeConnection(self)
 
 
     def connect(self):
+        # Raises if the connection would create a cycle.
+        self.__graph._registerConnection(self)
         self.__srcPortCircle.addConnection(self)
         self.__dstPortCircle.addConnection(self)
@@ -0,0 +1,129 @@
+#
+# Copyright 2015-2017 Eric Thivierge
+#
+
+from qtpy import QtCore
+from .flat_node import FlatPortCircle
+
+
+class ConnectionTargetIndex(object):
+    """Index of the port circles a dragged connection can attach to.
+
+    The index is built once when a connection drag starts. It only holds the
+    circles that pass the rules of canConnectTo against the source circle,
+    grouped by node, so lookups while dragging never have to test
+    compatibility again. Lookups go
+    through the graph's spatial index of nodes and only visit the nodes near the
+    mouse. The geometry of a node's circles is computed the first time the node
+    is visited.
+
+    """
+
+    def __init__(self, graph, sourcePortCircle):
+        super(ConnectionTargetIndex, self).__init__()
+        self.__graph = graph
+        self.__sourcePortCircle = sourcePortCircle
+        self.__targets = {}
+        self.__geometry = {}
+
+        sourcePort = sourcePortCircle.getPort()
+        sourceNode = sourcePort.getNode()
+        dataType = sourcePort.getDataType()
+        # Connecting to these nodes would close a cycle. They are found once
+        # here, rather than by a search per candidate in canConnectTo.
+        if sourcePortCircle.connectionPointType() == 'In':
+            getCircle = lambda port: port.outCircle()
+            excludedNodes = graph.getDownstreamNodes(sourceNode)
+        else:
+            getCircle = lambda port: port.inCircle()
+            excludedNodes = graph.getUpstreamNodes(sourceNode)
+
+        for node in graph.getNodes():
+            if node in excludedNodes:
+                continue
+            circles = []
+            # Ports hidden by collapsed nodes are no targets.
+            for port in node.getShownPorts():
+                if port.getDataType() != dataType:
+                    continue
+                circle = getCircle(port)
+                if circle is not None:
+                    circles.append(circle)
+            if len(circles) > 0:
+                self.__targets[node] = circles
+
+    def getSourcePortCircle(self):
+        return self.__sourcePortCircle
+
+    def __len__(self):
+        return sum(len(circles) for circles in self.__targets.values())
+
+    def __contains__(self, circle):
+        return circle in self.__targets.get(circle.getPort().getNode(), ())
+
+    def __getGeometry(self, circle):
+        geometry = self.__geometry.get(circle)
+        if geometry is not None:
+            return geometry
+
+        # Ports can also be hit through their label.
+        port = circle.getPort()
+        if isinstance(circle, FlatPortCircle):
+            node = port.getNode()
+            rect = node.mapRectToScene(node.getPortRowRect(port))
+        else:
+            rect = circle.sceneBoundingRect()
+            labelItem = port.labelItem()
+            if labelItem is not None:
+                rect = rect.united(labelItem.sceneBoundingRect())
+
+        geometry = (circle.centerInSceneCoords(), rect)
+        self.__geometry[circle] = geometry
+        return geometry
+
+    def findTarget(self, scenePos, snapDistance=0.0):
+        """Gets the compatible port circle under or nearest to a position.
+
+        Circles whose hit area contains the position win over circles that are
+        only within the snap distance. Ties are broken by the distance to the
+        circle center.
+
+        Args:
+            scenePos (QPointF): Position in scene coordinates.
+            snapDistance (float): Maximum distance in scene units between the
+                position and the center of a circle that is not hit directly.
+
+        Returns:
+            object: The port circle, None if no compatible circle is in reach.
+
+        """
+
+        # Empty rectangles never intersect anything, so query at least one unit.
+        queryExtent = max(snapDistance, 1.0)
+        queryRect = QtCore.QRectF(
+            scenePos.x() - queryExtent,
+            scenePos.y() - queryExtent,
+            queryExtent * 2,
+            queryExtent * 2
+            )
+
+        maxDistanceSquared = snapDistance * snapDistance
+        result = None
+        resultKey = None
+        for node in self.__graph.getNodesInRect(queryRect):
+            circles = self.__targets.get(node)
+            if circles is None:
+                continue
+            for circle in circles:
+                (center, rect) = self.__getGeometry(circle)
+                dx = center.x() - scenePos.x()
+                dy = center.y() - scenePos.y()
+                distanceSquared = dx * dx + dy * dy
+                hit = rect.contains(scenePos)
+                if not hit and distanceSquared > maxDistanceSquared:
+                    continue
+                key = (not hit, distanceSquared)
+                if resultKey is None or key < resultKey:
+                    result = circle
+                    resultKey = key
+        return result
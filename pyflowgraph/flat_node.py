@@ -0,0 +1,435 @@
+#
+# Copyright 2015-2017 Eric Thivierge
+#
+
+from qtpy import QtGui, QtCore
+from .node import Node
+from .port import ConnectionPoint
+from .level_of_detail import LOD_FULL, LOD_FAR
+from .text_cache import getStaticText, getTextSize
+from .profiler import profiledPaint
+
+
+class FlatPortCircle(ConnectionPoint):
+    """Connection point of a FlatPort.
+
+    Provides the same interface as PortCircle, but is not an item in the scene.
+    The FlatNode owning the port computes its position and paints it.
+
+    """
+
+    def __init__(self, port, connectionPointType):
+        super(FlatPortCircle, self).__init__()
+
+        self.__port = port
+        self._initConnectionPoint(port.getGraph(), connectionPointType)
+        self.__highlighted = False
+
+    def getPort(self):
+        return self.__port
+
+
+    def getColor(self):
+        return self.getPort().getColor()
+
+
+    def centerInSceneCoords(self):
+        node = self.__port.getNode()
+        return node.mapToScene(node.getPortCirclePos(self))
+
+
+    def isHighlighted(self):
+        return self.__highlighted
+
+
+    def highlight(self):
+        self.__highlighted = True
+        self.__port.getNode().update()
+
+
+    def unhighlight(self):
+        self.__highlighted = False
+        self.__port.getNode().update()
+
+
+class FlatPort(object):
+    """Port of a FlatNode.
+
+    Provides the same interface as BasePort without creating any items.
+
+    """
+
+    def __init__(self, parent, graph, name, color, dataType, connectionPointType):
+        super(FlatPort, self).__init__()
+
+        self._node = parent
+        self._graph = graph
+        self._name = name
+        self._color = color
+        self._dataType = dataType
+        self._connectionPointType = connectionPointType
+
+        self._inCircle = None
+        self._outCircle = None
+        if connectionPointType in ('In', 'IO'):
+            self._inCircle = FlatPortCircle(self, 'In')
+        if connectionPointType in ('Out', 'IO'):
+            self._outCircle = FlatPortCircle(self, 'Out')
+
+
+    def getName(self):
+        return self._name
+
+
+    def getDataType(self):
+        return self._dataType
+
+
+    def getNode(self):
+        return self._node
+
+
+    def getGraph(self):
+        return self._graph
+
+
+    def getColor(self):
+        return self._color
+
+
+    def setColor(self, color):
+        self._color = color
+        self._node.update()
+
+
+    def inCircle(self):
+        return self._inCircle
+
+
+    def outCircle(self):
+        return self._outCircle
+
+
+    def labelItem(self):
+        # The label is painted by the node.
+        return None
+
+
+    def connectionPointType(self):
+        return self._connectionPointType
+
+
+class FlatInputPort(FlatPort):
+
+    def __init__(self, parent, graph, name, color, dataType):
+        super(FlatInputPort, self).__init__(parent, graph, name, color, dataType, 'In')
+
+
+class FlatOutputPort(FlatPort):
+
+    def __init__(self, parent, graph, name, color, dataType):
+        super(FlatOutputPort, self).__init__(parent, graph, name, color, dataType, 'Out')
+
+
+class FlatIOPort(FlatPort):
+
+    def __init__(self, parent, graph, name, color, dataType):
+        super(FlatIOPort, self).__init__(parent, graph, name, color, dataType, 'IO')
+
+
+class FlatNode(Node):
+    """Node drawn by a single item.
+
+    The title, port labels and port circles are painted in one paint call from
+    geometry computed in Python, instead of being built from nested
+    QGraphicsWidgets and layouts. Use FlatInputPort, FlatOutputPort and
+    FlatIOPort to add ports to it.
+
+    """
+
+    __titleColor = QtGui.QColor(25, 25, 25)
+    __titleFont = QtGui.QFont('Decorative', 14)
+    __titleFont.setLetterSpacing(QtGui.QFont.PercentageSpacing, 115)
+
+    __labelColor = QtGui.QColor(25, 25, 25)
+    __labelHighlightColor = QtGui.QColor(225, 225, 225, 255)
+    __labelFont = QtGui.QFont('Decorative', 12)
+
+    __circlePen = QtGui.QPen(QtGui.QColor(25, 25, 25), 1.0)
+    __circleRadius = 4.5
+
+    _headerHeight = QtGui.QFontMetrics(__titleFont).height() + 8
+    _rowHeight = QtGui.QFontMetrics(__labelFont).height() + 5
+    _bottomMargin = 7
+    _labelMargin = 10
+    _portPadding = 30
+    _titlePadding = 20
+
+    __groups = ('In', 'IO', 'Out')
+
+    _portClasses = {'In': FlatInputPort, 'Out': FlatOutputPort, 'IO': FlatIOPort}
+
+    def _initContents(self):
+        self.__rows = dict((group, []) for group in self.__groups)
+        self.__portRows = {}
+        self.__portWidth = 0
+        self.__titleWidth = getTextSize(self.getName(), self.__titleFont).width()
+        self.setAcceptHoverEvents(True)
+        self.__hoverCircle = None
+        self.__updateSize()
+
+
+    def __updateSize(self):
+        rowCount = len(self.__portRows)
+        size = QtCore.QSizeF(
+            max(self.__titleWidth + self._titlePadding, self.__portWidth, self.minimumWidth()),
+            self._headerHeight + rowCount * self._rowHeight + self._bottomMargin
+            )
+        self.setPreferredSize(size)
+        self.resize(size)
+
+
+    def _setTitle(self, text):
+        self.__titleWidth = getTextSize(text, self.__titleFont).width()
+        self.__updateSize()
+
+
+    def getHeader(self):
+        return None
+
+
+    def getTitleHeight(self):
+        return self._headerHeight
+
+
+    def _applyLevelOfDetail(self, lod):
+        # All details are painted by the node itself.
+        pass
+
+
+    #########################
+    ## Ports
+
+    def _layoutPorts(self, ports):
+        for port in ports:
+            rows = self.__rows[port.connectionPointType()]
+            self.__portRows[port] = len(rows)
+            rows.append(port)
+
+            labelWidth = getTextSize(port.getName(), self.__labelFont).width()
+            self.__portWidth = max(self.__portWidth, labelWidth + 2 * self._portPadding)
+        self.__updateSize()
+
+
+    def _reorderPorts(self, ports):
+        self.__rows = dict((group, []) for group in self.__groups)
+        self.__portRows = {}
+        self._layoutPorts(ports)
+        self.update()
+
+
+    def _showPort(self, port, shownPorts):
+        self._reorderPorts(shownPorts)
+
+
+    def _hidePort(self, port, shownPorts):
+        if port in self.__portRows:
+            self._reorderPorts(shownPorts)
+
+
+    def __getRowIndex(self, port):
+        rowIndex = self.__portRows[port]
+        for group in self.__groups:
+            if group == port.connectionPointType():
+                break
+            rowIndex += len(self.__rows[group])
+        return rowIndex
+
+
+    def getPortCirclePos(self, portCircle):
+        """Gets the center of a port circle in the node's coordinates.
+
+        Args:
+            portCircle (FlatPortCircle): Circle of one of the node's ports.
+
+        Returns:
+            QPointF: Center of the circle.
+
+        """
+
+        port = portCircle.getPort()
+        if port not in self.__portRows:
+            return self.getPortProxyPos(portCircle.connectionPointType())
+        rowIndex = self.__getRowIndex(port)
+        y = self._headerHeight + (rowIndex + 0.5) * self._rowHeight
+        if portCircle.isInConnectionPoint():
+            return QtCore.QPointF(0, y)
+        return QtCore.QPointF(self.size().width(), y)
+
+
+    def getPortRowRect(self, port):
+        """Gets the row a port is drawn in, in the node's coordinates.
+
+        Args:
+            port (FlatPort): One of the node's ports.
+
+        Returns:
+            QRectF: Rectangle spanning the full width of the node.
+
+        """
+
+        rowIndex = self.__getRowIndex(port)
+        return QtCore.QRectF(0, self._headerHeight + rowIndex * self._rowHeight, self.size().width(), self._rowHeight)
+
+
+    def getPortCircleAt(self, pos, connectionPointType=None, radius=None):
+        """Gets the port circle at a position in the node's coordinates.
+
+        Args:
+            pos (QPointF): Position to test.
+            connectionPointType (str): Only consider 'In' or 'Out' circles. When
+                set, the whole row of a port is used as hit area.
+            radius (float): Hit radius around the circles. Defaults to the
+                circle radius.
+
+        Returns:
+            FlatPortCircle: Circle at the position, None if there is none.
+
+        """
+
+        rowIndex = int((pos.y() - self._headerHeight) // self._rowHeight)
+        if rowIndex < 0:
+            return None
+
+        for group in self.__groups:
+            rows = self.__rows[group]
+            if rowIndex >= len(rows):
+                rowIndex -= len(rows)
+                continue
+
+            port = rows[rowIndex]
+            if connectionPointType is not None:
+                if connectionPointType == 'In':
+                    return port.inCircle()
+                return port.outCircle()
+
+            if radius is None:
+                radius = self.__circleRadius * 1.5
+            for circle in (port.inCircle(), port.outCircle()):
+                if circle is None:
+                    continue
+                delta = pos - self.getPortCirclePos(circle)
+                if delta.x() * delta.x() + delta.y() * delta.y() <= radius * radius:
+                    return circle
+            return None
+
+        return None
+
+
+    #########################
+    ## Painting
+
+    @profiledPaint
+    def paint(self, painter, option, widget):
+        super(FlatNode, self).paint(painter, option, widget)
+
+        lod = self.getLevelOfDetail()
+        if lod == LOD_FAR:
+            return
+
+        width = self.size().width()
+
+        name = self.getName()
+        titleSize = getTextSize(name, self.__titleFont)
+        painter.setFont(self.__titleFont)
+        painter.setPen(self.__titleColor)
+        painter.drawStaticText(
+            QtCore.QPointF((width - titleSize.width()) * 0.5, (self.getTitleHeight() - titleSize.height()) * 0.5),
+            getStaticText(name, self.__titleFont)
+            )
+
+        radius = self.__circleRadius
+        rowHeight = self._rowHeight
+        labelMargin = self._labelMargin
+        drawLabels = lod == LOD_FULL
+        painter.setFont(self.__labelFont)
+
+        y = self._headerHeight
+        for group in self.__groups:
+            for port in self.__rows[group]:
+                inCircle = port.inCircle()
+                outCircle = port.outCircle()
+                highlighted = False
+
+                painter.setPen(self.__circlePen)
+                if inCircle is not None:
+                    highlighted = highlighted or inCircle.isHighlighted()
+                    circleRadius = radius * 1.3 if inCircle.isHighlighted() else radius
+                    painter.setBrush(port.getColor().lighter() if inCircle.isHighlighted() else port.getColor())
+                    center = QtCore.QPointF(0, y + rowHeight * 0.5)
+                    painter.drawPie(QtCore.QRectF(center.x() - circleRadius, center.y() - circleRadius, circleRadius * 2, circleRadius * 2), 270 * 16, 180 * 16)
+                if outCircle is not None:
+                    highlighted = highlighted or outCircle.isHighlighted()
+                    circleRadius = radius * 1.3 if outCircle.isHighlighted() else radius
+                    painter.setBrush(port.getColor().lighter() if outCircle.isHighlighted() else port.getColor())
+                    center = QtCore.QPointF(width, y + rowHeight * 0.5)
+                    painter.drawEllipse(center, circleRadius, circleRadius)
+
+                if drawLabels:
+                    name = port.getName()
+                    labelSize = getTextSize(name, self.__labelFont)
+                    if group == 'In':
+                        x = labelMargin
+                    elif group == 'Out':
+                        x = width - labelMargin - labelSize.width()
+                    else:
+                        x = (width - labelSize.width()) * 0.5
+                    painter.setPen(self.__labelHighlightColor if highlighted else self.__labelColor)
+                    painter.drawStaticText(
+                        QtCore.QPointF(x, y + (rowHeight - labelSize.height()) * 0.5),
+                        getStaticText(name, self.__labelFont)
+                        )
+
+                y += rowHeight
+
+
+    #########################
+    ## Events
+
+    def __setHoverCircle(self, circle):
+        if circle is self.__hoverCircle:
+            return
+        if self.__hoverCircle is not None:
+            self.__hoverCircle.unhighlight()
+        self.__hoverCircle = circle
+        if circle is not None:
+            circle.highlight()
+
+
+    def hoverMoveEvent(self, event):
+        self.__setHoverCircle(self.getPortCircleAt(event.pos()))
+        super(FlatNode, self).hoverMoveEvent(event)
+
+
+    def hoverLeaveEvent(self, event):
+        self.__setHoverCircle(None)
+        super(FlatNode, self).hoverLeaveEvent(event)
+
+
+    def mousePressEvent(self, event):
+        circle = None
+        if event.button() == QtCore.Qt.LeftButton:
+            circle = self.getPortCircleAt(event.pos())
+
+        if circle is None:
+            super(FlatNode, self).mousePressEvent(event)
+            return
+
+        self.__setHoverCircle(None)
+        scenePos = self.mapToScene(event.pos())
+
+        from .mouse_grabber import MouseGrabber
+        if circle.isInConnectionPoint():
+            MouseGrabber(self.getGraph(), scenePos, circle, 'Out')
+        else:
+            MouseGrabber(self.getGraph(), scenePos, circle, 'In')
@@ -0,0 +1,236 @@
+#
+# Copyright 2015-2017 Eric Thivierge
+#
+
+import time
+import threading
+
+from qtpy import QtCore
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Finest level of the quadtree, the grids of the levels get up to 4^level cells.
+MAX_TREE_DEPTH = 10
+
+
+def _getInteractionOffsets():
+    # Offsets from a cell to the cells of the same level whose parent neighbors
+    # the cell's parent, without the cell's own neighbors. The offsets depend
+    # on the parity of the cell coordinates, indexed by 2 * (x & 1) + (y & 1).
+    result = []
+    for xParity in (0, 1):
+        for yParity in (0, 1):
+            offsets = []
+            for dx in range(-2 - xParity, 4 - xParity):
+                for dy in range(-2 - yParity, 4 - yParity):
+                    if abs(dx) > 1 or abs(dy) > 1:
+                        offsets.append((dx, dy))
+            result.append(offsets)
+    return np.array(result, dtype=np.int64)
+
+
+class ForceLayout(QtCore.QThread):
+    """Force-directed layout computed in a worker thread.
+
+    Connected nodes attract each other and all nodes repel each other, the way
+    Fruchterman and Reingold describe it. Repulsion uses a Barnes-Hut
+    approximation over the levels of a quadtree: a node sees the cells that
+    are not adjacent to its own cell but whose parents are as single bodies at
+    their center of mass, and only the nodes of the neighboring cells of the
+    finest level one by one. The moves are capped by a temperature that cools
+    down over the iterations.
+
+    The thread works on a NumPy snapshot of the positions and never touches the
+    graph. It emits positionsComputed with a copy of the positions at most
+    frameRate times per second, and once more when it is done.
+
+    """
+
+    positionsComputed = QtCore.Signal(object)
+
+    def __init__(self, positions, sizes, src, dst, pinned=None, iterations=300, frameRate=30.0, nodeSpacing=40.0, gravity=0.05, parent=None):
+        super(ForceLayout, self).__init__(parent)
+        if np is None:
+            raise Exception("ForceLayout requires numpy.")
+
+        self.__positions = np.array(positions, dtype=np.float64).reshape(-1, 2)
+        nodeCount = len(self.__positions)
+        sizes = np.array(sizes, dtype=np.float64).reshape(-1, 2)
+        self.__src = np.asarray(src, dtype=np.int64)
+        self.__dst = np.asarray(dst, dtype=np.int64)
+        if pinned is None:
+            pinned = np.zeros(nodeCount, dtype=bool)
+        self.__movable = ~np.asarray(pinned, dtype=bool)
+        self.__iterations = int(iterations)
+        self.__frameInterval = 1.0 / frameRate if frameRate > 0 else 0.0
+        self.__gravity = float(gravity)
+        self.__cancelled = False
+        self.__resumed = threading.Event()
+        self.__resumed.set()
+
+        # Ideal distance between two connected nodes.
+        if nodeCount > 0:
+            self.__distance = float(sizes.max(axis=1).mean()) + nodeSpacing
+        else:
+            self.__distance = nodeSpacing
+
+        # Nodes on top of each other would never be pushed apart.
+        jitter = np.random.RandomState(0).uniform(-0.5, 0.5, self.__positions.shape)
+        self.__positions += jitter * self.__movable[:, None]
+
+    def cancel(self):
+        """Asks the thread to stop after the current iteration."""
+        self.__cancelled = True
+        self.__resumed.set()
+
+    def pause(self):
+        """Holds the thread before its next iteration.
+
+        Python threads share one interpreter lock, the view pauses the layout
+        while it applies a frame so that both do not compete for it.
+
+        """
+
+        self.__resumed.clear()
+
+    def resume(self):
+        self.__resumed.set()
+
+    def isCancelled(self):
+        return self.__cancelled
+
+    def run(self):
+        positions = self.__positions
+        iterations = self.__iterations
+        nodeCount = len(positions)
+        startTemperature = self.__distance * max(np.sqrt(nodeCount), 1.0) * 0.1
+
+        lastFrame = time.time()
+        for iteration in range(iterations):
+            self.__resumed.wait()
+            if self.__cancelled:
+                break
+            temperature = startTemperature * (1.0 - float(iteration) / iterations)
+            positions = self.step(positions, temperature)
+
+            now = time.time()
+            if now - lastFrame >= self.__frameInterval:
+                lastFrame = now
+                self.positionsComputed.emit(positions.copy())
+
+        self.__positions = positions
+        self.positionsComputed.emit(positions.copy())
+
+    def getPositions(self):
+        return self.__positions
+
+    def step(self, positions, temperature):
+        """Computes one iteration of the layout.
+
+        Args:
+            positions (array): Current (n, 2) positions of the nodes.
+            temperature (float): Maximum distance a node may move.
+
+        Returns:
+            array: The new positions.
+
+        """
+
+        nodeCount = len(positions)
+        if nodeCount == 0:
+            return positions
+        distance = self.__distance
+        forces = self.__computeRepulsion(positions, distance * distance)
+
+        # Connected nodes pull each other with a force growing with the square
+        # of their distance.
+        src = self.__src
+        dst = self.__dst
+        if len(src) > 0:
+            deltas = positions[dst] - positions[src]
+            lengths = np.sqrt((deltas * deltas).sum(axis=1))
+            pulls = deltas * (lengths / distance)[:, None]
+            for axis in (0, 1):
+                forces[:, axis] += np.bincount(src, weights=pulls[:, axis], minlength=nodeCount)
+                forces[:, axis] -= np.bincount(dst, weights=pulls[:, axis], minlength=nodeCount)
+
+        # A weak pull to the center keeps unconnected parts together.
+        forces += (positions.mean(axis=0) - positions) * self.__gravity
+
+        lengths = np.sqrt((forces * forces).sum(axis=1))
+        scales = np.minimum(lengths, temperature) / np.maximum(lengths, 1e-9)
+        scales[~self.__movable] = 0.0
+        return positions + forces * scales[:, None]
+
+    def __computeRepulsion(self, positions, strength):
+        nodeCount = len(positions)
+        forces = np.zeros((nodeCount, 2))
+
+        lower = positions.min(axis=0)
+        extent = max(float((positions.max(axis=0) - lower).max()), 1e-6)
+        # The finest cells hold the nodes within about two ideal distances.
+        depth = int(np.ceil(np.log2(max(extent / (2.0 * np.sqrt(strength)), 1.0))))
+        depth = min(max(depth, 1), MAX_TREE_DEPTH)
+        normalized = (positions - lower) / extent
+
+        # Far field: from the level where all cells still neighbor each other
+        # down to the finest one, every node sees the cells of its interaction
+        # list as single bodies.
+        interactionOffsets = _getInteractionOffsets()
+        for level in range(2, depth + 1):
+            side = 1 << level
+            cells = np.minimum((normalized * side).astype(np.int64), side - 1)
+
+            # The grid is padded so that the offsets never leave it.
+            padding = 3
+            stride = side + 2 * padding
+            keys = (cells[:, 0] + padding) * stride + cells[:, 1] + padding
+            masses = np.bincount(keys, minlength=stride * stride).astype(np.float64)
+            centerX = np.bincount(keys, weights=positions[:, 0], minlength=stride * stride) / np.maximum(masses, 1.0)
+            centerY = np.bincount(keys, weights=positions[:, 1], minlength=stride * stride) / np.maximum(masses, 1.0)
+
+            offsets = interactionOffsets[2 * (cells[:, 0] & 1) + (cells[:, 1] & 1)]
+            neighborKeys = keys[:, None] + offsets[:, :, 0] * stride + offsets[:, :, 1]
+            neighborMasses = masses[neighborKeys]
+            dx = positions[:, 0, None] - centerX[neighborKeys]
+            dy = positions[:, 1, None] - centerY[neighborKeys]
+            scales = neighborMasses * strength / np.maximum(dx * dx + dy * dy, 1e-6)
+            forces[:, 0] += (dx * scales).sum(axis=1)
+            forces[:, 1] += (dy * scales).sum(axis=1)
+
+        # Near field: exact forces between the nodes of neighboring cells of
+        # the finest level.
+        side = 1 << depth
+        cells = np.minimum((normalized * side).astype(np.int64), side - 1)
+        stride = side + 2
+        keys = (cells[:, 0] + 1) * stride + cells[:, 1] + 1
+        order = np.argsort(keys, kind='stable')
+        cellStarts = np.zeros(stride * stride + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys, minlength=stride * stride), out=cellStarts[1:])
+
+        nodes = np.arange(nodeCount)
+        for dxCell in (-1, 0, 1):
+            for dyCell in (-1, 0, 1):
+                neighborKeys = keys + dxCell * stride + dyCell
+                starts = cellStarts[neighborKeys]
+                counts = cellStarts[neighborKeys + 1] - starts
+                total = int(counts.sum())
+                if total == 0:
+                    continue
+                sources = np.repeat(nodes, counts)
+                shifts = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+                others = order[shifts + np.arange(total)]
+                keep = sources != others
+                sources = sources[keep]
+                others = others[keep]
+
+                dx = positions[sources, 0] - positions[others, 0]
+                dy = positions[sources, 1] - positions[others, 1]
+                scales = strength / np.maximum(dx * dx + dy * dy, 1e-6)
+                forces[:, 0] += np.bincount(sources, weights=dx * scales, minlength=nodeCount)
+                forces[:, 1] += np.bincount(sources, weights=dy * scales, minlength=nodeCount)
+
+        return forces
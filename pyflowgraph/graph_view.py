@@ -3,7 +3,12 @@
 # Copyright 2015-2017 Eric Thivierge
 #
 
+import re
 import copy
+import time
+import json
+import collections
+import contextlib
 from future.utils import iteritems
 from past.builtins import basestring
 
@@ -13,6 +18,11 @@ from .node import Node
 from .connection import Connection
 
 from .selection_rect import SelectionRect
+from .level_of_detail import LOD_FULL, LOD_MEDIUM, LOD_FAR
+from .spatial_index import SpatialIndex
+from .topological_order import TopologicalOrder
+from .profiler import Profiler, profiled, setActiveProfiler, getEventTypeName
+from .undo_commands import MoveNodesCommand, SetNodePositionsCommand, SelectionCommand, RenameNodeCommand, ConnectionCommand, NodesCommand
 
 MANIP_MODE_NONE = 0
 MANIP_MODE_SELECT = 1
@@ -20,6 +30,15 @@ MANIP_MODE_PAN = 2
 MANIP_MODE_MOVE = 3
 MANIP_MODE_ZOOM = 4
 
+# Number of free-space queries tried when placing a node automatically, in
+# total and in one column before moving on to the next.
+AUTO_PLACE_MAX_PROBES = 24
+AUTO_PLACE_COLUMN_PROBES = 6
+
+# Header of the line-delimited JSON files written by GraphView.writeGraph.
+GRAPH_FILE_FORMAT = 'pyflowgraph'
+GRAPH_FILE_VERSION = 1
+
 
 class GraphView(QtWidgets.QGraphicsView):
 
@@ -38,12 +57,27 @@ class GraphView(QtWidgets.QGraphicsView):
     endNodeSelection = QtCore.Signal()
     selectionChanged = QtCore.Signal(list, list)
 
+    # After building a graph in bulk, this signal is emitted once with the new nodes and connections.
+    graphBuilt = QtCore.Signal(list, list)
+
+    # At the end of a batch, this signal is emitted once with the aggregated changes.
+    batchChanged = QtCore.Signal(dict)
+
     # During the movement of the nodes, this signal is emitted with the incremental delta.
     selectionMoved = QtCore.Signal(set, QtCore.QPointF)
 
     # After moving the nodes interactively, this signal is emitted with the final delta.
     endSelectionMoved = QtCore.Signal(set, QtCore.QPointF)
 
+    # After placing nodes at new positions in one go, this signal is emitted with the nodes.
+    nodesPositioned = QtCore.Signal(list)
+
+    # After a force-directed layout stops, this signal is emitted once.
+    forceLayoutFinished = QtCore.Signal()
+
+    # While profiling, this signal is emitted after each painted frame with its record.
+    frameProfiled = QtCore.Signal(dict)
+
 
 
     _clipboardData = None
@@ -54,19 +88,70 @@ class GraphView(QtWidgets.QGraphicsView):
     _gridSizeFine = 30
     _gridSizeCourse = 300
 
+    # Grid lines closer than this many pixels fade out.
+    _gridFadeSpacing = 6.0
+    _gridBrush = None
+    _gridBrushTileSize = None
+
     _mouseWheelZoomRate = 0.0005
 
     _snapToGrid = False
 
+    # Nodes added or connected programmatically are moved to free space next to their neighbors.
+    _autoPlaceNodes = False
+    _autoPlaceSpacing = 30.0
+
+    # Distance in view pixels within which a dragged connection snaps to a port.
+    _connectionSnapDistance = 10.0
+
+    _spatialIndexCellSize = 300
+
+    # Below these view scales the nodes and connections are drawn in less detail.
+    _lodMediumThreshold = 0.5
+    _lodFarThreshold = 0.25
+
+    # Maximum number of commands kept in the undo history.
+    _undoLimit = 200
+
+    # In virtual mode, items exist for the nodes within this fraction of the
+    # view size around the view, up to _virtualItemLimit nodes. At most
+    # _virtualBatchSize of them are created per event loop iteration, and up
+    # to _virtualPoolSize nodes leaving the view are kept for reuse.
+    _virtualMargin = 0.5
+    _virtualItemLimit = 1000
+    _virtualBatchSize = 100
+    _virtualPoolSize = 1000
+
+    # Heads-up display drawn over the graph with frame timings and item counts.
+    _hudFont = QtGui.QFont('Courier', 9)
+    _hudTextColor = QtGui.QColor(220, 220, 220)
+    _hudBackgroundColor = QtGui.QColor(0, 0, 0, 170)
+    _hudMargin = 6
+
+    # Mouse moves that select, pan, zoom or drag nodes are applied at most once
+    # per this many milliseconds, about once per display frame. The moves in
+    # between only update the pending state. 0 applies every move right away.
+    _manipulationFrameInterval = 16
+
     def __init__(self, parent=None):
         super(GraphView, self).__init__(parent)
         self.setObjectName('graphView')
 
+        self.__profiler = None
+        self.__profilingEnabled = False
+        self.__signalCounters = []
+        self.__hudVisible = False
+        self.__hudFrames = collections.deque(maxlen=240)
+        self.__hudViewportUpdateMode = None
+
         self.__graphViewWidget = parent
 
         self.setRenderHint(QtGui.QPainter.Antialiasing)
         self.setRenderHint(QtGui.QPainter.TextAntialiasing)
 
+        self.__virtualGraph = None
+        self.__virtualUpdatePending = False
+
         self.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
         self.setVerticalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
 
@@ -77,6 +162,21 @@ class GraphView(QtWidgets.QGraphicsView):
         self.setSceneRect(-size.width() * 0.5, -size.height() * 0.5, size.width(), size.height())
 
         self.setAcceptDrops(True)
+
+        self.__undoStack = QtWidgets.QUndoStack(self)
+        self.__undoStack.setUndoLimit(self._undoLimit)
+        self.__undoSuspended = 0
+        self.__autoPlaceSuspended = 0
+        self.__batchDepth = 0
+        self.__batchChanges = None
+        self.__batchRecordsSelection = False
+        self.__forceLayout = None
+
+        self.__pendingManipulation = None
+        self.__manipulationTimer = QtCore.QTimer(self)
+        self.__manipulationTimer.setSingleShot(True)
+        self.__manipulationTimer.timeout.connect(self.__applyPendingManipulation)
+
         self.reset()
 
 
@@ -87,15 +187,45 @@ class GraphView(QtWidgets.QGraphicsView):
     ################################################
     ## Graph
     def reset(self):
+        self.stopForceLayout(wait=True)
+        self.__manipulationTimer.stop()
+        self.__pendingManipulation = None
+        self.__detachVirtualGraph()
         self.setScene(QtWidgets.QGraphicsScene())
 
         self.__connections = set()
         self.__nodes = {}
+        self.__ports = {}
         self.__selection = set()
+        self.__spatialIndex = SpatialIndex(self._spatialIndexCellSize)
+        self.__levelOfDetail = LOD_FULL
+        self.__dragConnections = None
+        self.__topologicalOrder = TopologicalOrder()
+        self.__connectionEdges = {}
+        self.__nodeConnections = {}
+        self.__nameCounters = {}
+        self.__dragDelta = None
+        self.__floatingNodes = set()
+        self.__virtualPool = {}
+        self.__undoStack.clear()
+
+        # Bumped whenever nodes, their bounds or connections change, the HUD
+        # keeps its counts until then.
+        self.__revision = 0
+        self.__hudCounts = None
+
+        # A batch open around the reset goes on, without the changes made
+        # to the graph that is gone.
+        if self.__batchDepth > 0:
+            self.__batchChanges = self.__createBatchChanges()
+            self.__batchSelection = set()
+            self.__batchRecordsSelection = False
 
         self._manipulationMode = MANIP_MODE_NONE
         self._selectionRect = None
 
+        self._updateLevelOfDetail()
+
     def getGridSize(self):
         """Gets the size of the grid of the graph.
 
@@ -126,6 +256,112 @@ class GraphView(QtWidgets.QGraphicsView):
 
         self._snapToGrid = snap
 
+    def getAutoPlaceNodes(self):
+        """Gets whether new nodes are placed automatically.
+
+        Returns:
+            bool: Whether automatic placement is active.
+
+        """
+
+        return self._autoPlaceNodes
+
+    def setAutoPlaceNodes(self, autoPlace):
+        """Sets whether new nodes are placed automatically.
+
+        When active, addNode moves a new node to the nearest free space around
+        its position, and the first connectPorts involving it moves it next to
+        the node it is connected to. Nodes already in place never move.
+
+        Args:
+            autoPlace (bool): True to place new nodes automatically.
+
+        """
+
+        self._autoPlaceNodes = autoPlace
+        if not autoPlace:
+            self.__floatingNodes.clear()
+
+    def getConnectionSnapDistance(self):
+        """Gets the distance within which dragged connections snap to ports.
+
+        Returns:
+            float: Snap distance in view pixels.
+
+        """
+
+        return self._connectionSnapDistance
+
+    def setConnectionSnapDistance(self, distance):
+        """Sets the distance within which dragged connections snap to ports.
+
+        Args:
+            distance (float): Snap distance in view pixels, 0 to only connect
+                to ports directly under the mouse.
+
+        """
+
+        self._connectionSnapDistance = float(distance)
+
+    def getLevelOfDetail(self):
+        """Gets the level of detail the graph is currently rendered with.
+
+        Returns:
+            int: One of LOD_FULL, LOD_MEDIUM or LOD_FAR.
+
+        """
+
+        return self.__levelOfDetail
+
+    def getLevelOfDetailThresholds(self):
+        """Gets the view scales below which the level of detail is reduced.
+
+        Returns:
+            tuple: The medium and far thresholds.
+
+        """
+
+        return (self._lodMediumThreshold, self._lodFarThreshold)
+
+    def setLevelOfDetailThresholds(self, medium, far):
+        """Sets the view scales below which the level of detail is reduced.
+
+        Args:
+            medium (float): Scale below which port labels are hidden and
+                connections are drawn with solid pens.
+            far (float): Scale below which nodes are drawn as plain rectangles
+                and connections as straight lines.
+
+        """
+
+        if far > medium:
+            raise ValueError("The far threshold must not be larger than the medium threshold.")
+
+        self._lodMediumThreshold = medium
+        self._lodFarThreshold = far
+        self._updateLevelOfDetail()
+
+    def _updateLevelOfDetail(self):
+        scale = self.transform().m22()
+        if scale < self._lodFarThreshold:
+            lod = LOD_FAR
+        elif scale < self._lodMediumThreshold:
+            lod = LOD_MEDIUM
+        else:
+            lod = LOD_FULL
+
+        # The scale changed the visible area.
+        self.__scheduleVirtualUpdate()
+
+        if lod == self.__levelOfDetail:
+            return
+        self.__levelOfDetail = lod
+
+        for node in self.__nodes.values():
+            node.setLevelOfDetail(lod)
+        for connection in self.__connections:
+            connection.setLevelOfDetail(lod)
+
 
     ################################################
     ## Nodes
@@ -133,21 +369,56 @@ class GraphView(QtWidgets.QGraphicsView):
     def addNode(self, node, emitSignal=True):
         self.scene().addItem(node)
         self.__nodes[node.getName()] = node
+        for port in node.getPorts():
+            self.__ports.setdefault((node.getName(), port.getName()), port)
+        self.__indexNode(node)
+        self.__topologicalOrder.addVertex(node)
         node.nameChanged.connect(self._onNodeNameChanged)
+        if self.__levelOfDetail != LOD_FULL:
+            node.setLevelOfDetail(self.__levelOfDetail)
+
+        if emitSignal and self._autoPlaceNodes and self.__autoPlaceSuspended == 0:
+            pos = self.__findFreePosition(node, node.getGraphPos(), 1)
+            node._setGraphPosDeferred(pos.x(), pos.y())
+            self.__indexNode(node)
+            self.__floatingNodes.add(node)
 
         if emitSignal:
-            self.nodeAdded.emit(node)
+            if self.__isRecordingUndo():
+                self.__undoStack.push(NodesCommand(self, [node], [], True))
+            if self.__virtualGraph is not None and node.getName() not in self.__virtualGraph:
+                self.__virtualGraph.addNode(self.__describeNode(node))
+                self.__indexNode(node)
+            if self.__batchChanges is not None:
+                self.__recordBatchChange('nodesAdded', 'nodesRemoved', node)
+            else:
+                self.nodeAdded.emit(node)
 
         return node
 
     def removeNode(self, node, emitSignal=True):
 
+        if emitSignal and self.__isRecordingUndo():
+            edges = self.__describeConnections(self.__getNodeConnections([node]))
+            self.__undoStack.push(NodesCommand(self, [node], edges, False))
+
         del self.__nodes[node.getName()]
+        self.__floatingNodes.discard(node)
+        for port in node.getPorts():
+            self.__ports.pop((node.getName(), port.getName()), None)
+        self.__spatialIndex.remove(node)
+        self.__topologicalOrder.removeVertex(node)
+        self.__revision += 1
         self.scene().removeItem(node)
         node.nameChanged.disconnect(self._onNodeNameChanged)
 
         if emitSignal:
-            self.nodeRemoved.emit(node)
+            if self.__virtualGraph is not None:
+                self.__virtualGraph.removeNode(node.getName())
+            if self.__batchChanges is not None:
+                self.__recordBatchChange('nodesRemoved', 'nodesAdded', node)
+            else:
+                self.nodeRemoved.emit(node)
 
 
     def hasNode(self, name):
@@ -158,6 +429,27 @@ class GraphView(QtWidgets.QGraphicsView):
             return self.__nodes[name]
         return None
 
+    def getNodes(self):
+        return list(self.__nodes.values())
+
+    def getPort(self, nodeName, portName):
+        """Gets a port by the name of its node and its own name.
+
+        Args:
+            nodeName (str): Name of the node.
+            portName (str): Name of the port.
+
+        Returns:
+            BasePort: The port, None if there is no such port.
+
+        """
+
+        port = self.__ports.get((nodeName, portName))
+        if port is None and nodeName in self.__nodes:
+            # Collapsed nodes create their ports when they are asked for.
+            port = self.__nodes[nodeName].getPort(portName)
+        return port
+
 
     def _onNodeNameChanged(self, origName, newName ):
         if newName in self.__nodes and self.__nodes[origName] != self.__nodes[newName]:
@@ -165,10 +457,68 @@ class GraphView(QtWidgets.QGraphicsView):
         node = self.__nodes[origName]
         self.__nodes[newName] = node
         del self.__nodes[origName]
+        for port in node.getPorts():
+            registered = self.__ports.pop((origName, port.getName()), None)
+            if registered is not None:
+                self.__ports[(newName, registered.getName())] = registered
+        if self.__isRecordingUndo():
+            self.__undoStack.push(RenameNodeCommand(self, origName, newName))
+        if self.__virtualGraph is not None and origName in self.__virtualGraph:
+            self.__virtualGraph.renameNode(origName, newName)
         self.nodeNameChanged.emit( origName, newName )
 
 
-    def clearSelection(self, emitSignal=True):
+    def _onNodePortAdded(self, node, port):
+        if self.__nodes.get(node.getName()) is node:
+            self.__ports.setdefault((node.getName(), port.getName()), port)
+
+
+    def _onNodeCollapseStateChanged(self, node):
+        # The model of the graph in virtual mode keeps the state for when the
+        # node has no item.
+        name = node.getName()
+        if self.__nodes.get(name) is node and self.__virtualGraph is not None and name in self.__virtualGraph:
+            self.__virtualGraph._setCollapseState(name, node.getCollapseState())
+
+
+    def _onNodeGeometryChanged(self, node):
+        # Nodes notify the graph before they are added, so ignore unknown nodes.
+        if self.__nodes.get(node.getName()) is node:
+            self.__indexNode(node)
+
+
+    def __indexNode(self, node):
+        # Stores the bounds of a node in the spatial index, and in the model
+        # of the graph in virtual mode.
+        rect = node.sceneBoundingRect()
+        self.__spatialIndex.insert(node, rect)
+        self.__revision += 1
+        if self.__virtualGraph is not None and node.getName() in self.__virtualGraph:
+            pos = node.getGraphPos()
+            self.__virtualGraph._setNodeGeometry(node.getName(), pos.x(), pos.y(), rect.width(), rect.height())
+
+
+    def getNodesInRect(self, rect):
+        """Gets the nodes whose bounds intersect a rectangle.
+
+        Args:
+            rect (QRectF): Rectangle in scene coordinates.
+
+        Returns:
+            set: Nodes intersecting the rectangle.
+
+        """
+
+        return self.__spatialIndex.query(rect)
+
+
+    # Selection changes only go in the undo history when recordUndo is set,
+    # i.e. when the user made them, so that hosts syncing the selection from
+    # their own model do not fill it.
+    def clearSelection(self, emitSignal=True, recordUndo=False):
+        # Selection changes of a batch are reported once it ends.
+        self.__requestSelectionRecord(recordUndo)
+        emitSignal = emitSignal and self.__batchChanges is None
 
         prevSelection = []
         if emitSignal:
@@ -178,11 +528,18 @@ class GraphView(QtWidgets.QGraphicsView):
         for node in self.__selection:
             node.setSelected(False)
         self.__selection.clear()
+        if self.__virtualGraph is not None:
+            self.__virtualGraph.clearSelection()
 
         if emitSignal and len(prevSelection) != 0:
+            if recordUndo:
+                self.__recordSelectionChange(prevSelection, [])
             self.selectionChanged.emit(prevSelection, [])
 
-    def selectNode(self, node, clearSelection=False, emitSignal=True):
+    def selectNode(self, node, clearSelection=False, emitSignal=True, recordUndo=False):
+        self.__requestSelectionRecord(recordUndo)
+        emitSignal = emitSignal and self.__batchChanges is None
+
         prevSelection = []
         if emitSignal:
             for n in self.__selection:
@@ -196,6 +553,8 @@ class GraphView(QtWidgets.QGraphicsView):
 
         node.setSelected(True)
         self.__selection.add(node)
+        if self.__virtualGraph is not None:
+            self.__virtualGraph.selectNodes([node.getName()])
 
         if emitSignal:
 
@@ -203,10 +562,16 @@ class GraphView(QtWidgets.QGraphicsView):
             for n in self.__selection:
                 newSelection.append(n)
 
+            if recordUndo and clearSelection is True:
+                self.__recordSelectionChange([n for n in prevSelection if n is not node], [] if node in prevSelection else [node])
+            elif recordUndo:
+                self.__recordSelectionChange([], [node])
             self.selectionChanged.emit(prevSelection, newSelection)
 
 
-    def deselectNode(self, node, emitSignal=True):
+    def deselectNode(self, node, emitSignal=True, recordUndo=False):
+        self.__requestSelectionRecord(recordUndo)
+        emitSignal = emitSignal and self.__batchChanges is None
 
         if node not in self.__selection:
             raise IndexError("Node is not in selection!")
@@ -218,12 +583,16 @@ class GraphView(QtWidgets.QGraphicsView):
 
         node.setSelected(False)
         self.__selection.remove(node)
+        if self.__virtualGraph is not None:
+            self.__virtualGraph.deselectNodes([node.getName()])
 
         if emitSignal:
             newSelection = []
             for n in self.__selection:
                 newSelection.append(n)
 
+            if recordUndo:
+                self.__recordSelectionChange([node], [])
             self.selectionChanged.emit(prevSelection, newSelection)
 
     def getSelectedNodes(self):
@@ -233,11 +602,32 @@ class GraphView(QtWidgets.QGraphicsView):
     def deleteSelectedNodes(self):
         self.beginDeleteSelection.emit()
 
-        selectedNodes = self.getSelectedNodes()
-        names = ""
-        for node in selectedNodes:
-            node.disconnectAllPorts()
-            self.removeNode(node)
+        selectedNodes = list(self.getSelectedNodes())
+        if self.__isRecordingUndo() and len(selectedNodes) > 0:
+            # The nodes and all their connections are restored as one step.
+            edges = self.__describeConnections(self.__getNodeConnections(selectedNodes))
+        else:
+            edges = None
+
+        with self.__undoMacro('Delete Nodes'):
+            with self.__suspendUndo():
+                for node in selectedNodes:
+                    node.disconnectAllPorts()
+                    self.removeNode(node)
+
+            # Removed nodes must not linger in the selection, undo adds them back.
+            self.__selection.difference_update(selectedNodes)
+            for node in selectedNodes:
+                node.setSelected(False)
+
+            # In virtual mode, selected nodes without items go too.
+            if self.__virtualGraph is not None:
+                for name in self.__virtualGraph.getSelectedNames():
+                    self.__virtualGraph.removeNode(name)
+
+            if edges is not None:
+                self.__recordSelectionChange(selectedNodes, [])
+                self.__undoStack.push(NodesCommand(self, selectedNodes, edges, False))
 
         self.endDeleteSelection.emit()
 
@@ -246,23 +636,24 @@ class GraphView(QtWidgets.QGraphicsView):
         if len(nodes) == 0:
             return
 
-        def computeWindowFrame():
-            windowRect = self.rect()
-            windowRect.setLeft(windowRect.left() + 16)
-            windowRect.setRight(windowRect.right() - 16)
-            windowRect.setTop(windowRect.top() + 16)
-            windowRect.setBottom(windowRect.bottom() - 16)
-            return windowRect
-
         nodesRect = None
         for node in nodes:
-            nodeRectF = node.transform().mapRect(node.rect())
-            nodeRect = QtCore.QRect(nodeRectF.x(), nodeRectF.y(), nodeRectF.width(), nodeRectF.height())
+            nodeRect = node.mapRectToScene(node.rect())
             if nodesRect is None:
                 nodesRect = nodeRect
             else:
                 nodesRect = nodesRect.united(nodeRect)
 
+        self.__frameRect(nodesRect)
+
+    def __frameRect(self, nodesRect):
+        def computeWindowFrame():
+            windowRect = self.rect()
+            windowRect.setLeft(windowRect.left() + 16)
+            windowRect.setRight(windowRect.right() - 16)
+            windowRect.setTop(windowRect.top() + 16)
+            windowRect.setBottom(windowRect.bottom() - 16)
+            return windowRect
 
         windowRect = computeWindowFrame()
 
@@ -282,15 +673,22 @@ class GraphView(QtWidgets.QGraphicsView):
         pan = sceneRect.center() - nodesRect.center()
         sceneRect.translate(-pan.x(), -pan.y())
         self.setSceneRect(sceneRect)
+        self._updateLevelOfDetail()
 
         # Update the main panel when reframing.
         self.update()
 
 
     def frameSelectedNodes(self):
+        if self.__virtualGraph is not None:
+            self.__frameVirtualNodes(self.__virtualGraph.getSelectedNames())
+            return
         self.frameNodes(self.getSelectedNodes())
 
     def frameAllNodes(self):
+        if self.__virtualGraph is not None:
+            self.__frameVirtualNodes(self.__virtualGraph.getNodeNames())
+            return
         allnodes = []
         for name, node in iteritems(self.__nodes):
             allnodes.append(node)
@@ -323,197 +721,1927 @@ class GraphView(QtWidgets.QGraphicsView):
         return pos
 
 
+    def __getMoveConnections(self, nodes):
+        # Splits the connections of the moving nodes into the ones with both ends
+        # moving, which only need a translation, and the ones with one fixed end.
+        connections = set()
+        for node in nodes:
+            for port in node.getPorts():
+                if port.inCircle():
+                    connections.update(port.inCircle().getConnections())
+                if port.outCircle():
+                    connections.update(port.outCircle().getConnections())
+
+        internalConnections = []
+        boundaryConnections = []
+        for connection in connections:
+            srcPort = connection.getSrcPort()
+            dstPort = connection.getDstPort()
+            if srcPort is not None and dstPort is not None and srcPort.getNode() in nodes and dstPort.getNode() in nodes:
+                internalConnections.append(connection)
+            else:
+                boundaryConnections.append(connection)
+
+        return (internalConnections, boundaryConnections)
+
+    def moveNodes(self, nodes, delta):
+        """Moves nodes and updates their connections in a single pass.
+
+        Every affected connection is visited once. Connections between two of the
+        moved nodes are translated along with them instead of being rebuilt.
+
+        Args:
+            nodes (set): Nodes to move.
+            delta (QPointF): Offset to apply.
+
+        """
+
+        (internalConnections, boundaryConnections) = self.__getMoveConnections(nodes)
+        self.__translateNodes(nodes, delta, internalConnections, boundaryConnections)
+        self.__floatingNodes.difference_update(nodes)
+        if self.__batchChanges is not None:
+            self.__recordBatchMove(nodes, delta)
+
+    def __translateNodes(self, nodes, delta, internalConnections, boundaryConnections):
+        dx = delta.x()
+        dy = delta.y()
+        if self.__dragConnections is not None:
+            # During a drag the nodes are indexed once, when it ends.
+            for node in nodes:
+                node._moveByDeferred(dx, dy)
+        else:
+            indexNode = self.__indexNode
+            for node in nodes:
+                node._moveByDeferred(dx, dy)
+                indexNode(node)
+
+        for connection in internalConnections:
+            connection.moveBy(dx, dy)
+        for connection in boundaryConnections:
+            connection.updatePath()
+
+    # Before moving the nodes interactively, the affected connections are gathered once for the whole drag.
+    def beginMoveSelectedNodes(self):
+        self.__dragConnections = self.__getMoveConnections(self.__selection)
+        self.__dragDelta = QtCore.QPointF()
+
     def moveSelectedNodes(self, delta, emitSignal=True):
-        for node in self.__selection:
-            node.translate(delta.x(), delta.y())
+        if self.__dragConnections is not None:
+            (internalConnections, boundaryConnections) = self.__dragConnections
+        else:
+            (internalConnections, boundaryConnections) = self.__getMoveConnections(self.__selection)
+        self.__translateNodes(self.__selection, delta, internalConnections, boundaryConnections)
+        if self.__dragDelta is not None:
+            self.__dragDelta += delta
 
         if emitSignal:
-            self.selectionMoved.emit(self.__selection, delta)
+            if self.__batchChanges is not None:
+                self.__recordBatchMove(self.__selection, delta)
+            else:
+                self.selectionMoved.emit(self.__selection, delta)
+
+    def __recordBatchMove(self, nodes, delta):
+        nodesMoved = self.__batchChanges['nodesMoved']
+        if len(nodesMoved) > 0 and nodesMoved[-1][0] == nodes:
+            nodesMoved[-1] = (nodesMoved[-1][0], nodesMoved[-1][1] + delta)
+        else:
+            nodesMoved.append((frozenset(nodes), QtCore.QPointF(delta)))
 
     # After moving the nodes interactively, this signal is emitted with the final delta.
     def endMoveSelectedNodes(self, delta):
+        # The whole drag is a single undo step, using the offset actually applied.
+        if self.__dragDelta is not None:
+            movedDelta = self.__dragDelta
+        else:
+            movedDelta = delta
+        if self.__isRecordingUndo() and not movedDelta.isNull():
+            self.__undoStack.push(MoveNodesCommand(self, [node.getName() for node in self.__selection], movedDelta))
+
+        if self.__dragConnections is not None:
+            for node in self.__selection:
+                self.__indexNode(node)
+        self.__dragConnections = None
+        self.__dragDelta = None
+        self.__floatingNodes.difference_update(self.__selection)
         self.endSelectionMoved.emit(self.__selection, delta)
 
-    ################################################
-    ## Connections
+    def setNodePositions(self, nodes, positions):
+        """Places nodes at new positions in a single pass.
 
-    def emitBeginConnectionManipulationSignal(self):
-        self.beginConnectionManipulation.emit()
+        The connections of the nodes are rebuilt once all nodes are in place,
+        each of them once, and the whole change is a single undo step.
 
+        Args:
+            nodes (list): Nodes to place.
+            positions (list): (x, y) graph position of every node.
 
-    def emitEndConnectionManipulationSignal(self):
-        self.endConnectionManipulation.emit()
+        """
 
+        nodes = list(nodes)
+        if len(nodes) != len(positions):
+            raise Exception("Got " + str(len(positions)) + " positions for " + str(len(nodes)) + " nodes.")
 
-    def addConnection(self, connection, emitSignal=True):
+        if self.__isRecordingUndo():
+            oldPositions = [(pos.x(), pos.y()) for pos in (node.getGraphPos() for node in nodes)]
+            self.__undoStack.push(SetNodePositionsCommand(self, [node.getName() for node in nodes], oldPositions, positions))
 
-        self.__connections.add(connection)
-        self.scene().addItem(connection)
-        if emitSignal:
-            self.connectionAdded.emit(connection)
-        return connection
+        indexNode = self.__indexNode
+        for (node, (x, y)) in zip(nodes, positions):
+            node._setGraphPosDeferred(x, y)
+            indexNode(node)
+        for connection in self.__getNodeConnections(nodes):
+            connection.updatePath()
+        self.__floatingNodes.difference_update(nodes)
 
-    def removeConnection(self, connection, emitSignal=True):
+        if self.__batchChanges is not None:
+            self.__batchChanges['nodesPositioned'].update(nodes)
+        else:
+            self.nodesPositioned.emit(nodes)
 
-        connection.disconnect()
-        self.__connections.remove(connection)
-        self.scene().removeItem(connection)
-        if emitSignal:
-            self.connectionRemoved.emit(connection)
+    ################################################
+    ## Layout
 
+    def _getEdgeIndices(self, nodes):
+        """Gets the connections between nodes as pairs of indices.
 
-    def connectPorts(self, srcNode, outputName, tgtNode, inputName):
+        Args:
+            nodes (list): Nodes to index.
 
-        if isinstance(srcNode, Node):
-            sourceNode = srcNode
-        elif isinstance(srcNode, basestring):
-            sourceNode = self.getNode(srcNode)
-            if not sourceNode:
-                raise Exception("Node not found:" + str(srcNode))
-        else:
-            raise Exception("Invalid srcNode:" + str(srcNode))
+        Returns:
+            tuple: Lists of the indices of the source and target node of every
+                connection between two of the nodes.
 
+        """
 
-        sourcePort = sourceNode.getPort(outputName)
-        if not sourcePort:
-            raise Exception("Node '" + sourceNode.getName() + "' does not have output:" + outputName)
+        indices = dict((node, index) for (index, node) in enumerate(nodes))
+        src = []
+        dst = []
+        for (srcNode, dstNode) in self.__connectionEdges.values():
+            srcIndex = indices.get(srcNode)
+            dstIndex = indices.get(dstNode)
+            if srcIndex is not None and dstIndex is not None:
+                src.append(srcIndex)
+                dst.append(dstIndex)
+        return (src, dst)
 
+    def layoutNodes(self, nodes=None, **options):
+        """Arranges nodes in layers following the direction of the connections.
 
-        if isinstance(tgtNode, Node):
-            targetNode = tgtNode
-        elif isinstance(tgtNode, basestring):
-            targetNode = self.getNode(tgtNode)
-            if not targetNode:
-                raise Exception("Node not found:" + str(tgtNode))
-        else:
-            raise Exception("Invalid tgtNode:" + str(tgtNode))
+        Requires numpy, see LayeredLayout for the details and the options.
 
-        targetPort = targetNode.getPort(inputName)
-        if not targetPort:
-            raise Exception("Node '" + targetNode.getName() + "' does not have input:" + inputName)
+        Args:
+            nodes (list): Nodes to arrange, defaults to all the nodes.
+            **options: Keyword arguments of LayeredLayout.
 
-        connection = Connection(self, sourcePort.outCircle(), targetPort.inCircle())
-        self.addConnection(connection, emitSignal=False)
+        Returns:
+            list: The nodes that were arranged.
 
-        return connection
+        """
 
-    ################################################
-    ## Events
+        from .layered_layout import LayeredLayout
 
-    def mousePressEvent(self, event):
+        with self.batch():
+            return LayeredLayout(**options).layoutGraph(self, nodes)
 
-        if event.button() == QtCore.Qt.LeftButton and self.itemAt(event.pos()) is None:
-            self.beginNodeSelection.emit()
-            self._manipulationMode = MANIP_MODE_SELECT
-            self._mouseDownSelection = copy.copy(self.getSelectedNodes())
-            self.clearSelection(emitSignal=False)
-            self._selectionRect = SelectionRect(graph=self, mouseDownPos=self.mapToScene(event.pos()))
+    def startForceLayout(self, nodes=None, pinSelected=True, **options):
+        """Starts arranging nodes with a force-directed layout in a worker thread.
 
-        elif event.button() == QtCore.Qt.MidButton or event.button() == QtCore.Qt.MiddleButton:
-            self.setCursor(QtCore.Qt.OpenHandCursor)
-            self._manipulationMode = MANIP_MODE_PAN
-            self._lastPanPoint = self.mapToScene(event.pos())
+        The view keeps responding while the layout runs. Intermediate positions
+        are applied as they come, at the frame rate of the layout, and the
+        whole run is a single undo step. Requires numpy.
 
-        elif event.button() == QtCore.Qt.RightButton:
-            self.setCursor(QtCore.Qt.SizeHorCursor)
-            self._manipulationMode = MANIP_MODE_ZOOM
-            self._lastMousePos = event.pos()
-            self._lastTransform = QtGui.QTransform(self.transform())
-            self._lastSceneRect = self.sceneRect()
-            self._lastSceneCenter = self._lastSceneRect.center()
-            self._lastScenePos = self.mapToScene(event.pos())
-            self._lastOffsetFromSceneCenter = self._lastScenePos - self._lastSceneCenter
+        Args:
+            nodes (list): Nodes to arrange, defaults to all the nodes.
+            pinSelected (bool): Keeps the selected nodes where they are.
+            **options: Keyword arguments of ForceLayout.
 
-        else:
-            super(GraphView, self).mousePressEvent(event)
+        """
 
-    def mouseMoveEvent(self, event):
-        modifiers = QtWidgets.QApplication.keyboardModifiers()
+        from .force_layout import ForceLayout
 
-        if self._manipulationMode == MANIP_MODE_SELECT:
-            dragPoint = self.mapToScene(event.pos())
-            self._selectionRect.setDragPoint(dragPoint)
+        self.stopForceLayout(wait=True)
+        if nodes is None:
+            nodes = self.getNodes()
+        nodes = list(nodes)
+        if len(nodes) == 0:
+            return
 
-            # This logic allows users to use ctrl and shift with rectangle
-            # select to add / remove nodes.
-            if modifiers == QtCore.Qt.ControlModifier:
-                for name, node in iteritems(self.__nodes):
+        positions = [(pos.x(), pos.y()) for pos in (node.getGraphPos() for node in nodes)]
+        sizes = [(size.width(), size.height()) for size in (node.size() for node in nodes)]
+        pinned = [pinSelected and node in self.__selection for node in nodes]
+        (src, dst) = self._getEdgeIndices(nodes)
 
-                    if node in self._mouseDownSelection:
-                        if node.isSelected() and self._selectionRect.collidesWithItem(node):
-                            self.deselectNode(node, emitSignal=False)
-                        elif not node.isSelected() and not self._selectionRect.collidesWithItem(node):
-                            self.selectNode(node, emitSignal=False)
-                    else:
-                        if not node.isSelected() and self._selectionRect.collidesWithItem(node):
-                            self.selectNode(node, emitSignal=False)
-                        elif node.isSelected() and not self._selectionRect.collidesWithItem(node):
-                            if node not in self._mouseDownSelection:
-                                self.deselectNode(node, emitSignal=False)
+        forceLayout = ForceLayout(positions, sizes, src, dst, pinned=pinned, **options)
+        forceLayout.positionsComputed.connect(self.__onForceLayoutPositions)
+        forceLayout.finished.connect(self.__onForceLayoutFinished)
+        self.__forceLayout = forceLayout
+        self.__forceLayoutNodes = nodes
+        self.__forceLayoutStart = positions
+        self.__forceLayoutPending = None
+        self.__forceLayoutNextFrame = 0.0
+        forceLayout.start()
 
-            elif modifiers == QtCore.Qt.ShiftModifier:
-                for name, node in iteritems(self.__nodes):
-                    if not node.isSelected() and self._selectionRect.collidesWithItem(node):
-                        self.selectNode(node, emitSignal=False)
-                    elif node.isSelected() and not self._selectionRect.collidesWithItem(node):
-                        if node not in self._mouseDownSelection:
-                            self.deselectNode(node, emitSignal=False)
+    def stopForceLayout(self, wait=False):
+        """Stops the running force-directed layout, keeping the current positions.
 
-            else:
-                self.clearSelection(emitSignal=False)
+        Args:
+            wait (bool): Blocks until the worker thread is done.
 
-                for name, node in iteritems(self.__nodes):
-                    if not node.isSelected() and self._selectionRect.collidesWithItem(node):
-                        self.selectNode(node, emitSignal=False)
-                    elif node.isSelected() and not self._selectionRect.collidesWithItem(node):
-                        self.deselectNode(node, emitSignal=False)
+        """
 
-        elif self._manipulationMode == MANIP_MODE_PAN:
-            delta = self.mapToScene(event.pos()) - self._lastPanPoint
+        forceLayout = self.__forceLayout
+        if forceLayout is None:
+            return
+        forceLayout.cancel()
+        if wait:
+            forceLayout.wait()
+            self.__onForceLayoutFinished()
 
-            rect = self.sceneRect()
-            rect.translate(-delta.x(), -delta.y())
-            self.setSceneRect(rect)
+    def isForceLayoutRunning(self):
+        return self.__forceLayout is not None
 
-            self._lastPanPoint = self.mapToScene(event.pos())
+    def __onForceLayoutPositions(self, positions):
+        # Frames that arrive before the previous one was applied replace it.
+        if self.__forceLayout is None:
+            return
+        # The view gets at least as much time for itself as the last frame took
+        # to apply, so that a large graph cannot keep it busy.
+        if self.__forceLayoutPending is None:
+            delay = max(self.__forceLayoutNextFrame - time.time(), 0.0)
+            QtCore.QTimer.singleShot(int(delay * 1000), self.__applyForceLayoutPositions)
+        self.__forceLayoutPending = positions
+
+    def __applyForceLayoutPositions(self):
+        positions = self.__forceLayoutPending
+        self.__forceLayoutPending = None
+        if positions is None or self.__forceLayout is None:
+            return
 
-        elif self._manipulationMode == MANIP_MODE_MOVE:
+        # Nodes deleted while the layout runs are left out.
+        nodes = []
+        nodePositions = []
+        for (node, pos) in zip(self.__forceLayoutNodes, positions.tolist()):
+            if self.__nodes.get(node.getName()) is node:
+                nodes.append(node)
+                nodePositions.append(pos)
+        start = time.time()
+        self.__forceLayout.pause()
+        try:
+            with self.__suspendUndo():
+                self.setNodePositions(nodes, nodePositions)
+        finally:
+            self.__forceLayout.resume()
+        now = time.time()
+        self.__forceLayoutNextFrame = now + (now - start)
+
+    def __onForceLayoutFinished(self):
+        forceLayout = self.__forceLayout
+        if forceLayout is None or forceLayout.isRunning():
+            return
+        self.__applyForceLayoutPositions()
+        self.__forceLayout = None
+
+        names = []
+        oldPositions = []
+        newPositions = []
+        for (node, pos) in zip(self.__forceLayoutNodes, self.__forceLayoutStart):
+            if self.__nodes.get(node.getName()) is node:
+                names.append(node.getName())
+                oldPositions.append(pos)
+                newPos = node.getGraphPos()
+                newPositions.append((newPos.x(), newPos.y()))
+        self.__forceLayoutNodes = None
+        self.__forceLayoutStart = None
+        if self.__isRecordingUndo() and oldPositions != newPositions:
+            self.__undoStack.push(SetNodePositionsCommand(self, names, oldPositions, newPositions))
+        self.forceLayoutFinished.emit()
 
-            newPos = self.mapToScene(event.pos())
-            delta = newPos - self._lastDragPoint
-            self._lastDragPoint = newPos
+    ################################################
+    ## Placement
+
+    def __findFreePosition(self, node, pos, direction):
+        # Looks for the free spot closest to pos in the column of pos, jumping
+        # over the nodes in the way up and down alternately. Full columns are
+        # skipped in the given horizontal direction. Every probe is a query of
+        # the spatial index around the spot, so the cost does not depend on the
+        # size of the graph.
+        size = node.size()
+        (width, height) = (size.width(), size.height())
+        spacing = self._autoPlaceSpacing
+        spatialIndex = self.__spatialIndex
+
+        def getObstacles(x, y):
+            rect = QtCore.QRectF(x - width * 0.5 - spacing, y - height * 0.5 - spacing, width + 2 * spacing, height + 2 * spacing)
+            obstacles = spatialIndex.query(rect)
+            obstacles.discard(node)
+            return [spatialIndex.getRect(obstacle) for obstacle in obstacles]
+
+        x = pos.x()
+        probes = 0
+        while True:
+            (down, up) = (pos.y(), pos.y())
+            while probes < AUTO_PLACE_MAX_PROBES:
+                # Probe on the side closest to the preferred height first.
+                goDown = down - pos.y() <= pos.y() - up
+                y = down if goDown else up
+                obstacles = getObstacles(x, y)
+                probes += 1
+                if len(obstacles) == 0:
+                    return QtCore.QPointF(x, y)
+                if goDown:
+                    down = max(rect.bottom() for rect in obstacles) + spacing + height * 0.5
+                else:
+                    up = min(rect.top() for rect in obstacles) - spacing - height * 0.5
+                if probes % AUTO_PLACE_COLUMN_PROBES == 0:
+                    break
+            if probes >= AUTO_PLACE_MAX_PROBES:
+                return QtCore.QPointF(x, pos.y())
+            x += direction * (width + spacing)
+
+    def __placeNode(self, node, pos, direction):
+        pos = self.__findFreePosition(node, pos, direction)
+        if pos != node.getGraphPos():
+            self.setNodePositions([node], [(pos.x(), pos.y())])
+
+    def __placeConnectedNodes(self, srcNode, dstNode):
+        # The first connection of a floating node decides where it goes: to the
+        # right of its upstream node, or to the left of its downstream node.
+        floatingNodes = self.__floatingNodes
+        if dstNode in floatingNodes:
+            srcRect = srcNode.sceneBoundingRect()
+            x = srcRect.right() + self._autoPlaceSpacing * 2 + dstNode.size().width() * 0.5
+            self.__placeNode(dstNode, QtCore.QPointF(x, srcRect.center().y()), 1)
+        elif srcNode in floatingNodes:
+            dstRect = dstNode.sceneBoundingRect()
+            x = dstRect.left() - self._autoPlaceSpacing * 2 - srcNode.size().width() * 0.5
+            self.__placeNode(srcNode, QtCore.QPointF(x, dstRect.center().y()), -1)
+        floatingNodes.discard(srcNode)
+        floatingNodes.discard(dstNode)
 
-            selectedNodes = self.getSelectedNodes()
+    ################################################
+    ## Virtualization
 
-            # Apply the delta to each selected node
-            for node in selectedNodes:
-                node.translate(delta.x(), delta.y())
+    def getVirtualGraph(self):
+        return self.__virtualGraph
 
-        elif self._manipulationMode == MANIP_MODE_ZOOM:
+    def setVirtualGraph(self, virtualGraph):
+        """Shows a VirtualGraph, creating items only around the view.
 
-           # How much
-            delta = event.pos() - self._lastMousePos
-            zoomFactor = 1.0
-            if delta.x() > 0:
-                zoomFactor = 1.0 + delta.x() / 100.0
-            else:
-                zoomFactor = 1.0 / (1.0 + abs(delta.x()) / 100.0)
+        The graph is reset. From then on, only the nodes around the visible
+        area and their direct neighbors have Node items, up to
+        _virtualItemLimit of them, along with the connections between them.
+        Items are created, recycled and removed as the view pans and zooms,
+        without nodeAdded or nodeRemoved signals. Changes made through the
+        graph are written back to the model, and changes made to the model
+        show up in the view. Nodes without items are reached through the
+        model, by name.
 
-            # Limit zoom to 3x
-            if self._lastTransform.m22() * zoomFactor >= 2.0:
-                return
+        The undo history is not recorded in virtual mode.
 
-            # Reset to when we mouse pressed
-            self.setSceneRect(self._lastSceneRect)
-            self.setTransform(self._lastTransform)
+        Args:
+            virtualGraph (VirtualGraph): The model to show, None to go back to
+                a regular graph.
 
-            # Center scene around mouse down
-            rect = self.sceneRect()
-            rect.translate(self._lastOffsetFromSceneCenter)
-            self.setSceneRect(rect)
+        """
 
-            # Zoom in (QGraphicsView auto-centers!)
-            self.scale(zoomFactor, zoomFactor)
+        self.reset()
+        if virtualGraph is None:
+            return
+
+        self.__virtualGraph = virtualGraph
+        self.__undoSuspended += 1
+        virtualGraph.nodeAdded.connect(self.__onVirtualNodeAdded)
+        virtualGraph.nodeRemoved.connect(self.__onVirtualNodeRemoved)
+        virtualGraph.nodeMoved.connect(self.__onVirtualNodeMoved)
+        virtualGraph.nodeRenamed.connect(self.__onVirtualNodeRenamed)
+        virtualGraph.connectionAdded.connect(self.__onVirtualConnectionAdded)
+        virtualGraph.connectionRemoved.connect(self.__onVirtualConnectionRemoved)
+        virtualGraph.selectionChanged.connect(self.__onVirtualSelectionChanged)
+        self.__scheduleVirtualUpdate()
+
+    def __detachVirtualGraph(self):
+        virtualGraph = self.__virtualGraph
+        if virtualGraph is None:
+            return
+
+        virtualGraph.nodeAdded.disconnect(self.__onVirtualNodeAdded)
+        virtualGraph.nodeRemoved.disconnect(self.__onVirtualNodeRemoved)
+        virtualGraph.nodeMoved.disconnect(self.__onVirtualNodeMoved)
+        virtualGraph.nodeRenamed.disconnect(self.__onVirtualNodeRenamed)
+        virtualGraph.connectionAdded.disconnect(self.__onVirtualConnectionAdded)
+        virtualGraph.connectionRemoved.disconnect(self.__onVirtualConnectionRemoved)
+        virtualGraph.selectionChanged.disconnect(self.__onVirtualSelectionChanged)
+        self.__virtualGraph = None
+
+    def setSceneRect(self, *args):
+        super(GraphView, self).setSceneRect(*args)
+        self.__scheduleVirtualUpdate()
+
+    def resizeEvent(self, event):
+        super(GraphView, self).resizeEvent(event)
+        self.__scheduleVirtualUpdate()
+
+    def __scheduleVirtualUpdate(self):
+        # Pans and zooms come in bursts, the items are updated once they are
+        # all handled.
+        if self.__virtualGraph is None or self.__virtualUpdatePending:
+            return
+        self.__virtualUpdatePending = True
+        QtCore.QTimer.singleShot(0, self.__updateVirtualItems)
+
+    def __getVirtualNames(self):
+        # Names of the nodes that should have an item, the visible ones first.
+        # The ones nearest to the center of the view are kept when there are
+        # too many of them.
+        virtualGraph = self.__virtualGraph
+        rect = self.mapToScene(self.viewport().rect()).boundingRect()
+        marginX = rect.width() * self._virtualMargin
+        marginY = rect.height() * self._virtualMargin
+        rect.adjust(-marginX, -marginY, marginX, marginY)
+
+        limit = self._virtualItemLimit
+        names = virtualGraph.getNamesInRect(rect, limit)
+        if len(names) >= limit:
+            return names
+
+        # Direct neighbors have items too, so that the connections leaving the
+        # view are drawn.
+        result = list(names)
+        nameSet = set(names)
+        for name in names:
+            for edge in virtualGraph.getEdges(name):
+                for neighbor in (edge[0], edge[2]):
+                    if len(result) >= limit:
+                        return result
+                    if neighbor not in nameSet:
+                        nameSet.add(neighbor)
+                        result.append(neighbor)
+        return result
+
+    def __updateVirtualItems(self):
+        self.__virtualUpdatePending = False
+        virtualGraph = self.__virtualGraph
+        if virtualGraph is None:
+            return
+
+        names = self.__getVirtualNames()
+        addedNames = [name for name in names if name not in self.__nodes]
+        if len(addedNames) > self._virtualBatchSize:
+            addedNames = addedNames[:self._virtualBatchSize]
+            self.__scheduleVirtualUpdate()
+        names = set(names)
+
+        # Nodes being dragged or connected keep their items until the
+        # interaction is over.
+        if self._manipulationMode == MANIP_MODE_MOVE or self.__dragConnections is not None or self.scene().mouseGrabberItem() is not None:
+            removedNodes = []
+        else:
+            removedNodes = [node for (name, node) in iteritems(self.__nodes) if name not in names]
+
+        if len(addedNames) == 0 and len(removedNodes) == 0:
+            return
+
+        scene = self.scene()
+        indexMethod = scene.itemIndexMethod()
+        scene.setItemIndexMethod(QtWidgets.QGraphicsScene.NoIndex)
+        try:
+            for node in removedNodes:
+                self.__dematerializeNode(node)
+            for name in addedNames:
+                self.__materializeNode(name)
+            for name in addedNames:
+                for edge in virtualGraph.getEdges(name):
+                    self.__materializeConnection(edge)
+        finally:
+            scene.setItemIndexMethod(indexMethod)
+
+    def __materializeNode(self, name):
+        virtualGraph = self.__virtualGraph
+        pool = self.__virtualPool.get(virtualGraph._getItemKey(name))
+        if pool:
+            node = pool.pop()
+            node.setName(name)
+            node.setCollapseState(virtualGraph.getCollapseState(name))
+            pos = virtualGraph.getNodePos(name)
+            node._setGraphPosDeferred(pos.x(), pos.y())
+            node.setLevelOfDetail(self.__levelOfDetail)
+        else:
+            node = self.__createNode(virtualGraph.getNodeDesc(name), virtualGraph.getNodeClass())
+
+        self.addNode(node, emitSignal=False)
+        if virtualGraph.isSelected(name):
+            node.setSelected(True)
+            self.__selection.add(node)
+
+    def __dematerializeNode(self, node):
+        for connection in self.__getNodeConnections([node]):
+            self.removeConnection(connection, emitSignal=False)
+        if node in self.__selection:
+            node.setSelected(False)
+            self.__selection.remove(node)
+        self.removeNode(node, emitSignal=False)
+
+        # Keep the item for a node that looks the same.
+        virtualGraph = self.__virtualGraph
+        name = node.getName()
+        if name not in virtualGraph or type(node) is not virtualGraph.getNodeClass():
+            return
+        if sum(len(pool) for pool in self.__virtualPool.values()) < self._virtualPoolSize:
+            self.__virtualPool.setdefault(virtualGraph._getItemKey(name), []).append(node)
+
+    def __materializeConnection(self, edge):
+        # Connections have items when both their nodes have one.
+        if edge[0] not in self.__nodes or edge[2] not in self.__nodes or self._findConnection(edge) is not None:
+            return
+        srcPort = self.getPort(edge[0], edge[1])
+        dstPort = self.getPort(edge[2], edge[3])
+        self.addConnection(Connection(self, srcPort.outCircle(), dstPort.inCircle()), emitSignal=False)
+
+    def __frameVirtualNodes(self, names):
+        rect = self.__virtualGraph.getBoundingRect(names)
+        if not rect.isNull():
+            self.__frameRect(rect)
+
+    def __onVirtualNodeAdded(self, name):
+        self.__scheduleVirtualUpdate()
+
+    def __onVirtualNodeRemoved(self, name):
+        node = self.__nodes.get(name)
+        if node is not None:
+            self.__dematerializeNode(node)
+
+    def __onVirtualNodeMoved(self, name):
+        node = self.__nodes.get(name)
+        if node is not None:
+            pos = self.__virtualGraph.getNodePos(name)
+            self.setNodePositions([node], [(pos.x(), pos.y())])
+        self.__scheduleVirtualUpdate()
+
+    def __onVirtualNodeRenamed(self, name, newName):
+        node = self.__nodes.get(name)
+        if node is not None:
+            node.setName(newName)
+
+    def __onVirtualConnectionAdded(self, edge):
+        self.__materializeConnection(edge)
+
+    def __onVirtualConnectionRemoved(self, edge):
+        connection = self._findConnection(edge)
+        if connection is not None:
+            self.removeConnection(connection, emitSignal=False)
+
+    def __onVirtualSelectionChanged(self, removedNames, addedNames):
+        for name in removedNames:
+            node = self.__nodes.get(name)
+            if node is not None and node in self.__selection:
+                self.deselectNode(node)
+        for name in addedNames:
+            node = self.__nodes.get(name)
+            if node is not None and node not in self.__selection:
+                self.selectNode(node)
+
+    ################################################
+    ## Connections
+
+    def emitBeginConnectionManipulationSignal(self):
+        self.beginConnectionManipulation.emit()
+
+
+    def emitEndConnectionManipulationSignal(self):
+        self.endConnectionManipulation.emit()
+
+
+    def wouldCreateCycle(self, srcNode, dstNode):
+        """Checks whether connecting two nodes would create a cycle.
+
+        Only the nodes lying between the two in the current topological order
+        are visited.
+
+        Args:
+            srcNode (Node): Node the connection would start from.
+            dstNode (Node): Node the connection would end at.
+
+        Returns:
+            bool: True if dstNode already feeds into srcNode, or both are the
+                same node.
+
+        """
+
+        return self.__topologicalOrder.wouldCreateCycle(srcNode, dstNode)
+
+
+    def getUpstreamNodes(self, node):
+        """Gets the nodes feeding into a node, directly or not.
+
+        Args:
+            node (Node): The node.
+
+        Returns:
+            set: The upstream nodes, and node itself.
+
+        """
+
+        return self.__topologicalOrder.getAncestors(node)
+
+
+    def getDownstreamNodes(self, node):
+        """Gets the nodes a node feeds into, directly or not.
+
+        Args:
+            node (Node): The node.
+
+        Returns:
+            set: The downstream nodes, and node itself.
+
+        """
+
+        return self.__topologicalOrder.getDescendants(node)
+
+
+    def getTopologicalOrder(self):
+        """Gets the nodes of the graph sorted so that every connection goes
+        from an earlier to a later node.
+
+        Returns:
+            list: The nodes in topological order.
+
+        """
+
+        return [node for node in self.__topologicalOrder.getOrder() if self.__nodes.get(node.getName()) is node]
+
+
+    def _registerConnection(self, connection):
+        srcPort = connection.getSrcPort()
+        dstPort = connection.getDstPort()
+
+        # Connections previewed by a MouseGrabber have no port on one end.
+        if srcPort is None or dstPort is None:
+            return
+        if connection in self.__connectionEdges:
+            return
+
+        srcNode = srcPort.getNode()
+        dstNode = dstPort.getNode()
+        if not self.__topologicalOrder.addEdge(srcNode, dstNode):
+            raise Exception("Connecting '" + srcNode.getName() + "' to '" + dstNode.getName() + "' would create a cycle.")
+        self.__connectionEdges[connection] = (srcNode, dstNode)
+        self.__nodeConnections.setdefault(srcNode, set()).add(connection)
+        self.__nodeConnections.setdefault(dstNode, set()).add(connection)
+        self.__revision += 1
+
+
+    def _unregisterConnection(self, connection):
+        edge = self.__connectionEdges.pop(connection, None)
+        if edge is not None:
+            self.__topologicalOrder.removeEdge(*edge)
+            for node in edge:
+                connections = self.__nodeConnections.get(node)
+                if connections is not None:
+                    connections.discard(connection)
+                    if len(connections) == 0:
+                        del self.__nodeConnections[node]
+            self.__revision += 1
+
+
+    def addConnection(self, connection, emitSignal=True):
+
+        self.__connections.add(connection)
+        self.scene().addItem(connection)
+        if self.__levelOfDetail != LOD_FULL:
+            connection.setLevelOfDetail(self.__levelOfDetail)
+        if emitSignal:
+            if connection in self.__connectionEdges and self.__isRecordingUndo():
+                self.__undoStack.push(ConnectionCommand(self, self.__describeConnection(connection), True))
+            if connection in self.__connectionEdges and self.__virtualGraph is not None:
+                self.__virtualGraph.connect([self.__describeConnection(connection)])
+            if self.__batchChanges is not None:
+                self.__recordBatchChange('connectionsAdded', 'connectionsRemoved', connection)
+            else:
+                self.connectionAdded.emit(connection)
+        return connection
+
+    def removeConnection(self, connection, emitSignal=True):
+
+        edge = None
+        if emitSignal and connection in self.__connectionEdges:
+            edge = self.__describeConnection(connection)
+            if self.__isRecordingUndo():
+                self.__undoStack.push(ConnectionCommand(self, edge, False))
+
+        connection.disconnect()
+        self.__connections.remove(connection)
+        self.scene().removeItem(connection)
+        if emitSignal:
+            if edge is not None and self.__virtualGraph is not None:
+                self.__virtualGraph.disconnect(edge)
+            if self.__batchChanges is not None:
+                self.__recordBatchChange('connectionsRemoved', 'connectionsAdded', connection)
+            else:
+                self.connectionRemoved.emit(connection)
+
+
+    def __resolvePort(self, node, portName, argName, portRole):
+        if isinstance(node, Node):
+            port = node.getPort(portName)
+            nodeName = node.getName()
+        elif isinstance(node, basestring):
+            port = self.getPort(node, portName)
+            if port is None and node not in self.__nodes:
+                raise Exception("Node not found:" + str(node))
+            nodeName = node
+        else:
+            raise Exception("Invalid " + argName + ":" + str(node))
+
+        if not port:
+            raise Exception("Node '" + nodeName + "' does not have " + portRole + ":" + portName)
+        return port
+
+    def connectPorts(self, srcNode, outputName, tgtNode, inputName):
+
+        sourcePort = self.__resolvePort(srcNode, outputName, 'srcNode', 'output')
+        targetPort = self.__resolvePort(tgtNode, inputName, 'tgtNode', 'input')
+
+        # Rejected before anything is recorded, so that no empty step is left in the undo history.
+        sourceNode = sourcePort.getNode()
+        targetNode = targetPort.getNode()
+        if self.wouldCreateCycle(sourceNode, targetNode):
+            raise Exception("Connecting '" + sourceNode.getName() + "' to '" + targetNode.getName() + "' would create a cycle.")
+
+        with self.__undoMacro('Connect Ports'):
+            connection = Connection(self, sourcePort.outCircle(), targetPort.inCircle())
+            self.addConnection(connection, emitSignal=False)
+            if self.__isRecordingUndo():
+                self.__undoStack.push(ConnectionCommand(self, self.__describeConnection(connection), True))
+            if self.__virtualGraph is not None:
+                self.__virtualGraph.connect([self.__describeConnection(connection)])
+            if self.__floatingNodes:
+                self.__placeConnectedNodes(sourceNode, targetNode)
+
+        return connection
+
+    def _updateRubberBandSelection(self, modifiers):
+        """Updates the selection from the current selection rectangle.
+
+        Only the nodes that entered or left the rectangle since the previous
+        update are visited, using the spatial index of node bounds.
+
+        Args:
+            modifiers (Qt.KeyboardModifiers): Ctrl toggles and Shift adds to
+                the selection held when the rectangle was started.
+
+        """
+
+        sceneRect = self._selectionRect.sceneBoundingRect()
+        candidates = self.__spatialIndex.queryChanged(self._lastSelectionSceneRect, sceneRect)
+        self._lastSelectionSceneRect = sceneRect
+
+        hits = self._selectionRectHits
+        changedNodes = []
+        for node in candidates:
+            inRect = self.__spatialIndex.getRect(node).intersects(sceneRect)
+            if inRect != (node in hits):
+                if inRect:
+                    hits.add(node)
+                else:
+                    hits.remove(node)
+                changedNodes.append(node)
+
+        # When the modifiers change, every node that is or was affected by the
+        # rubber band has to be evaluated again.
+        if modifiers != self._selectionModifiers:
+            self._selectionModifiers = modifiers
+            changedNodes = hits.union(self._mouseDownSelection, changedNodes)
+
+        # This logic allows users to use ctrl and shift with rectangle
+        # select to add / remove nodes.
+        for node in changedNodes:
+            if modifiers == QtCore.Qt.ControlModifier:
+                select = (node in hits) != (node in self._mouseDownSelection)
+            elif modifiers == QtCore.Qt.ShiftModifier:
+                select = node in hits or node in self._mouseDownSelection
+            else:
+                select = node in hits
+
+            if select and not node.isSelected():
+                self.selectNode(node, emitSignal=False)
+            elif not select and node.isSelected():
+                self.deselectNode(node, emitSignal=False)
+
+    ################################################
+    ## Bulk Construction
+
+    def buildGraph(self, nodes, edges, nodeClass=Node):
+        """Creates nodes and connections in bulk from plain descriptions.
+
+        All items are created before being inserted in the scene, with the
+        scene index suspended, and a single graphBuilt signal is emitted
+        instead of one signal per item.
+
+        Args:
+            nodes (iterable): Node descriptions. Each one is a dict with a
+                'name', and optionally a 'pos' (x, y), a 'color' (QColor or
+                r, g, b, a) and a list of 'ports'. Each port is a dict with a
+                'name', a 'type' ('In', 'Out' or 'IO'), a 'color' and a
+                'dataType'. A 'collapsed' state such as NODE_COLLAPSED only
+                creates the ports the node shows.
+            edges (iterable): Tuples of (srcNode, outputName, tgtNode,
+                inputName). Nodes can be given by name or as Node objects.
+            nodeClass (type): Class used to create the nodes, e.g. FlatNode.
+
+        Returns:
+            tuple: The list of new nodes and the list of new connections.
+
+        """
+
+        newNodes = []
+        newNodesByName = {}
+        for desc in nodes:
+            name = desc['name']
+            if name in self.__nodes or name in newNodesByName:
+                raise Exception("Node already exists:" + str(name))
+
+            node = self.__createNode(desc, nodeClass)
+            newNodes.append(node)
+            newNodesByName[name] = node
+
+        def getNode(node):
+            if isinstance(node, Node):
+                return node
+            result = newNodesByName.get(node)
+            if result is None:
+                result = self.getNode(node)
+            if result is None:
+                raise Exception("Node not found:" + str(node))
+            return result
+
+        portPairs = []
+        for (srcNode, outputName, tgtNode, inputName) in edges:
+            sourceNode = getNode(srcNode)
+            sourcePort = sourceNode.getPort(outputName)
+            if not sourcePort:
+                raise Exception("Node '" + sourceNode.getName() + "' does not have output:" + outputName)
+
+            targetNode = getNode(tgtNode)
+            targetPort = targetNode.getPort(inputName)
+            if not targetPort:
+                raise Exception("Node '" + targetNode.getName() + "' does not have input:" + inputName)
+
+            portPairs.append((sourcePort, targetPort))
+
+        # Like connectPorts, the last edge to a single connection input
+        # replaces the previous ones. They are dropped here, so that no new
+        # connection is ever removed before the graph holds it.
+        lastPairIndices = {}
+        for (index, (sourcePort, targetPort)) in enumerate(portPairs):
+            inCircle = targetPort.inCircle()
+            if inCircle.supportsOnlySingleConnections():
+                lastPairIndices[inCircle] = index
+        portPairs = [pair for (index, pair) in enumerate(portPairs)
+            if lastPairIndices.get(pair[1].inCircle(), index) == index]
+
+        # Give the new nodes their place in the topological order up front, so
+        # that edges listed in that order never need any reordering.
+        for node in newNodes:
+            self.__topologicalOrder.addVertex(node)
+
+        # Every port is resolved before connecting anything, so only a cycle
+        # can make this fail half way. Undo the connections made so far if so.
+        newConnections = []
+        try:
+            for (sourcePort, targetPort) in portPairs:
+                newConnections.append(Connection(self, sourcePort.outCircle(), targetPort.inCircle()))
+        except Exception:
+            for connection in newConnections:
+                connection.disconnect()
+            for node in newNodes:
+                self.__topologicalOrder.removeVertex(node)
+            raise
+
+        # Insert everything in one pass, and let the scene build its index once afterwards.
+        scene = self.scene()
+        indexMethod = scene.itemIndexMethod()
+        scene.setItemIndexMethod(QtWidgets.QGraphicsScene.NoIndex)
+        try:
+            for node in newNodes:
+                self.addNode(node, emitSignal=False)
+            for connection in newConnections:
+                self.addConnection(connection, emitSignal=False)
+        finally:
+            scene.setItemIndexMethod(indexMethod)
+
+        if self.__isRecordingUndo():
+            self.__undoStack.push(NodesCommand(self, newNodes, self.__describeConnections(newConnections), True))
+
+        if self.__virtualGraph is not None:
+            self.__virtualGraph.addNodes([self.__describeNode(node) for node in newNodes if node.getName() not in self.__virtualGraph])
+            for node in newNodes:
+                self.__indexNode(node)
+            self.__virtualGraph.connect(self.__describeConnections(newConnections))
+
+        if self.__batchChanges is not None:
+            for node in newNodes:
+                self.__recordBatchChange('nodesAdded', 'nodesRemoved', node)
+            for connection in newConnections:
+                self.__recordBatchChange('connectionsAdded', 'connectionsRemoved', connection)
+        else:
+            self.graphBuilt.emit(newNodes, newConnections)
+
+        return (newNodes, newConnections)
+
+    def __createNode(self, desc, nodeClass):
+        # Creates a node and its ports from a description, without adding it.
+        def toColor(value):
+            if isinstance(value, QtGui.QColor):
+                return value
+            return QtGui.QColor(*value)
+
+        node = nodeClass(self, desc['name'])
+        if 'color' in desc:
+            node.setColor(toColor(desc['color']))
+        # Collapsed nodes only create the ports they show.
+        if 'collapsed' in desc:
+            node.setCollapseState(desc['collapsed'])
+        node.declarePorts([(portDesc['name'], portDesc['type'], toColor(portDesc['color']), portDesc['dataType']) for portDesc in desc.get('ports', ())])
+        if 'pos' in desc:
+            pos = desc['pos']
+            node.setGraphPos(QtCore.QPointF(pos[0], pos[1]))
+        return node
+
+    ################################################
+    ## Serialization
+
+    def __describeNode(self, node):
+        # Description of a node in the format taken by buildGraph.
+        pos = node.getGraphPos()
+        desc = {
+            'name': node.getName(),
+            'pos': (pos.x(), pos.y()),
+            'color': node.getColor().getRgb(),
+            'ports': [{
+                'name': name,
+                'type': connectionPointType,
+                'color': color.getRgb(),
+                'dataType': dataType
+                } for (name, connectionPointType, color, dataType) in node.getPortDescs()]
+            }
+        if node.isCollapsed():
+            desc['collapsed'] = node.getCollapseState()
+        return desc
+
+    def __describeConnection(self, connection):
+        srcPort = connection.getSrcPort()
+        dstPort = connection.getDstPort()
+        return (srcPort.getNode().getName(), srcPort.getName(), dstPort.getNode().getName(), dstPort.getName())
+
+    def __describeConnections(self, connections):
+        return [self.__describeConnection(connection) for connection in connections if connection in self.__connectionEdges]
+
+    def __getNodeConnections(self, nodes):
+        connections = set()
+        for node in nodes:
+            for port in node.getPorts():
+                if port.inCircle():
+                    connections.update(port.inCircle().getConnections())
+                if port.outCircle():
+                    connections.update(port.outCircle().getConnections())
+        return connections
+
+    def _findConnection(self, edge):
+        (srcNode, outputName, tgtNode, inputName) = edge
+        # Ports that were not created yet have no connections.
+        srcPort = self.__ports.get((srcNode, outputName))
+        if srcPort is None or srcPort.outCircle() is None:
+            return None
+        for connection in srcPort.outCircle().getConnections():
+            dstPort = connection.getDstPort()
+            if dstPort is not None and dstPort.getName() == inputName and dstPort.getNode().getName() == tgtNode:
+                return connection
+        return None
+
+    def _serializeNodes(self, nodes, edges=()):
+        """Serializes nodes and connections into a compact fragment.
+
+        The fragment holds one JSON string per node class, and one for the
+        edges, in the description format of buildGraph. It is used by the
+        clipboard and the undo history.
+
+        Args:
+            nodes (list): Nodes to serialize.
+            edges (list): Edges as (srcNode, outputName, tgtNode, inputName)
+                tuples of names. They may refer to nodes outside the fragment.
+
+        Returns:
+            dict: The fragment.
+
+        """
+
+        nodeGroups = []
+        groupIndices = {}
+        for node in nodes:
+            nodeClass = type(node)
+            if nodeClass not in groupIndices:
+                groupIndices[nodeClass] = len(nodeGroups)
+                nodeGroups.append((nodeClass, []))
+            nodeGroups[groupIndices[nodeClass]][1].append(self.__describeNode(node))
+
+        return {
+            'nodes': [(nodeClass, json.dumps(descs, separators=(',', ':'))) for (nodeClass, descs) in nodeGroups],
+            'edges': json.dumps(list(edges), separators=(',', ':'))
+            }
+
+    def _restoreNodes(self, fragment, dx=0.0, dy=0.0, uniqueNames=False):
+        """Creates the nodes and connections of a fragment through buildGraph.
+
+        Nothing is recorded in the undo history, callers record the result.
+
+        Args:
+            fragment (dict): Fragment made by _serializeNodes.
+            dx (float): Horizontal offset applied to the nodes.
+            dy (float): Vertical offset applied to the nodes.
+            uniqueNames (bool): Rename nodes whose name is taken instead of
+                raising.
+
+        Returns:
+            tuple: The new nodes, and the fragment of what was actually
+                created.
+
+        """
+
+        names = {}
+        newNames = set()
+        nodeGroups = []
+        for (nodeClass, descs) in fragment['nodes']:
+            descs = json.loads(descs)
+            for desc in descs:
+                if uniqueNames:
+                    name = self.__getUniqueName(desc['name'], newNames)
+                    names[desc['name']] = name
+                    newNames.add(name)
+                    desc['name'] = name
+                if dx != 0.0 or dy != 0.0:
+                    desc['pos'] = (desc['pos'][0] + dx, desc['pos'][1] + dy)
+            nodeGroups.append((nodeClass, descs))
+
+        edges = [(names.get(src, src), outputName, names.get(tgt, tgt), inputName) for (src, outputName, tgt, inputName) in json.loads(fragment['edges'])]
+
+        newNodes = []
+        with self.__suspendUndo(), self.batch():
+            for (nodeClass, descs) in nodeGroups:
+                newNodes.extend(self.buildGraph(descs, [], nodeClass=nodeClass)[0])
+            self.buildGraph([], edges)
+
+        if len(names) > 0 or dx != 0.0 or dy != 0.0:
+            fragment = {
+                'nodes': [(nodeClass, json.dumps(descs, separators=(',', ':'))) for (nodeClass, descs) in nodeGroups],
+                'edges': json.dumps(edges, separators=(',', ':'))
+                }
+
+        return (newNodes, fragment)
+
+    def _removeNodes(self, nodes, edges):
+        """Removes nodes and connections from the graph.
+
+        Args:
+            nodes (list): Nodes to remove, the ones no longer in the graph are
+                skipped.
+            edges (list): Edges as (srcNode, outputName, tgtNode, inputName)
+                tuples of names.
+
+        """
+
+        with self.__suspendUndo(), self.batch():
+            for edge in edges:
+                connection = self._findConnection(edge)
+                if connection is not None:
+                    self.removeConnection(connection)
+
+            for node in nodes:
+                if self.__nodes.get(node.getName()) is not node:
+                    continue
+                if node in self.__selection:
+                    self.deselectNode(node)
+                node.disconnectAllPorts()
+                self.removeNode(node)
+
+    def __iterEdges(self, nodes, targetNodes=None):
+        # Yields the outgoing connections of the nodes as buildGraph edges,
+        # optionally only the ones ending in targetNodes.
+        for node in nodes:
+            for port in node.getPorts():
+                outCircle = port.outCircle()
+                if outCircle is None:
+                    continue
+                for connection in outCircle.getConnections():
+                    dstPort = connection.getDstPort()
+                    if dstPort is None:
+                        continue
+                    dstNode = dstPort.getNode()
+                    if targetNodes is not None and dstNode not in targetNodes:
+                        continue
+                    yield (node.getName(), port.getName(), dstNode.getName(), dstPort.getName())
+
+    def writeGraph(self, stream):
+        """Writes the graph to a text stream as line-delimited JSON.
+
+        The first line is a header, followed by one line per node in
+        topological order and one line per connection. Every record is written
+        as soon as it is built, so nothing but the graph itself is held in
+        memory.
+
+        Args:
+            stream (file): Text stream to write to.
+
+        """
+
+        def dumps(record):
+            return json.dumps(record, separators=(',', ':')) + '\n'
+
+        stream.write(dumps({'format': GRAPH_FILE_FORMAT, 'version': GRAPH_FILE_VERSION}))
+
+        nodes = self.getTopologicalOrder()
+        for node in nodes:
+            stream.write(dumps({'node': self.__describeNode(node)}))
+
+        # Edges follow the order of their source node so they load without reordering.
+        for edge in self.__iterEdges(nodes):
+            stream.write(dumps({'edge': edge}))
+
+    def readGraph(self, stream, nodeClass=Node, chunkSize=2000):
+        """Adds the nodes and connections of a stream written by writeGraph.
+
+        Records are parsed line by line and handed to buildGraph in chunks, so
+        only one chunk of descriptions is in memory at a time. Listeners get a
+        single batchChanged signal. Loading is not undoable and clears the undo
+        history. If the stream is invalid, the nodes and connections added
+        from it are removed again before the error is raised.
+
+        Args:
+            stream (file): Text stream to read from.
+            nodeClass (type): Class used to create the nodes, e.g. FlatNode.
+            chunkSize (int): Number of records passed to each buildGraph call.
+
+        Returns:
+            tuple: The number of nodes and connections added.
+
+        """
+
+        lines = iter(stream)
+        header = json.loads(next(lines, 'null'))
+        if not isinstance(header, dict) or header.get('format') != GRAPH_FILE_FORMAT:
+            raise Exception("Stream is not a graph file.")
+        if header.get('version', 0) > GRAPH_FILE_VERSION:
+            raise Exception("Unsupported graph file version:" + str(header.get('version')))
+
+        newNodes = []
+        newConnections = []
+        nodes = []
+        edges = []
+        with self.__suspendUndo(), self.batch():
+            try:
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    record = json.loads(line)
+                    if 'node' in record:
+                        nodes.append(record['node'])
+                    elif 'edge' in record:
+                        edges.append(record['edge'])
+                    else:
+                        raise Exception("Invalid graph record:" + line.strip())
+
+                    if len(nodes) + len(edges) >= chunkSize:
+                        (builtNodes, builtConnections) = self.buildGraph(nodes, edges, nodeClass=nodeClass)
+                        newNodes.extend(builtNodes)
+                        newConnections.extend(builtConnections)
+                        nodes = []
+                        edges = []
+
+                (builtNodes, builtConnections) = self.buildGraph(nodes, edges, nodeClass=nodeClass)
+                newNodes.extend(builtNodes)
+                newConnections.extend(builtConnections)
+            except Exception:
+                # Remove what the previous chunks added, so that a bad stream
+                # leaves the graph as it was.
+                for connection in newConnections:
+                    if connection in self.__connections:
+                        self.removeConnection(connection)
+                for node in newNodes:
+                    if self.__nodes.get(node.getName()) is node:
+                        node.disconnectAllPorts()
+                        self.removeNode(node)
+                raise
+
+        self.__undoStack.clear()
+        return (len(newNodes), len(newConnections))
+
+    def saveGraph(self, filePath):
+        """Saves the graph to a file, see writeGraph.
+
+        Args:
+            filePath (str): Path of the file to write.
+
+        """
+
+        with open(filePath, 'w') as stream:
+            self.writeGraph(stream)
+
+    def loadGraph(self, filePath, nodeClass=Node):
+        """Adds the contents of a file written by saveGraph to the graph.
+
+        Args:
+            filePath (str): Path of the file to read.
+            nodeClass (type): Class used to create the nodes, e.g. FlatNode.
+
+        Returns:
+            tuple: The number of nodes and connections added.
+
+        """
+
+        with open(filePath, 'r') as stream:
+            return self.readGraph(stream, nodeClass=nodeClass)
+
+    ################################################
+    ## Clipboard
+
+    def copySelectedNodes(self):
+        """Copies the selected nodes and the connections between them.
+
+        The clipboard is shared by all graph views. It holds a fragment made by
+        _serializeNodes, so large selections stay cheap to keep around.
+
+        Returns:
+            int: Number of nodes copied.
+
+        """
+
+        selectedNodes = set(self.__selection)
+        if len(selectedNodes) == 0:
+            return 0
+
+        # Keep the topological order so that pasting never reorders anything.
+        nodes = [node for node in self.getTopologicalOrder() if node in selectedNodes]
+
+        # Center of the bounding box of the nodes, to paste them around the mouse.
+        positions = [node.getGraphPos() for node in nodes]
+        xs = [p.x() for p in positions]
+        ys = [p.y() for p in positions]
+
+        data = self._serializeNodes(nodes, self.__iterEdges(nodes, selectedNodes))
+        data['center'] = ((min(xs) + max(xs)) * 0.5, (min(ys) + max(ys)) * 0.5)
+        GraphView._clipboardData = data
+
+        return len(nodes)
+
+    def cutSelectedNodes(self):
+        """Copies the selected nodes, then deletes them.
+
+        Returns:
+            int: Number of nodes cut.
+
+        """
+
+        count = self.copySelectedNodes()
+        if count > 0:
+            self.deleteSelectedNodes()
+        return count
+
+    def canPaste(self):
+        return GraphView._clipboardData is not None
+
+    def __getUniqueName(self, name, reservedNames):
+        if name not in self.__nodes and name not in reservedNames:
+            return name
+
+        # Names get a numeric suffix. The next suffix to try is remembered per
+        # base name, so pasting many copies does not probe every suffix again.
+        match = re.match(r'^(.*?)(\d+)$', name)
+        baseName = match.group(1) if match else name
+        counter = self.__nameCounters.get(baseName)
+        if counter is None:
+            counter = self.__getNextSuffix(baseName, reservedNames)
+        while True:
+            candidate = baseName + str(counter)
+            counter += 1
+            if candidate not in self.__nodes and candidate not in reservedNames:
+                break
+        self.__nameCounters[baseName] = counter
+        return candidate
+
+    def __getNextSuffix(self, baseName, reservedNames):
+        # Starts the counter of a base name after the highest suffix in use,
+        # e.g. by nodes loaded from a file, instead of probing up to it.
+        highest = 0
+        for names in (self.__nodes, reservedNames):
+            for name in names:
+                if name.startswith(baseName):
+                    suffix = name[len(baseName):]
+                    if suffix.isdigit():
+                        highest = max(highest, int(suffix))
+        return highest + 1
+
+    def pasteNodes(self, pos=None):
+        """Pastes the clipboard into the graph and selects the new nodes.
+
+        Everything is created through buildGraph within a single batch, and
+        undone as a single step. Nodes whose name is taken are renamed with a
+        numeric suffix.
+
+        Args:
+            pos (QPointF): Scene position to center the pasted nodes on.
+                Defaults to the mouse position, or the center of the view if
+                the mouse is outside of it.
+
+        Returns:
+            list: The pasted nodes.
+
+        """
+
+        data = GraphView._clipboardData
+        if data is None:
+            return []
+
+        if pos is None:
+            viewPos = self.mapFromGlobal(QtGui.QCursor.pos())
+            if not self.viewport().rect().contains(viewPos):
+                viewPos = self.viewport().rect().center()
+            pos = self.mapToScene(viewPos)
+        dx = pos.x() - data['center'][0]
+        dy = pos.y() - data['center'][1]
+
+        with self.__undoMacro('Paste Nodes'), self.batch():
+            (newNodes, fragment) = self._restoreNodes(data, dx, dy, uniqueNames=True)
+            if self.__isRecordingUndo():
+                edges = self.__describeConnections(self.__getNodeConnections(newNodes))
+                self.__undoStack.push(NodesCommand(self, newNodes, edges, True, 'Paste Nodes'))
+
+            self.clearSelection(recordUndo=True)
+            for node in newNodes:
+                self.selectNode(node, recordUndo=True)
+
+        return newNodes
+
+    ################################################
+    ## Undo
+
+    def getUndoStack(self):
+        """Gets the undo history of the graph.
+
+        Changes made through the graph are recorded as compact commands: node
+        names with an offset for moves, and the node objects with the names
+        of their connections for added and deleted nodes. Interactive drags and rubber band selections are
+        recorded once they end, as a single command.
+
+        Returns:
+            QUndoStack: The undo stack.
+
+        """
+
+        return self.__undoStack
+
+    def undo(self):
+        self.__undoStack.undo()
+
+    def redo(self):
+        self.__undoStack.redo()
+
+    def getUndoLimit(self):
+        return self.__undoStack.undoLimit()
+
+    def setUndoLimit(self, limit):
+        """Sets the maximum number of commands kept in the undo history.
+
+        The oldest commands are dropped once the limit is reached. Qt only
+        allows changing the limit of an empty stack, so this clears the
+        history.
+
+        Args:
+            limit (int): Maximum number of commands, 0 for no limit.
+
+        """
+
+        self.__undoStack.clear()
+        self.__undoStack.setUndoLimit(limit)
+
+    def __isRecordingUndo(self):
+        return self.__undoSuspended == 0
+
+    @contextlib.contextmanager
+    def __suspendUndo(self):
+        self.__undoSuspended += 1
+        try:
+            yield
+        finally:
+            self.__undoSuspended -= 1
+
+    @contextlib.contextmanager
+    def __undoMacro(self, text):
+        if not self.__isRecordingUndo():
+            yield
+            return
+        self.__undoStack.beginMacro(text)
+        try:
+            yield
+        finally:
+            self.__undoStack.endMacro()
+
+    @contextlib.contextmanager
+    def __suspendAutoPlace(self):
+        self.__autoPlaceSuspended += 1
+        try:
+            yield
+        finally:
+            self.__autoPlaceSuspended -= 1
+
+    @contextlib.contextmanager
+    def _replayingUndo(self):
+        # Undo commands apply their changes in a batch, without recording them,
+        # and nodes they add back keep their position.
+        with self.__suspendUndo(), self.__suspendAutoPlace(), self.batch():
+            yield
+
+    def __recordSelectionChange(self, removedNodes, addedNodes):
+        if (len(removedNodes) == 0 and len(addedNodes) == 0) or not self.__isRecordingUndo():
+            return
+        command = SelectionCommand(self, [node.getName() for node in removedNodes], [node.getName() for node in addedNodes])
+        self.__undoStack.push(command)
+
+    def __requestSelectionRecord(self, recordUndo):
+        # The selection changes of a batch are recorded when it ends, if any
+        # of them was asked to be.
+        if recordUndo and self.__batchChanges is not None:
+            self.__batchRecordsSelection = True
+
+    ################################################
+    ## Batching
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Context deferring the change signals of the graph.
+
+        While a batch is open, nodeAdded, nodeRemoved, connectionAdded,
+        connectionRemoved, selectionChanged, selectionMoved and graphBuilt are
+        not emitted, and the view is not repainted. When the outermost batch
+        ends, batchChanged is emitted once with a dict holding the net changes:
+        'nodesAdded', 'nodesRemoved', 'connectionsAdded', 'connectionsRemoved',
+        'selectionAdded', 'selectionRemoved' and 'nodesPositioned' lists, and
+        'nodesMoved', a list of (nodes, delta) tuples. Batches can be nested.
+
+        Example:
+            with graph.batch():
+                graph.deleteSelectedNodes()
+                graph.connectPorts('a', 'out', 'b', 'in')
+
+        """
+
+        self.__beginBatch()
+        try:
+            yield self
+        finally:
+            self.__endBatch()
+
+    def isBatching(self):
+        return self.__batchDepth > 0
+
+    def __beginBatch(self):
+        self.__batchDepth += 1
+        if self.__batchDepth > 1:
+            return
+
+        self.__batchChanges = self.__createBatchChanges()
+        self.__batchSelection = set(self.__selection)
+        self.__batchRecordsSelection = False
+        self.__batchUpdatesEnabled = self.updatesEnabled()
+        self.setUpdatesEnabled(False)
+
+    def __createBatchChanges(self):
+        return {
+            'nodesAdded': set(),
+            'nodesRemoved': set(),
+            'connectionsAdded': set(),
+            'connectionsRemoved': set(),
+            'nodesMoved': [],
+            'nodesPositioned': set(),
+            }
+
+    def __endBatch(self):
+        self.__batchDepth -= 1
+        if self.__batchDepth > 0:
+            return
+
+        changes = self.__batchChanges
+        prevSelection = self.__batchSelection
+        self.__batchChanges = None
+        self.__batchSelection = None
+        self.setUpdatesEnabled(self.__batchUpdatesEnabled)
+
+        result = {
+            'nodesAdded': list(changes['nodesAdded']),
+            'nodesRemoved': list(changes['nodesRemoved']),
+            'connectionsAdded': list(changes['connectionsAdded']),
+            'connectionsRemoved': list(changes['connectionsRemoved']),
+            'selectionAdded': list(self.__selection - prevSelection),
+            'selectionRemoved': list(prevSelection - self.__selection),
+            'nodesMoved': changes['nodesMoved'],
+            'nodesPositioned': list(changes['nodesPositioned']),
+            }
+
+        if self.__batchRecordsSelection:
+            self.__batchRecordsSelection = False
+            self.__recordSelectionChange(result['selectionRemoved'], result['selectionAdded'])
+
+        for value in result.values():
+            if len(value) != 0:
+                self.batchChanged.emit(result)
+                break
+
+    def __recordBatchChange(self, key, oppositeKey, item):
+        # An item added and removed again within the batch cancels out.
+        opposite = self.__batchChanges[oppositeKey]
+        if item in opposite:
+            opposite.remove(item)
+        else:
+            self.__batchChanges[key].add(item)
+
+    ################################################
+    ## Profiling
+
+    def getProfiler(self):
+        """Gets the profiler holding the recorded frames.
+
+        Returns:
+            Profiler: The profiler, None if profiling was never enabled.
+
+        """
+
+        return self.__profiler
+
+    def isProfilingEnabled(self):
+        return self.__profilingEnabled
+
+    def setProfilingEnabled(self, enabled):
+        """Records the paint time of each frame, the durations of the events
+        and the emitted signals.
+
+        The records are kept by getProfiler() and emitted with frameProfiled.
+        When disabled, the instrumented paint methods only cost a check.
+
+        Args:
+            enabled (bool): Whether to profile.
+
+        """
+
+        if enabled == self.__profilingEnabled:
+            return
+        self.__profilingEnabled = enabled
+
+        if not enabled:
+            for (signal, counter) in self.__signalCounters:
+                signal.disconnect(counter)
+            self.__signalCounters = []
+            return
+
+        if self.__profiler is None:
+            self.__profiler = Profiler()
+
+        # Signals are emitted by Qt, they are counted through connections that
+        # only exist while profiling.
+        profiler = self.__profiler
+        metaObject = self.metaObject()
+        names = set()
+        for index in range(GraphView.staticMetaObject.methodOffset(), metaObject.methodCount()):
+            method = metaObject.method(index)
+            if method.methodType() != QtCore.QMetaMethod.Signal:
+                continue
+            if hasattr(method, 'name'):
+                name = bytes(method.name()).decode()
+            else:
+                # PySide 1.x only has the signature, e.g. 'nodeAdded(PyObject)'.
+                name = str(method.signature()).split('(')[0]
+            if name in names or name == 'frameProfiled':
+                continue
+            names.add(name)
+            signal = getattr(self, name)
+            counter = (lambda name: lambda *args: profiler.countSignal(name))(name)
+            signal.connect(counter)
+            self.__signalCounters.append((signal, counter))
+
+    def viewportEvent(self, event):
+        if self.__profilingEnabled:
+            return self.__profileEvent(super(GraphView, self).viewportEvent, event)
+        if self.__hudVisible and event.type() == QtCore.QEvent.Paint:
+            start = time.time()
+            result = super(GraphView, self).viewportEvent(event)
+            self.__hudFrames.append((start, time.time() - start))
+            return result
+        return super(GraphView, self).viewportEvent(event)
+
+    def event(self, event):
+        if not self.__profilingEnabled:
+            return super(GraphView, self).event(event)
+        return self.__profileEvent(super(GraphView, self).event, event)
+
+    def __profileEvent(self, handler, event):
+        profiler = self.__profiler
+        previousProfiler = setActiveProfiler(profiler)
+        try:
+            if event.type() != QtCore.QEvent.Paint:
+                start = time.time()
+                result = handler(event)
+                profiler.addEvent(getEventTypeName(event.type()), time.time() - start)
+                return result
+
+            profiler.beginFrame()
+            try:
+                result = handler(event)
+            finally:
+                frame = profiler.endFrame()
+        finally:
+            setActiveProfiler(previousProfiler)
+        if self.__hudVisible:
+            self.__hudFrames.append((frame['start'], frame['seconds']))
+
+        # The items Qt painted, counted after the frame so that it is not slowed down.
+        items = frame['items']
+        for item in self.items(event.rect()):
+            if item.isVisible() and item.effectiveOpacity() > 0.0:
+                name = type(item).__name__
+                items[name] = items.get(name, 0) + 1
+        self.frameProfiled.emit(frame)
+        return result
+
+    ################################################
+    ## Heads-up display
+
+    def isHudVisible(self):
+        return self.__hudVisible
+
+    def setHudVisible(self, visible):
+        """Shows an overlay with the frame rate, the paint time of the last
+        frame, the visible and total node and connection counts, the level of
+        detail and the state of the scene index.
+
+        While it is shown, the whole viewport is painted on every update so
+        that the overlay stays current.
+
+        Args:
+            visible (bool): Whether to show the overlay.
+
+        """
+
+        if visible == self.__hudVisible:
+            return
+        self.__hudVisible = visible
+        if visible:
+            self.__hudViewportUpdateMode = self.viewportUpdateMode()
+            self.setViewportUpdateMode(QtWidgets.QGraphicsView.FullViewportUpdate)
+        else:
+            self.setViewportUpdateMode(self.__hudViewportUpdateMode)
+            self.__hudFrames.clear()
+        self.viewport().update()
+
+    def toggleHud(self):
+        self.setHudVisible(not self.__hudVisible)
+
+    def getHudText(self):
+        """Gets the text of the overlay, e.g. to paste it in a bug report.
+
+        Connections count as visible when one of their nodes is.
+
+        Returns:
+            str: One line per value.
+
+        """
+
+        frames = [frame for frame in self.__hudFrames if frame[0] >= time.time() - 1.0]
+        fps = 0.0
+        if len(frames) > 1 and frames[-1][0] > frames[0][0]:
+            fps = (len(frames) - 1) / (frames[-1][0] - frames[0][0])
+        frameTime = self.__hudFrames[-1][1] * 1000.0 if len(self.__hudFrames) > 0 else 0.0
+
+        # The visible counts are kept until the view or the graph changes, and
+        # only walk the connections of the visible nodes, not their ports.
+        visibleRect = self.mapToScene(self.viewport().rect()).boundingRect()
+        key = (visibleRect.getRect(), self.__revision)
+        if self.__hudCounts is None or self.__hudCounts[0] != key:
+            visibleNodes = self.getNodesInRect(visibleRect)
+            visibleConnections = set()
+            for node in visibleNodes:
+                visibleConnections.update(self.__nodeConnections.get(node, ()))
+            self.__hudCounts = (key, len(visibleNodes), len(visibleConnections))
+        (key, visibleNodeCount, visibleConnectionCount) = self.__hudCounts
+
+        if self.__virtualGraph is not None:
+            nodeCount = len(self.__virtualGraph)
+            connectionCount = self.__virtualGraph.getEdgeCount()
+        else:
+            nodeCount = len(self.__nodes)
+            connectionCount = len(self.__connectionEdges)
+
+        lodNames = {LOD_FULL: 'full', LOD_MEDIUM: 'medium', LOD_FAR: 'far'}
+        scene = self.scene()
+        if scene.itemIndexMethod() == QtWidgets.QGraphicsScene.BspTreeIndex:
+            index = 'bsp tree, depth ' + (str(scene.bspTreeDepth()) if scene.bspTreeDepth() > 0 else 'auto')
+        else:
+            index = 'none'
+
+        lines = [
+            'fps:         %.1f' % fps,
+            'frame:       %.2f ms' % frameTime,
+            'nodes:       %d / %d' % (visibleNodeCount, nodeCount),
+            'connections: %d / %d' % (visibleConnectionCount, connectionCount),
+            'lod:         %s (scale %.3f)' % (lodNames[self.__levelOfDetail], self.transform().m22()),
+            'index:       %s' % index
+            ]
+        if self.__virtualGraph is not None:
+            lines.append('virtual:     %d nodes with items' % len(self.__nodes))
+        return '\n'.join(lines)
+
+    @profiled('foreground')
+    def drawForeground(self, painter, rect):
+        super(GraphView, self).drawForeground(painter, rect)
+        if not self.__hudVisible:
+            return
+
+        lines = self.getHudText().split('\n')
+        painter.save()
+        # The overlay is drawn in viewport coordinates.
+        painter.resetTransform()
+        painter.setFont(self._hudFont)
+        metrics = painter.fontMetrics()
+        margin = self._hudMargin
+        width = max(metrics.width(line) for line in lines) + 2 * margin
+        height = metrics.height() * len(lines) + 2 * margin
+        box = QtCore.QRectF(margin, margin, width, height)
+        painter.setPen(QtCore.Qt.NoPen)
+        painter.setBrush(self._hudBackgroundColor)
+        painter.drawRoundedRect(box, 4, 4)
+        painter.setPen(self._hudTextColor)
+        for (index, line) in enumerate(lines):
+            painter.drawText(QtCore.QPointF(box.left() + margin, box.top() + margin + metrics.ascent() + index * metrics.height()), line)
+        painter.restore()
+
+    ################################################
+    ## Manipulation
+
+    def getManipulationFrameInterval(self):
+        """Gets the minimum time between two applied mouse manipulations.
+
+        Returns:
+            int: Interval in milliseconds, 0 when every mouse move is applied.
+
+        """
+
+        return self._manipulationFrameInterval
+
+    def setManipulationFrameInterval(self, interval):
+        """Sets the minimum time between two applied mouse manipulations.
+
+        Args:
+            interval (int): Interval in milliseconds, 0 to apply every mouse move.
+
+        """
+
+        self.flushManipulation()
+        self._manipulationFrameInterval = int(interval)
+
+    def queueManipulation(self, apply):
+        """Queues the work of a mouse move that drags, pans or zooms.
+
+        When no manipulation was applied during the last frame interval, apply
+        is called right away so that the first move has no lag. Otherwise it
+        replaces the pending work and is called at the end of the interval.
+        apply must therefore bring the view to the state of the latest mouse
+        position whatever the positions skipped before it, e.g. by computing
+        its delta from the last applied position.
+
+        Args:
+            apply (function): Called without arguments to apply the move.
+
+        """
+
+        if self._manipulationFrameInterval <= 0:
+            apply()
+        elif self.__manipulationTimer.isActive():
+            self.__pendingManipulation = apply
+        else:
+            apply()
+            self.__manipulationTimer.start(self._manipulationFrameInterval)
+
+    def flushManipulation(self):
+        """Applies the pending mouse manipulation, if any, right away.
+
+        Called before a manipulation ends so that its final state is the same
+        as if every move had been applied.
+
+        """
+
+        self.__manipulationTimer.stop()
+        apply = self.__pendingManipulation
+        if apply is not None:
+            self.__pendingManipulation = None
+            apply()
+
+    def __applyPendingManipulation(self):
+        apply = self.__pendingManipulation
+        if apply is not None:
+            self.__pendingManipulation = None
+            apply()
+            # The moves keep coming, the next one waits for the next frame.
+            self.__manipulationTimer.start(self._manipulationFrameInterval)
+
+    ################################################
+    ## Events
+
+    def mousePressEvent(self, event):
+        self.flushManipulation()
+
+        if event.button() == QtCore.Qt.LeftButton and self.itemAt(event.pos()) is None:
+            self.beginNodeSelection.emit()
+            self._manipulationMode = MANIP_MODE_SELECT
+            self._mouseDownSelection = copy.copy(self.getSelectedNodes())
+            self.clearSelection(emitSignal=False)
+            self._selectionRect = SelectionRect(graph=self, mouseDownPos=self.mapToScene(event.pos()))
+            self._selectionRectHits = set()
+            self._lastSelectionSceneRect = self._selectionRect.sceneBoundingRect()
+            self._selectionModifiers = None
+
+        elif event.button() == QtCore.Qt.MidButton or event.button() == QtCore.Qt.MiddleButton:
+            self.setCursor(QtCore.Qt.OpenHandCursor)
+            self._manipulationMode = MANIP_MODE_PAN
+            self._lastPanPoint = self.mapToScene(event.pos())
+
+        elif event.button() == QtCore.Qt.RightButton:
+            self.setCursor(QtCore.Qt.SizeHorCursor)
+            self._manipulationMode = MANIP_MODE_ZOOM
+            self._lastMousePos = event.pos()
+            self._lastTransform = QtGui.QTransform(self.transform())
+            self._lastSceneRect = self.sceneRect()
+            self._lastSceneCenter = self._lastSceneRect.center()
+            self._lastScenePos = self.mapToScene(event.pos())
+            self._lastOffsetFromSceneCenter = self._lastScenePos - self._lastSceneCenter
+
+        else:
+            super(GraphView, self).mousePressEvent(event)
+
+    def mouseMoveEvent(self, event):
+        if self._manipulationMode in (MANIP_MODE_SELECT, MANIP_MODE_PAN, MANIP_MODE_MOVE, MANIP_MODE_ZOOM):
+            # Only the latest position is applied, once per frame.
+            pos = event.pos()
+            modifiers = event.modifiers()
+            self.queueManipulation(lambda: self.__applyMouseMove(pos, modifiers))
+        else:
+            super(GraphView, self).mouseMoveEvent(event)
+
+    def __applyMouseMove(self, pos, modifiers):
+        if self._manipulationMode == MANIP_MODE_SELECT:
+            dragPoint = self.mapToScene(pos)
+            self._selectionRect.setDragPoint(dragPoint)
+
+            self._updateRubberBandSelection(modifiers)
+
+        elif self._manipulationMode == MANIP_MODE_PAN:
+            delta = self.mapToScene(pos) - self._lastPanPoint
+
+            rect = self.sceneRect()
+            rect.translate(-delta.x(), -delta.y())
+            self.setSceneRect(rect)
+
+            self._lastPanPoint = self.mapToScene(pos)
+
+        elif self._manipulationMode == MANIP_MODE_MOVE:
+
+            newPos = self.mapToScene(pos)
+            delta = newPos - self._lastDragPoint
+            self._lastDragPoint = newPos
+
+            # Apply the delta to each selected node
+            self.moveSelectedNodes(delta, emitSignal=False)
+
+        elif self._manipulationMode == MANIP_MODE_ZOOM:
+
+           # How much
+            delta = pos - self._lastMousePos
+            zoomFactor = 1.0
+            if delta.x() > 0:
+                zoomFactor = 1.0 + delta.x() / 100.0
+            else:
+                zoomFactor = 1.0 / (1.0 + abs(delta.x()) / 100.0)
+
+            # Limit zoom to 3x
+            if self._lastTransform.m22() * zoomFactor >= 2.0:
+                return
+
+            # Reset to when we mouse pressed
+            self.setSceneRect(self._lastSceneRect)
+            self.setTransform(self._lastTransform)
+
+            # Center scene around mouse down
+            rect = self.sceneRect()
+            rect.translate(self._lastOffsetFromSceneCenter)
+            self.setSceneRect(rect)
+
+            # Zoom in (QGraphicsView auto-centers!)
+            self.scale(zoomFactor, zoomFactor)
 
             newSceneCenter = self.sceneRect().center()
             newScenePos = self.mapToScene(self._lastMousePos)
@@ -523,15 +2651,14 @@ class GraphView(QtWidgets.QGraphicsView):
             rect = self.sceneRect()
             rect.translate(-1 * newOffsetFromSceneCenter)
             self.setSceneRect(rect)
+            self._updateLevelOfDetail()
 
             # Call udpate to redraw background
             self.update()
 
-
-        else:
-            super(GraphView, self).mouseMoveEvent(event)
-
     def mouseReleaseEvent(self, event):
+        self.flushManipulation()
+
         if self._manipulationMode == MANIP_MODE_SELECT:
 
             # If users simply clicks in the empty space, clear selection.
@@ -556,6 +2683,8 @@ class GraphView(QtWidgets.QGraphicsView):
                     selectedNodes.append(node)
 
             if selectedNodes != deselectedNodes:
+                # The whole rubber band drag is a single undo step.
+                self.__recordSelectionChange(deselectedNodes, selectedNodes)
                 self.selectionChanged.emit(deselectedNodes, selectedNodes)
 
             self.endNodeSelection.emit()
@@ -573,6 +2702,7 @@ class GraphView(QtWidgets.QGraphicsView):
             super(GraphView, self).mouseReleaseEvent(event)
 
     def wheelEvent(self, event):
+        self.flushManipulation()
 
         (xfo, invRes) = self.transform().inverted()
         topLeft = xfo.map(self.rect().topLeft())
@@ -591,6 +2721,7 @@ class GraphView(QtWidgets.QGraphicsView):
             return
 
         self.scale(zoomFactor, zoomFactor)
+        self._updateLevelOfDetail()
 
         # Call udpate to redraw background
         self.update()
@@ -599,52 +2730,75 @@ class GraphView(QtWidgets.QGraphicsView):
     ################################################
     ## Painting
 
+    def _getGridBrush(self, scale):
+        """Gets a brush tiling one course grid cell, rendered for the given view scale.
+
+        The tile is only rendered again when its size in pixels changes. Grid
+        levels whose lines get closer than _gridFadeSpacing pixels fade out.
+
+        """
+
+        tileSize = max(1, int(round(self._gridSizeCourse * scale)))
+        if self._gridBrushTileSize == tileSize:
+            return self._gridBrush
+
+        def fadedPen(pen, spacing, scale):
+            opacity = (spacing - self._gridFadeSpacing) / float(self._gridFadeSpacing)
+            if opacity <= 0.0:
+                return None
+            color = QtGui.QColor(pen.color())
+            color.setAlphaF(color.alphaF() * min(opacity, 1.0))
+            return QtGui.QPen(color, pen.widthF() * scale)
+
+        pixelScale = tileSize / float(self._gridSizeCourse)
+        fineSpacing = self._gridSizeFine * pixelScale
+        finePen = fadedPen(self._gridPenS, fineSpacing, pixelScale)
+        coursePen = fadedPen(self._gridPenL, tileSize, pixelScale)
+
+        if finePen is None and coursePen is None:
+            brush = None
+        else:
+            pixmap = QtGui.QPixmap(tileSize, tileSize)
+            pixmap.fill(self._backgroundColor)
+            tilePainter = QtGui.QPainter(pixmap)
+            tilePainter.setRenderHint(QtGui.QPainter.Antialiasing)
+
+            # Lines on the tile border are drawn on both sides so that the halves
+            # of the adjacent tiles line up.
+            if finePen is not None:
+                tilePainter.setPen(finePen)
+                lines = []
+                for i in range(int(self._gridSizeCourse // self._gridSizeFine) + 1):
+                    pos = i * fineSpacing
+                    lines.append(QtCore.QLineF(pos, 0, pos, tileSize))
+                    lines.append(QtCore.QLineF(0, pos, tileSize, pos))
+                tilePainter.drawLines(lines)
+
+            if coursePen is not None:
+                tilePainter.setPen(coursePen)
+                tilePainter.drawLines([
+                    QtCore.QLineF(0, 0, 0, tileSize),
+                    QtCore.QLineF(tileSize, 0, tileSize, tileSize),
+                    QtCore.QLineF(0, 0, tileSize, 0),
+                    QtCore.QLineF(0, tileSize, tileSize, tileSize)
+                    ])
+            tilePainter.end()
+
+            # Map the tile back onto one course cell in scene coordinates.
+            brush = QtGui.QBrush(pixmap)
+            brush.setTransform(QtGui.QTransform.fromScale(1.0 / pixelScale, 1.0 / pixelScale))
+
+        self._gridBrushTileSize = tileSize
+        self._gridBrush = brush
+        return brush
+
+    @profiled('background')
     def drawBackground(self, painter, rect):
 
-        oldTransform = painter.transform()
-        painter.fillRect(rect, self._backgroundColor)
-
-        left = int(rect.left()) - (int(rect.left()) % self._gridSizeFine)
-        top = int(rect.top()) - (int(rect.top()) % self._gridSizeFine)
-
-        # Draw horizontal fine lines
-        gridLines = []
-        painter.setPen(self._gridPenS)
-        y = float(top)
-        while y < float(rect.bottom()):
-            gridLines.append(QtCore.QLineF( rect.left(), y, rect.right(), y ))
-            y += self._gridSizeFine
-        painter.drawLines(gridLines)
-
-        # Draw vertical fine lines
-        gridLines = []
-        painter.setPen(self._gridPenS)
-        x = float(left)
-        while x < float(rect.right()):
-            gridLines.append(QtCore.QLineF( x, rect.top(), x, rect.bottom()))
-            x += self._gridSizeFine
-        painter.drawLines(gridLines)
-
-        # Draw thick grid
-        left = int(rect.left()) - (int(rect.left()) % self._gridSizeCourse)
-        top = int(rect.top()) - (int(rect.top()) % self._gridSizeCourse)
-
-        # Draw vertical thick lines
-        gridLines = []
-        painter.setPen(self._gridPenL)
-        x = left
-        while x < rect.right():
-            gridLines.append(QtCore.QLineF( x, rect.top(), x, rect.bottom() ))
-            x += self._gridSizeCourse
-        painter.drawLines(gridLines)
-
-        # Draw horizontal thick lines
-        gridLines = []
-        painter.setPen(self._gridPenL)
-        y = top
-        while y < rect.bottom():
-            gridLines.append(QtCore.QLineF( rect.left(), y, rect.right(), y ))
-            y += self._gridSizeCourse
-        painter.drawLines(gridLines)
+        brush = self._getGridBrush(self.transform().m22())
+        if brush is None:
+            painter.fillRect(rect, self._backgroundColor)
+        else:
+            painter.fillRect(rect, brush)
 
         return super(GraphView, self).drawBackground(painter, rect)
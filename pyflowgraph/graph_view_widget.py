@@ -41,6 +41,24 @@ class GraphViewWidget(QtWidgets.QWidget):
         frameShortcut = QtWidgets.QShortcut(QtGui.QKeySequence(QtCore.Qt.Key_A), self)
         frameShortcut.activated.connect(self.graphView.frameAllNodes)
 
+        hudShortcut = QtWidgets.QShortcut(QtGui.QKeySequence(QtCore.Qt.Key_F12), self)
+        hudShortcut.activated.connect(self.graphView.toggleHud)
+
+        copyShortcut = QtWidgets.QShortcut(QtGui.QKeySequence(QtGui.QKeySequence.Copy), self)
+        copyShortcut.activated.connect(self.graphView.copySelectedNodes)
+
+        cutShortcut = QtWidgets.QShortcut(QtGui.QKeySequence(QtGui.QKeySequence.Cut), self)
+        cutShortcut.activated.connect(self.graphView.cutSelectedNodes)
+
+        pasteShortcut = QtWidgets.QShortcut(QtGui.QKeySequence(QtGui.QKeySequence.Paste), self)
+        pasteShortcut.activated.connect(self.graphView.pasteNodes)
+
+        undoShortcut = QtWidgets.QShortcut(QtGui.QKeySequence(QtGui.QKeySequence.Undo), self)
+        undoShortcut.activated.connect(self.graphView.undo)
+
+        redoShortcut = QtWidgets.QShortcut(QtGui.QKeySequence(QtGui.QKeySequence.Redo), self)
+        redoShortcut.activated.connect(self.graphView.redo)
+
 
     def getGraphView(self):
         return self.graphView
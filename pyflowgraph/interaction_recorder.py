@@ -0,0 +1,355 @@
+#
+# Copyright 2015-2017 Eric Thivierge
+#
+
+import io
+import json
+import time
+
+from qtpy import QtGui, QtWidgets, QtCore
+
+from .node import Node
+from .profiler import getEventTypeName
+from .graph_view import GRAPH_FILE_FORMAT, GRAPH_FILE_VERSION
+
+# Header of the line-delimited JSON files written by InteractionRecorder.
+INTERACTION_FILE_FORMAT = 'pyflowgraph-interactions'
+INTERACTION_FILE_VERSION = 1
+
+_mouseEventTypes = {
+    'MouseButtonPress': QtCore.QEvent.MouseButtonPress,
+    'MouseButtonRelease': QtCore.QEvent.MouseButtonRelease,
+    'MouseButtonDblClick': QtCore.QEvent.MouseButtonDblClick,
+    'MouseMove': QtCore.QEvent.MouseMove
+    }
+
+
+def _getTransformValues(transform):
+    return [
+        transform.m11(), transform.m12(), transform.m13(),
+        transform.m21(), transform.m22(), transform.m23(),
+        transform.m31(), transform.m32(), transform.m33()
+        ]
+
+
+def _getRectValues(rect):
+    return [rect.x(), rect.y(), rect.width(), rect.height()]
+
+
+def _getPercentiles(values):
+    values = sorted(values)
+    if len(values) == 0:
+        return {'count': 0}
+
+    def percentile(fraction):
+        return values[min(int(fraction * len(values)), len(values) - 1)]
+
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values),
+        'p50': percentile(0.5),
+        'p90': percentile(0.9),
+        'p99': percentile(0.99),
+        'max': values[-1]
+        }
+
+
+class InteractionRecorder(QtCore.QObject):
+    """Records the mouse, wheel and key events sent to a graph view.
+
+    Checkpoints of the view transform and scene rect are taken when recording
+    starts and stops, and before every button press and wheel event, so that
+    a replay can check that it follows the recorded session. The graph itself
+    can be stored along with the events, see start.
+
+    Keys handled by shortcuts never reach the view as key presses, the
+    recorder uses the shortcut override sent ahead of every key press instead.
+
+    """
+
+    def __init__(self, graph, parent=None):
+        super(InteractionRecorder, self).__init__(parent)
+        self.__graph = graph
+        self.__records = []
+        self.__graphLines = []
+        self.__viewportSize = None
+        self.__startTime = None
+
+    def isRecording(self):
+        return self.__startTime is not None
+
+    def start(self, includeGraph=True):
+        """Starts recording, dropping any previous recording.
+
+        Args:
+            includeGraph (bool): Store the graph as it is now, so that a replay
+                can start from the same graph.
+
+        """
+
+        if self.isRecording():
+            self.stop()
+        self.__records = []
+        self.__graphLines = []
+        if includeGraph:
+            stream = io.StringIO()
+            self.__graph.writeGraph(stream)
+            # The graph file header is replaced by the recording's own.
+            self.__graphLines = stream.getvalue().splitlines()[1:]
+
+        viewport = self.__graph.viewport()
+        self.__viewportSize = (viewport.width(), viewport.height())
+        self.__startTime = time.time()
+        self.__addCheckpoint()
+        viewport.installEventFilter(self)
+        self.__graph.installEventFilter(self)
+
+    def stop(self):
+        if not self.isRecording():
+            return
+        self.__addCheckpoint()
+        self.__graph.viewport().removeEventFilter(self)
+        self.__graph.removeEventFilter(self)
+        self.__startTime = None
+
+    def getRecords(self):
+        return list(self.__records)
+
+    def __addCheckpoint(self):
+        self.__records.append({'checkpoint': {
+            't': time.time() - self.__startTime,
+            'transform': _getTransformValues(self.__graph.transform()),
+            'sceneRect': _getRectValues(self.__graph.sceneRect())
+            }})
+
+    def eventFilter(self, watched, event):
+        eventType = event.type()
+        record = None
+        if watched is self.__graph.viewport():
+            if eventType in (QtCore.QEvent.MouseButtonPress, QtCore.QEvent.Wheel):
+                self.__addCheckpoint()
+            if eventType in _mouseEventTypes.values():
+                pos = event.localPos()
+                record = {
+                    'pos': [pos.x(), pos.y()],
+                    'button': int(event.button()),
+                    'buttons': int(event.buttons())
+                    }
+            elif eventType == QtCore.QEvent.Wheel:
+                pos = event.position() if hasattr(event, 'position') else event.posF()
+                angleDelta = event.angleDelta() if hasattr(event, 'angleDelta') else QtCore.QPoint(0, event.delta())
+                record = {
+                    'pos': [pos.x(), pos.y()],
+                    'angleDelta': [angleDelta.x(), angleDelta.y()],
+                    'buttons': int(event.buttons())
+                    }
+        elif watched is self.__graph:
+            if eventType == QtCore.QEvent.ShortcutOverride or eventType == QtCore.QEvent.KeyRelease:
+                record = {'key': event.key(), 'text': event.text(), 'autoRepeat': event.isAutoRepeat()}
+
+        if record is not None:
+            if eventType == QtCore.QEvent.ShortcutOverride:
+                record['type'] = 'KeyPress'
+            else:
+                record['type'] = getEventTypeName(eventType)
+            record['t'] = time.time() - self.__startTime
+            record['modifiers'] = int(event.modifiers())
+            self.__records.append({'event': record})
+
+        return False
+
+    def write(self, stream):
+        """Writes the recording to a text stream as line-delimited JSON.
+
+        The header line is followed by the lines of the graph, if it was
+        included, in the format of GraphView.writeGraph, then by one line per
+        event or checkpoint.
+
+        Args:
+            stream (file): Text stream to write to.
+
+        """
+
+        def dumps(record):
+            return json.dumps(record, separators=(',', ':')) + '\n'
+
+        stream.write(dumps({
+            'format': INTERACTION_FILE_FORMAT,
+            'version': INTERACTION_FILE_VERSION,
+            'viewportSize': self.__viewportSize
+            }))
+        for line in self.__graphLines:
+            stream.write(line + '\n')
+        for record in self.__records:
+            stream.write(dumps(record))
+
+    def save(self, filePath):
+        with open(filePath, 'w') as stream:
+            self.write(stream)
+
+
+class InteractionReplayer(object):
+    """Replays a recording made by InteractionRecorder into a graph view and
+    measures how long each event takes.
+
+    The latency of an event is the time from sending it until the view has
+    processed all the work it posted, painting included.
+
+    """
+
+    def __init__(self, graph):
+        super(InteractionReplayer, self).__init__()
+        self.__graph = graph
+        self.__records = []
+        self.__viewportSize = None
+
+    def read(self, stream, nodeClass=Node):
+        """Reads a recording. When it holds a graph, the view is reset and the
+        graph is loaded.
+
+        Args:
+            stream (file): Text stream written by InteractionRecorder.write.
+            nodeClass (type): Class used to create the nodes, e.g. FlatNode.
+
+        """
+
+        lines = iter(stream)
+        header = json.loads(next(lines, 'null'))
+        if not isinstance(header, dict) or header.get('format') != INTERACTION_FILE_FORMAT:
+            raise Exception("Stream is not an interaction recording.")
+        if header.get('version', 0) > INTERACTION_FILE_VERSION:
+            raise Exception("Unsupported interaction recording version:" + str(header.get('version')))
+        self.__viewportSize = header.get('viewportSize')
+
+        # The graph lines are loaded through readGraph, behind a graph file header.
+        graphLines = [json.dumps({'format': GRAPH_FILE_FORMAT, 'version': GRAPH_FILE_VERSION})]
+        self.__records = []
+        for line in lines:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if 'node' in record or 'edge' in record:
+                graphLines.append(line.strip())
+            elif 'event' in record or 'checkpoint' in record:
+                self.__records.append(record)
+            else:
+                raise Exception("Invalid interaction record:" + line.strip())
+
+        if len(graphLines) > 1:
+            self.__graph.reset()
+            self.__graph.readGraph(graphLines, nodeClass=nodeClass)
+
+    def load(self, filePath, nodeClass=Node):
+        with open(filePath) as stream:
+            self.read(stream, nodeClass=nodeClass)
+
+    def getRecords(self):
+        return list(self.__records)
+
+    def __sendEvent(self, record):
+        graph = self.__graph
+        viewport = graph.viewport()
+        modifiers = QtCore.Qt.KeyboardModifiers(record['modifiers'])
+        eventType = record['type']
+
+        if eventType in _mouseEventTypes:
+            pos = QtCore.QPointF(*record['pos'])
+            screenPos = QtCore.QPointF(viewport.mapToGlobal(pos.toPoint()))
+            event = QtGui.QMouseEvent(
+                _mouseEventTypes[eventType], pos, pos, screenPos,
+                QtCore.Qt.MouseButton(record['button']), QtCore.Qt.MouseButtons(record['buttons']), modifiers
+                )
+            QtWidgets.QApplication.sendEvent(viewport, event)
+        elif eventType == 'Wheel':
+            pos = QtCore.QPointF(*record['pos'])
+            screenPos = QtCore.QPointF(viewport.mapToGlobal(pos.toPoint()))
+            event = QtGui.QWheelEvent(
+                pos, screenPos, QtCore.QPoint(), QtCore.QPoint(*record['angleDelta']),
+                QtCore.Qt.MouseButtons(record['buttons']), modifiers, QtCore.Qt.NoScrollPhase, False
+                )
+            QtWidgets.QApplication.sendEvent(viewport, event)
+        else:
+            # Keys go through QTest so that the shortcuts of the window trigger.
+            from qtpy import QtTest
+            key = QtCore.Qt.Key(record['key'])
+            if eventType == 'KeyPress':
+                QtTest.QTest.keyPress(graph, key, modifiers)
+            else:
+                QtTest.QTest.keyRelease(graph, key, modifiers)
+
+    def __compareCheckpoint(self, checkpoint):
+        graph = self.__graph
+        transform = _getTransformValues(graph.transform())
+        sceneRect = _getRectValues(graph.sceneRect())
+        return max(
+            max(abs(a - b) for (a, b) in zip(transform, checkpoint['transform'])),
+            max(abs(a - b) for (a, b) in zip(sceneRect, checkpoint['sceneRect']))
+            )
+
+    def replay(self, speed=None):
+        """Sends the recorded events to the view.
+
+        The view is resized to the recorded viewport size and starts from the
+        first checkpoint. The later checkpoints are compared with the view to
+        tell how far the replay drifted from the recorded session.
+
+        Args:
+            speed (float): Replay speed relative to the recording, e.g. 1.0 to
+                keep the recorded pacing. None sends the events as fast as
+                possible.
+
+        Returns:
+            dict: Latency percentiles in seconds for 'all' events and per event
+            type under 'events', the largest 'checkpointDrift' and the total
+            'seconds'.
+
+        """
+
+        app = QtWidgets.QApplication.instance()
+        graph = self.__graph
+        if self.__viewportSize is not None:
+            frameSize = graph.size() - graph.viewport().size()
+            graph.resize(self.__viewportSize[0] + frameSize.width(), self.__viewportSize[1] + frameSize.height())
+            app.processEvents()
+
+        latencies = {}
+        drift = 0.0
+        started = False
+        startedAt = None
+        start = time.time()
+        for record in self.__records:
+            checkpoint = record.get('checkpoint')
+            if checkpoint is not None:
+                # Only the first checkpoint sets the view, the others tell how far the replay drifted.
+                if not started:
+                    graph.setSceneRect(QtCore.QRectF(*checkpoint['sceneRect']))
+                    graph.setTransform(QtGui.QTransform(*checkpoint['transform']))
+                    graph._updateLevelOfDetail()
+                    app.processEvents()
+                    started = True
+                    if speed:
+                        startedAt = time.time() - checkpoint['t'] / speed
+                else:
+                    drift = max(drift, self.__compareCheckpoint(checkpoint))
+                continue
+
+            event = record['event']
+            if startedAt is not None:
+                # Events keep their recorded pacing, the view works in between.
+                while time.time() - startedAt < event['t'] / speed:
+                    app.processEvents(QtCore.QEventLoop.AllEvents, 1)
+
+            eventStart = time.time()
+            self.__sendEvent(event)
+            app.processEvents()
+            latencies.setdefault(event['type'], []).append(time.time() - eventStart)
+
+        allLatencies = []
+        for values in latencies.values():
+            allLatencies.extend(values)
+        return {
+            'all': _getPercentiles(allLatencies),
+            'events': dict((eventType, _getPercentiles(values)) for (eventType, values) in latencies.items()),
+            'checkpointDrift': drift,
+            'seconds': time.time() - start
+            }
@@ -0,0 +1,335 @@
+#
+# Copyright 2015-2017 Eric Thivierge
+#
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _gatherRanges(offsets, rows):
+    # Indices of all the entries of the given rows of a CSR offsets array.
+    starts = offsets[rows]
+    counts = offsets[rows + 1] - starts
+    total = int(counts.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    shifts = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    return shifts + np.arange(total)
+
+
+def _getOffsets(nodeCount, src):
+    # CSR offsets of the edges sorted by source.
+    offsets = np.zeros(nodeCount + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=nodeCount), out=offsets[1:])
+    return offsets
+
+
+def _iterFrontiers(nodeCount, src, dst):
+    # Yields the nodes without incoming edges, then repeatedly the nodes whose
+    # incoming edges all come from the previous frontiers.
+    offsets = _getOffsets(nodeCount, src)
+    targets = dst[np.argsort(src, kind='stable')]
+    inDegrees = np.bincount(dst, minlength=nodeCount)
+    frontier = np.flatnonzero(inDegrees == 0)
+    while len(frontier) > 0:
+        yield frontier
+        reached = targets[_gatherRanges(offsets, frontier)]
+        np.subtract.at(inDegrees, reached, 1)
+        reached = np.unique(reached)
+        frontier = reached[inDegrees[reached] == 0]
+
+
+def _segmentedPrefix(values, segments, segmentStarts):
+    # Exclusive prefix sum of values restarting at every segment, for values
+    # sorted by segment.
+    cumulative = np.cumsum(values) - values
+    return cumulative - cumulative[segmentStarts[segments]]
+
+
+class LayeredLayout(object):
+    """Layered (Sugiyama style) layout of a directed acyclic graph.
+
+    Nodes are assigned to layers by longest path, edges spanning several
+    layers are split with dummy nodes, the order within each layer is refined
+    with barycentric sweeps, and finally coordinates are assigned. Layers are
+    laid out from left to right, the way the data flows in the graph.
+
+    All the steps work on integer arrays of edges with NumPy, so that large
+    graphs only cost a few array operations per layer. NumPy is an optional
+    dependency, installed with the 'layout' extra.
+
+    """
+
+    def __init__(self, layerSpacing=80.0, nodeSpacing=20.0, sweeps=8, reorderPorts=False):
+        super(LayeredLayout, self).__init__()
+        if np is None:
+            raise Exception("LayeredLayout requires numpy.")
+
+        self.__layerSpacing = float(layerSpacing)
+        self.__nodeSpacing = float(nodeSpacing)
+        self.__sweeps = int(sweeps)
+        self.__reorderPorts = reorderPorts
+
+    def computePositions(self, widths, heights, src, dst):
+        """Computes the positions of the nodes of a graph given as arrays.
+
+        Args:
+            widths (array): Width of every node.
+            heights (array): Height of every node.
+            src (array): Index of the source node of every edge.
+            dst (array): Index of the target node of every edge.
+
+        Returns:
+            tuple: Arrays of the x and y centers of the nodes, and the array of
+                their layers.
+
+        """
+
+        widths = np.asarray(widths, dtype=np.float64)
+        heights = np.asarray(heights, dtype=np.float64)
+        nodeCount = len(widths)
+
+        # Parallel edges do not change the layout.
+        src = np.asarray(src, dtype=np.int64)
+        dst = np.asarray(dst, dtype=np.int64)
+        if len(src) > 0:
+            keys = np.unique(src * nodeCount + dst)
+            src = keys // nodeCount
+            dst = keys % nodeCount
+
+        layers = self.__assignLayers(nodeCount, src, dst)
+        (layerOf, anchors, src, dst) = self.__splitLongEdges(nodeCount, layers, src, dst)
+        (order, layerStarts) = self.__orderLayers(layerOf, anchors, src, dst)
+
+        totalCount = len(layerOf)
+        allWidths = np.zeros(totalCount)
+        allWidths[:nodeCount] = widths
+        allHeights = np.zeros(totalCount)
+        allHeights[:nodeCount] = heights
+
+        xs = self.__assignX(layerOf, allWidths)
+        ys = self.__assignY(layerOf, allHeights, order, layerStarts, src, dst)
+        return (xs[:nodeCount], ys[:nodeCount], layers)
+
+    def __assignLayers(self, nodeCount, src, dst):
+        # Longest path layering: the sources form the first layer, and every
+        # following frontier of nodes whose inputs are all placed the next one.
+        layers = np.zeros(nodeCount, dtype=np.int64)
+        assigned = 0
+        for (layer, frontier) in enumerate(_iterFrontiers(nodeCount, src, dst)):
+            layers[frontier] = layer
+            assigned += len(frontier)
+        if assigned != nodeCount:
+            raise Exception("Graph contains a cycle.")
+
+        # Nodes feeding more nodes than they read from get shorter edges when
+        # they sit right before their first target. Going from the sinks back
+        # to the sources lets whole chains be pulled along.
+        outDegrees = np.bincount(src, minlength=nodeCount)
+        pullable = (outDegrees > 0) & (outDegrees >= np.bincount(dst, minlength=nodeCount))
+        offsets = _getOffsets(nodeCount, src)
+        targets = dst[np.argsort(src, kind='stable')]
+        for frontier in _iterFrontiers(nodeCount, dst, src):
+            frontier = frontier[pullable[frontier]]
+            if len(frontier) == 0:
+                continue
+            counts = outDegrees[frontier]
+            firstTargets = np.full(len(frontier), nodeCount, dtype=np.int64)
+            owners = np.repeat(np.arange(len(frontier)), counts)
+            np.minimum.at(firstTargets, owners, layers[targets[_gatherRanges(offsets, frontier)]])
+            layers[frontier] = firstTargets - 1
+        return layers
+
+    def __splitLongEdges(self, nodeCount, layers, src, dst):
+        # Edges spanning several layers go through one dummy node per layer.
+        spans = layers[dst] - layers[src]
+        isLong = spans > 1
+        if not isLong.any():
+            return (layers, np.arange(nodeCount), src, dst)
+
+        longSrc = src[isLong]
+        longDst = dst[isLong]
+        dummyCounts = spans[isLong] - 1
+        dummyTotal = int(dummyCounts.sum())
+        firstDummies = nodeCount + np.cumsum(dummyCounts) - dummyCounts
+        lastDummies = firstDummies + dummyCounts - 1
+
+        dummies = np.arange(nodeCount, nodeCount + dummyTotal)
+        steps = dummies - np.repeat(firstDummies, dummyCounts) + 1
+        dummyLayers = np.repeat(layers[longSrc], dummyCounts) + steps
+
+        notLast = np.ones(dummyTotal, dtype=bool)
+        notLast[lastDummies - nodeCount] = False
+
+        src = np.concatenate([src[~isLong], longSrc, dummies[notLast], lastDummies])
+        dst = np.concatenate([dst[~isLong], firstDummies, dummies[notLast] + 1, longDst])
+        anchors = np.concatenate([np.arange(nodeCount), np.repeat(longSrc, dummyCounts)])
+        return (np.concatenate([layers, dummyLayers]), anchors, src, dst)
+
+    def __orderLayers(self, layerOf, anchors, src, dst):
+        totalCount = len(layerOf)
+        layerCount = int(layerOf.max()) + 1 if totalCount > 0 else 0
+
+        # Initial order: real nodes by index, dummies right after the node
+        # their edge starts from.
+        initialKeys = anchors + (anchors != np.arange(totalCount)) * 0.5
+        order = np.lexsort((initialKeys, layerOf))
+        layerStarts = np.zeros(layerCount + 1, dtype=np.int64)
+        np.cumsum(np.bincount(layerOf, minlength=layerCount), out=layerStarts[1:])
+
+        positions = np.empty(totalCount, dtype=np.float64)
+        positions[order] = np.arange(totalCount) - layerStarts[layerOf[order]]
+
+        # Each layer keeps the same members while its order changes, so every
+        # node gets a fixed slot in its layer's barycenter arrays.
+        slots = positions.astype(np.int64)
+
+        # Edges grouped by the layer of their target for the downward sweeps,
+        # and by the layer of their source for the upward ones. Everything that
+        # does not depend on the current order is looked up once.
+        def groupEdges(moving, fixed):
+            edges = np.argsort(layerOf[moving], kind='stable')
+            starts = np.searchsorted(layerOf[moving][edges], np.arange(layerCount + 1))
+            degrees = np.bincount(moving, minlength=totalCount)
+            return (starts, slots[moving[edges]], fixed[edges], degrees)
+
+        downward = groupEdges(dst, src) + (range(1, layerCount),)
+        upward = groupEdges(src, dst) + (range(layerCount - 2, -1, -1),)
+
+        for sweep in range(self.__sweeps):
+            (starts, movingSlots, fixedNodes, degrees, layerRange) = downward if sweep % 2 == 0 else upward
+            for layer in layerRange:
+                (edgeStart, edgeEnd) = (starts[layer], starts[layer + 1])
+                if edgeStart == edgeEnd:
+                    continue
+                (layerStart, layerEnd) = (layerStarts[layer], layerStarts[layer + 1])
+                members = order[layerStart:layerEnd]
+
+                sums = np.bincount(movingSlots[edgeStart:edgeEnd], weights=positions[fixedNodes[edgeStart:edgeEnd]], minlength=layerEnd - layerStart)
+                counts = degrees[members]
+                current = positions[members]
+                barycenters = np.where(counts > 0, sums[slots[members]] / np.maximum(counts, 1), current)
+
+                members = members[np.lexsort((current, barycenters))]
+                order[layerStart:layerEnd] = members
+                positions[members] = np.arange(layerEnd - layerStart)
+
+        return (order, layerStarts)
+
+    def __assignX(self, layerOf, widths):
+        layerCount = int(layerOf.max()) + 1 if len(layerOf) > 0 else 0
+        layerWidths = np.zeros(layerCount)
+        np.maximum.at(layerWidths, layerOf, widths)
+        layerLefts = np.cumsum(layerWidths + self.__layerSpacing) - layerWidths - self.__layerSpacing
+        return layerLefts[layerOf] + layerWidths[layerOf] * 0.5
+
+    def __assignY(self, layerOf, heights, order, layerStarts, src, dst, iterations=4):
+        totalCount = len(layerOf)
+        if totalCount == 0:
+            return np.zeros(0)
+
+        sortedLayers = layerOf[order]
+        sortedHeights = heights[order]
+        extents = sortedHeights + self.__nodeSpacing
+        prefix = _segmentedPrefix(extents, sortedLayers, layerStarts)
+
+        # Adding a multiple of the layer keeps the cumulative extrema below from
+        # leaking from one layer into the next.
+        layerScale = 1.0 + 2.0 * (np.abs(prefix).max() + extents.sum())
+
+        tops = prefix.copy()
+        degrees = np.bincount(src, minlength=totalCount) + np.bincount(dst, minlength=totalCount)
+        sortedDegrees = degrees[order]
+        for iteration in range(iterations):
+            centers = np.empty(totalCount)
+            centers[order] = tops + sortedHeights * 0.5
+
+            # Pull every node towards the mean of its neighbors...
+            sums = np.bincount(src, weights=centers[dst], minlength=totalCount) + np.bincount(dst, weights=centers[src], minlength=totalCount)
+            desired = np.where(sortedDegrees > 0, sums[order] / np.maximum(sortedDegrees, 1) - sortedHeights * 0.5, tops)
+
+            # ...then push them apart again, keeping the order within layers.
+            # Compacting from both ends and averaging avoids a drift either way.
+            offsets = desired - prefix + sortedLayers * layerScale
+            downward = np.maximum.accumulate(offsets)
+            upward = np.minimum.accumulate(offsets[::-1])[::-1]
+            tops = (downward + upward) * 0.5 - sortedLayers * layerScale + prefix
+
+        ys = np.empty(totalCount)
+        ys[order] = tops + sortedHeights * 0.5
+        return ys - (ys.min() + ys.max()) * 0.5
+
+    def layoutGraph(self, graph, nodes=None):
+        """Lays out nodes of a graph and applies all positions at once.
+
+        Args:
+            graph (GraphView): Graph to lay out.
+            nodes (list): Nodes to lay out, defaults to all the nodes. Only the
+                connections between these nodes are taken into account.
+
+        Returns:
+            list: The nodes that were laid out.
+
+        """
+
+        if nodes is None:
+            nodes = graph.getTopologicalOrder()
+        else:
+            selected = set(nodes)
+            nodes = [node for node in graph.getTopologicalOrder() if node in selected]
+        if len(nodes) == 0:
+            return nodes
+
+        widths = np.array([node.size().width() for node in nodes])
+        heights = np.array([node.size().height() for node in nodes])
+        (src, dst) = graph._getEdgeIndices(nodes)
+
+        (xs, ys, layers) = self.computePositions(widths, heights, src, dst)
+
+        # Place the leftmost layer where the nodes were before.
+        left = min(node.getGraphPos().x() - node.size().width() * 0.5 for node in nodes)
+        top = min(node.getGraphPos().y() - node.size().height() * 0.5 for node in nodes)
+        xs = xs - (xs - widths * 0.5).min() + left
+        ys = ys - (ys - heights * 0.5).min() + top
+
+        if self.__reorderPorts:
+            indices = dict((node, index) for (index, node) in enumerate(nodes))
+            self.__reorderNodePorts(nodes, indices, ys)
+
+        graph.setNodePositions(nodes, list(zip(xs.tolist(), ys.tolist())))
+        return nodes
+
+    def __reorderNodePorts(self, nodes, indices, ys):
+        # Sorts the connected ports of every node by the height of the nodes
+        # they connect to. Unconnected ports keep their slots.
+        def portKey(port, circle, getOtherPort):
+            if circle is None:
+                return None
+            others = [indices.get(getOtherPort(connection).getNode()) for connection in circle.getConnections() if getOtherPort(connection) is not None]
+            others = [ys[index] for index in others if index is not None]
+            if len(others) == 0:
+                return None
+            return sum(others) / len(others)
+
+        for node in nodes:
+            ports = node.getPorts()
+            keys = []
+            for port in ports:
+                key = portKey(port, port.inCircle(), lambda connection: connection.getSrcPort())
+                if key is None:
+                    key = portKey(port, port.outCircle(), lambda connection: connection.getDstPort())
+                keys.append(key)
+
+            slots = [index for (index, key) in enumerate(keys) if key is not None]
+            if len(slots) < 2:
+                continue
+            sortedSlots = sorted(slots, key=lambda index: keys[index])
+            if sortedSlots == slots:
+                continue
+
+            newPorts = list(ports)
+            for (slot, index) in zip(slots, sortedSlots):
+                newPorts[slot] = ports[index]
+            node.setPortOrder(newPorts)
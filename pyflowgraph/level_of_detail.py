@@ -0,0 +1,8 @@
+#
+# Copyright 2015-2017 Eric Thivierge
+#
+
+# Levels of detail used to render the graph, from closest to farthest zoom.
+LOD_FULL = 0
+LOD_MEDIUM = 1
+LOD_FAR = 2
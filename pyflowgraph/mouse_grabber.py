@@ -3,9 +3,10 @@
 # Copyright 2015-2017 Eric Thivierge
 #
 
-from qtpy import QtGui, QtCore
-from .port import PortCircle, PortLabel
+from qtpy import QtGui
+from .port import PortCircle
 from .connection import Connection
+from .connection_target_index import ConnectionTargetIndex
 
 class MouseGrabber(PortCircle):
     """docstring for MouseGrabber"""
@@ -19,6 +20,9 @@ class MouseGrabber(PortCircle):
 
         self.__otherPortItem = otherPortCircle
 
+        # Only the compatible circles are looked at while dragging.
+        self.__targetIndex = ConnectionTargetIndex(graph, otherPortCircle)
+
         self._graph.scene().addItem(self)
 
 
@@ -44,42 +48,16 @@ class MouseGrabber(PortCircle):
     def mouseMoveEvent(self, event):
         scenePos = self.mapToScene(event.pos())
 
-        for connection in self.getConnections():
-            connection.prepareGeometryChange()
-
         self.setTransform(QtGui.QTransform.fromTranslate(scenePos.x(), scenePos.y()), False)
 
-        collidingItems = self.collidingItems(QtCore.Qt.IntersectsItemBoundingRect)
-        collidingPortItems = list(filter(lambda item: isinstance(item, (PortCircle, PortLabel)), collidingItems))
-
-        def canConnect(item):
-            if isinstance(item, PortCircle):
-                mouseOverPortCircle = item
-            else:
-                if self.connectionPointType() == 'In':
-                    mouseOverPortCircle = item.getPort().inCircle()
-                else:
-                    mouseOverPortCircle = item.getPort().outCircle()
-
-                if mouseOverPortCircle == None:
-                    return False
-
-            return mouseOverPortCircle.canConnectTo(self.__otherPortItem)
-
-
-        collidingPortItems = list(filter(lambda port: canConnect(port), collidingPortItems))
-        if len(collidingPortItems) > 0:
+        for connection in self.getConnections():
+            connection.updatePath()
 
-            if isinstance(collidingPortItems[0], PortCircle):
-                self.setMouseOverPortCircle(collidingPortItems[0])
-            else:
-                if self.connectionPointType() == 'In':
-                    self.setMouseOverPortCircle(collidingPortItems[0].getPort().inCircle())
-                else:
-                    self.setMouseOverPortCircle(collidingPortItems[0].getPort().outCircle())
+        snapDistance = self._graph.getConnectionSnapDistance() / self._graph.transform().m11()
+        mouseOverPortCircle = self.__targetIndex.findTarget(scenePos, snapDistance)
 
-        elif self.__mouseOverPortCircle != None:
-            self.setMouseOverPortCircle(None)
+        if mouseOverPortCircle is not None or self.__mouseOverPortCircle != None:
+            self.setMouseOverPortCircle(mouseOverPortCircle)
 
 
     def mouseReleaseEvent(self, event):
@@ -114,13 +92,17 @@ class MouseGrabber(PortCircle):
         if self.__mouseOverPortCircle != portCircle:
             if self.__mouseOverPortCircle != None:
                 self.__mouseOverPortCircle.unhighlight()
-                self.__mouseOverPortCircle.getPort().labelItem().unhighlight()
+                labelItem = self.__mouseOverPortCircle.getPort().labelItem()
+                if labelItem is not None:
+                    labelItem.unhighlight()
 
             self.__mouseOverPortCircle = portCircle
 
             if self.__mouseOverPortCircle != None:
                 self.__mouseOverPortCircle.highlight()
-                self.__mouseOverPortCircle.getPort().labelItem().highlight()
+                labelItem = self.__mouseOverPortCircle.getPort().labelItem()
+                if labelItem is not None:
+                    labelItem.highlight()
 
     # def paint(self, painter, option, widget):
     #     super(MouseGrabber, self).paint(painter, option, widget)
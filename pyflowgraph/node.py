@@ -6,7 +6,15 @@
 import math
 import json
 from qtpy import QtGui, QtWidgets, QtCore
-from .port import InputPort, OutputPort
+from .port import InputPort, OutputPort, IOPort
+from .level_of_detail import LOD_FULL, LOD_FAR
+from .text_cache import getStaticText, getTextSize
+from .profiler import profiledPaint
+
+# Which ports a node shows: all of them, only the connected ones, or none.
+NODE_EXPANDED = 0
+NODE_COLLAPSED_TO_CONNECTED = 1
+NODE_COLLAPSED = 2
 
 class NodeTitle(QtWidgets.QGraphicsWidget):
 
@@ -14,38 +22,34 @@ class NodeTitle(QtWidgets.QGraphicsWidget):
     __font = QtGui.QFont('Decorative', 14)
     __font.setLetterSpacing(QtGui.QFont.PercentageSpacing, 115)
     __labelBottomSpacing = 12
+    __textMargin = 4
+    __textOffset = QtCore.QPointF(__textMargin, __textMargin - 2)
 
     def __init__(self, text, parent=None):
         super(NodeTitle, self).__init__(parent)
 
         self.setSizePolicy(QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Fixed))
 
-        self.__textItem = QtWidgets.QGraphicsTextItem(text, self)
-        self.__textItem.setDefaultTextColor(self.__color)
-        self.__textItem.setFont(self.__font)
-        self.__textItem.setPos(0, -2)
-        option = self.__textItem.document().defaultTextOption()
-        option.setWrapMode(QtGui.QTextOption.NoWrap)
-        self.__textItem.document().setDefaultTextOption(option)
-        self.__textItem.adjustSize()
-
+        self.__text = text
         self.setPreferredSize(self.textSize())
 
     def setText(self, text):
-        self.__textItem.setPlainText(text)
-        self.__textItem.adjustSize()
+        self.__text = text
         self.setPreferredSize(self.textSize())
+        self.update()
 
     def textSize(self):
         return QtCore.QSizeF(
-            self.__textItem.textWidth(),
+            getTextSize(self.__text, self.__font).width() + 2 * self.__textMargin,
             self.__font.pointSizeF() + self.__labelBottomSpacing
             )
 
-    # def paint(self, painter, option, widget):
-    #     super(NodeTitle, self).paint(painter, option, widget)
-    #     painter.setPen(QtGui.QPen(QtGui.QColor(0, 255, 0)))
-    #     painter.drawRect(self.windowFrameRect())
+    @profiledPaint
+    def paint(self, painter, option, widget):
+        painter.setFont(self.__font)
+        painter.setPen(self.__color)
+        painter.drawStaticText(self.__textOffset, getStaticText(self.__text, self.__font))
+
 
 
 class NodeHeader(QtWidgets.QGraphicsWidget):
@@ -85,12 +89,35 @@ class PortList(QtWidgets.QGraphicsWidget):
         self.setLayout(layout)
 
     def addPort(self, port, alignment):
+        return self.addPorts([port], alignment)[0]
+
+    # Adds several ports, resizing the list once.
+    def addPorts(self, ports, alignment):
+        layout = self.layout()
+        for port in ports:
+            layout.addItem(port)
+            layout.setAlignment(port, alignment)
+        self.adjustSize()
+        return ports
+
+    def insertPort(self, index, port, alignment):
         layout = self.layout()
-        layout.addItem(port)
+        layout.insertItem(index, port)
         layout.setAlignment(port, alignment)
         self.adjustSize()
         return port
 
+    def removePort(self, port):
+        layout = self.layout()
+        layout.removeItem(port)
+        self.adjustSize()
+
+    def clearPorts(self):
+        layout = self.layout()
+        while layout.count() > 0:
+            layout.removeAt(0)
+        self.adjustSize()
+
     # def paint(self, painter, option, widget):
     #     super(PortList, self).paint(painter, option, widget)
     #     painter.setPen(QtGui.QPen(QtGui.QColor(255, 255, 0)))
@@ -108,17 +135,36 @@ class Node(QtWidgets.QGraphicsWidget):
     __selectedPen = QtGui.QPen(__selectedColor, 1.6)
     __linePen = QtGui.QPen(QtGui.QColor(25, 25, 25, 255), 1.25)
 
+    # Port classes used for each connection point type when building ports from descriptions.
+    _portClasses = {'In': InputPort, 'Out': OutputPort, 'IO': IOPort}
+
     def __init__(self, graph, name):
         super(Node, self).__init__()
 
         self.__name = name
         self.__graph = graph
         self.__color = self.__defaultColor
+        self.__ports = []
+        self.__portsByName = {}
+        self.__portNames = []
+        self.__declaredPorts = {}
+        self.__shownPorts = set()
+        self.__collapseState = NODE_EXPANDED
+
+        self.__selected = False
+        self.__dragging = False
+        self.__levelOfDetail = LOD_FULL
+        self.__deferConnectionUpdates = False
+        self.__portRects = None
 
         self.setMinimumWidth(60)
         self.setMinimumHeight(20)
         self.setSizePolicy(QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding))
 
+        self._initContents()
+
+    # Builds the child items displaying the title and the ports.
+    def _initContents(self):
         layout = QtWidgets.QGraphicsLinearLayout()
         layout.setContentsMargins(5, 0, 5, 7)
         layout.setSpacing(7)
@@ -129,7 +175,6 @@ class Node(QtWidgets.QGraphicsWidget):
         layout.addItem(self.__headerItem)
         layout.setAlignment(self.__headerItem, QtCore.Qt.AlignCenter | QtCore.Qt.AlignTop)
 
-        self.__ports = []
         self.__inputPortsHolder = PortList(self)
         self.__ioPortsHolder = PortList(self)
         self.__outputPortsHolder = PortList(self)
@@ -138,9 +183,6 @@ class Node(QtWidgets.QGraphicsWidget):
         layout.addItem(self.__ioPortsHolder)
         layout.addItem(self.__outputPortsHolder)
 
-        self.__selected = False
-        self.__dragging = False
-
     # =====
     # Name
     # =====
@@ -151,7 +193,7 @@ class Node(QtWidgets.QGraphicsWidget):
         if name != self.__name:
             origName = self.__name
             self.__name = name
-            self.__headerItem.setText(self.__name)
+            self._setTitle(self.__name)
 
             # Emit an event, so that the graph can update itsself.
             self.nameChanged.emit(origName, name)
@@ -159,6 +201,9 @@ class Node(QtWidgets.QGraphicsWidget):
             # Update the node so that the size is computed.
             self.adjustSize()
 
+    def _setTitle(self, text):
+        self.__headerItem.setText(text)
+
     # =======
     # Colors
     # =======
@@ -198,6 +243,10 @@ class Node(QtWidgets.QGraphicsWidget):
         return self.__headerItem
 
 
+    def getTitleHeight(self):
+        return self.__headerItem.size().height() - 3
+
+
     # ==========
     # Selection
     # ==========
@@ -210,24 +259,108 @@ class Node(QtWidgets.QGraphicsWidget):
         self.update()
 
 
+    # ================
+    # Level of Detail
+    # ================
+    def getLevelOfDetail(self):
+        return self.__levelOfDetail
+
+    def setLevelOfDetail(self, lod):
+        if lod == self.__levelOfDetail:
+            return
+        self.__levelOfDetail = lod
+        self._applyLevelOfDetail(lod)
+        self.update()
+
+    def _applyLevelOfDetail(self, lod):
+        # At far zoom the node is drawn as a plain rect without any children.
+        # Items are hidden through their opacity, which the scene skips when
+        # painting and hit testing, so that the layouts are left untouched.
+        childOpacity = 0.0 if lod == LOD_FAR else 1.0
+        self.__headerItem.setOpacity(childOpacity)
+        self.__inputPortsHolder.setOpacity(childOpacity)
+        self.__ioPortsHolder.setOpacity(childOpacity)
+        self.__outputPortsHolder.setOpacity(childOpacity)
+
+        labelOpacity = 1.0 if lod == LOD_FULL else 0.0
+        for port in self.__ports:
+            labelItem = port.labelItem()
+            if labelItem is not None:
+                labelItem.setOpacity(labelOpacity)
+
+
     #########################
     ## Graph Pos
 
+    # The graph position is the center of the node, moves made with translate
+    # add up in pos() on top of the transform.
     def getGraphPos(self):
         transform = self.transform()
         size = self.size()
-        return QtCore.QPointF(transform.dx()+(size.width()*0.5), transform.dy()+(size.height()*0.5))
+        pos = self.pos()
+        return QtCore.QPointF(pos.x()+transform.dx()+(size.width()*0.5), pos.y()+transform.dy()+(size.height()*0.5))
 
 
     def setGraphPos(self, graphPos):
-        self.prepareConnectionGeometryChange()
-        size = self.size()
-        self.setTransform(QtGui.QTransform.fromTranslate(graphPos.x()-(size.width()*0.5), graphPos.y()-(size.height()*0.5)), False)
+        self._setGraphPosDeferred(graphPos.x(), graphPos.y())
+        self.updateConnectionGeometry()
+        self.__graph._onNodeGeometryChanged(self)
 
 
     def translate(self, x, y):
-        self.prepareConnectionGeometryChange()
-        super(Node, self).moveBy(x, y)
+        # Moving through setGeometry would update the connections and the
+        # graph a second time.
+        self._moveByDeferred(x, y)
+        self.updateConnectionGeometry()
+        self.__graph._onNodeGeometryChanged(self)
+
+
+    # Sets the position without touching the connections or the graph's spatial index.
+    def _setGraphPosDeferred(self, x, y):
+        size = self.size()
+        pos = self.pos()
+        self.setTransform(QtGui.QTransform.fromTranslate(x-pos.x()-(size.width()*0.5), y-pos.y()-(size.height()*0.5)), False)
+
+
+    # Moves the node without touching its connections or the graph's spatial index.
+    # Used by the graph when it updates a whole selection in one pass.
+    def _moveByDeferred(self, x, y):
+        self.__deferConnectionUpdates = True
+        try:
+            super(Node, self).moveBy(x, y)
+        finally:
+            self.__deferConnectionUpdates = False
+
+
+    def setGeometry(self, rect):
+        # Layout passes set the same geometry again and again.
+        unchanged = rect == self.geometry()
+        super(Node, self).setGeometry(rect)
+        if unchanged or self.__deferConnectionUpdates:
+            return
+        self.updateConnectionGeometry()
+        self.__graph._onNodeGeometryChanged(self)
+
+
+    def event(self, event):
+        result = super(Node, self).event(event)
+
+        # The ports are laid out again, so the connections may need new paths.
+        # Qt also posts layout requests that leave everything in place, the
+        # paths are only rebuilt when a port actually moved.
+        if event.type() == QtCore.QEvent.LayoutRequest and self.__updatePortRects():
+            self.updateConnectionGeometry()
+
+        return result
+
+
+    # Records where the ports are, returns whether any of them moved.
+    def __updatePortRects(self):
+        portRects = [port.mapRectToItem(self, port.rect()) for port in self.__ports]
+        if portRects == self.__portRects:
+            return False
+        self.__portRects = portRects
+        return True
 
 
     # Prior to moving the node, we need to tell the connections to prepare for a geometry change.
@@ -241,32 +374,372 @@ class Node(QtWidgets.QGraphicsWidget):
                 for connection in port.outCircle().getConnections():
                     connection.prepareGeometryChange()
 
+    # After moving the node or laying out its ports, the connections rebuild their cached paths.
+    def updateConnectionGeometry(self):
+        for port in self.__ports:
+            if port.inCircle():
+                for connection in port.inCircle().getConnections():
+                    connection.updatePath()
+            if port.outCircle():
+                for connection in port.outCircle().getConnections():
+                    connection.updatePath()
+
     #########################
     ## Ports
 
     def addPort(self, port):
+        self.__ports.append(port)
+        self.__portsByName.setdefault(port.getName(), port)
+        self.__portNames.append(port.getName())
+        if self.__isPortShown(port):
+            self.__shownPorts.add(port)
+            self._layoutPort(port)
+        else:
+            self._hidePort(port, self.getShownPorts())
+        self.__graph._onNodePortAdded(self, port)
+        return port
+
+
+    def declarePort(self, name, connectionPointType, color, dataType):
+        """Declares a port whose items are only created once they are needed.
+
+        The port is created right away when the node shows it. Otherwise it is
+        created when the node is expanded, or when getPort asks for it, e.g. to
+        connect it.
+
+        Args:
+            name (str): Name of the port.
+            connectionPointType (str): 'In', 'Out' or 'IO'.
+            color (QColor): Color of the port.
+            dataType (str): Data type of the port.
+
+        """
+
+        self.declarePorts([(name, connectionPointType, color, dataType)])
+
+
+    def declarePorts(self, portDescs):
+        """Declares several ports, see declarePort.
+
+        The ports the node shows are laid out together, and the node is
+        resized once instead of once per port.
+
+        Args:
+            portDescs (list): (name, connectionPointType, color, dataType)
+                tuple of every port.
+
+        """
+
+        shownPorts = []
+        for (name, connectionPointType, color, dataType) in portDescs:
+            if self.hasPort(name):
+                raise Exception("Node '" + self.getName() + "' already has a port named '" + name + "'.")
+            if self.__collapseState != NODE_EXPANDED:
+                self.__declaredPorts[name] = (connectionPointType, color, dataType)
+                self.__portNames.append(name)
+                continue
+
+            # Expanded nodes show all their ports.
+            port = self.getPortClass(connectionPointType)(self, self.__graph, name, color, dataType)
+            self.__ports.append(port)
+            self.__portsByName.setdefault(name, port)
+            self.__portNames.append(name)
+            self.__shownPorts.add(port)
+            shownPorts.append(port)
+
+        if len(shownPorts) == 0:
+            return
+        self._layoutPorts(shownPorts)
+
+        # Lay the ports out now rather than on the next layout request, so
+        # that connections made right away get their final path.
+        layout = self.layout()
+        if layout is not None:
+            layout.activate()
+            if self.__updatePortRects():
+                self.updateConnectionGeometry()
+
+        for port in shownPorts:
+            self.__graph._onNodePortAdded(self, port)
+
+
+    # Creates a declared port, keeping the ports in their declared order.
+    def __createPort(self, name):
+        (connectionPointType, color, dataType) = self.__declaredPorts.pop(name)
+        port = self.getPortClass(connectionPointType)(self, self.__graph, name, color, dataType)
+        index = 0
+        for otherName in self.__portNames:
+            if otherName == name:
+                break
+            if otherName in self.__portsByName:
+                index += 1
+        self.__ports.insert(index, port)
+        self.__portsByName[name] = port
+        self.__graph._onNodePortAdded(self, port)
+        return port
+
+
+    # Adds the port's item to the node's layout.
+    def _layoutPort(self, port):
+        self._layoutPorts([port])
+
+
+    # Adds the items of several ports to the node's layout, resizing each
+    # port list and the node once.
+    def _layoutPorts(self, ports):
+        holderPorts = {}
+        for port in ports:
+            holderPorts.setdefault(self.__getPortHolder(port), []).append(port)
+            if self.__levelOfDetail != LOD_FULL and port.labelItem() is not None:
+                port.labelItem().setOpacity(0.0)
+        for (holder, portsOfHolder) in holderPorts.items():
+            holder.addPorts(portsOfHolder, QtCore.Qt.AlignHCenter | QtCore.Qt.AlignVCenter)
+        self.adjustSize()
+
+
+    def __getPortHolder(self, port):
         if isinstance(port, InputPort):
-            self.__inputPortsHolder.addPort(port, QtCore.Qt.AlignHCenter | QtCore.Qt.AlignVCenter)
+            return self.__inputPortsHolder
         elif isinstance(port, OutputPort):
-            self.__outputPortsHolder.addPort(port, QtCore.Qt.AlignHCenter | QtCore.Qt.AlignVCenter)
-        else:
-            self.__ioPortsHolder.addPort(port, QtCore.Qt.AlignHCenter | QtCore.Qt.AlignVCenter)
-        self.__ports.append(port)
+            return self.__outputPortsHolder
+        return self.__ioPortsHolder
+
+
+    # Adds the items of the shown ports to the node's layout again, in order,
+    # and hides the other ones.
+    def _reorderPorts(self, ports):
+        for holder in (self.__inputPortsHolder, self.__ioPortsHolder, self.__outputPortsHolder):
+            holder.clearPorts()
+        shownPorts = set(ports)
+        for port in self.__ports:
+            if port not in shownPorts:
+                port.setVisible(False)
+        for port in ports:
+            port.setVisible(True)
+        self._layoutPorts(ports)
+
+
+    # Inserts a port that was hidden into the layout. shownPorts lists all the
+    # shown ports in order, including this one.
+    def _showPort(self, port, shownPorts):
+        holder = self.__getPortHolder(port)
+        index = 0
+        for otherPort in shownPorts:
+            if otherPort is port:
+                break
+            if self.__getPortHolder(otherPort) is holder:
+                index += 1
+        port.setVisible(True)
+        holder.insertPort(index, port, QtCore.Qt.AlignHCenter | QtCore.Qt.AlignVCenter)
+        if self.__levelOfDetail != LOD_FULL and port.labelItem() is not None:
+            port.labelItem().setOpacity(0.0)
+        self.adjustSize()
+
+
+    # Takes a port out of the layout. shownPorts lists the ports still shown.
+    def _hidePort(self, port, shownPorts):
+        self.__getPortHolder(port).removePort(port)
+        port.setVisible(False)
         self.adjustSize()
-        return port
+
+
+    def setPortOrder(self, ports):
+        """Sets the order in which the ports are listed.
+
+        Input, IO and output ports stay in their own groups, only the order
+        within each group changes. Declared ports that were not created yet
+        keep their place.
+
+        Args:
+            ports (list): All the created ports of the node, in their new order.
+
+        """
+
+        if len(ports) != len(self.__ports) or set(ports) != set(self.__ports):
+            raise Exception("The new port order must list every port of node '" + self.getName() + "' once.")
+        self.__ports = list(ports)
+        names = iter([port.getName() for port in ports])
+        self.__portNames = [next(names) if name not in self.__declaredPorts else name for name in self.__portNames]
+        self._reorderPorts(self.getShownPorts())
+        self.updateConnectionGeometry()
+        self.update()
 
 
     def getPort(self, name):
-        for port in self.__ports:
-            if port.getName() == name:
-                return port
-        return None
+        """Gets a port by name, creating it if it was only declared.
+
+        Args:
+            name (str): Name of the port.
+
+        Returns:
+            BasePort: The port, None if the node has no such port.
+
+        """
+
+        port = self.__portsByName.get(name)
+        if port is None and name in self.__declaredPorts:
+            port = self.__createPort(name)
+            if self.__isPortShown(port):
+                self.__shownPorts.add(port)
+                self._showPort(port, self.getShownPorts())
+            else:
+                self._hidePort(port, self.getShownPorts())
+        return port
+
+
+    def hasPort(self, name):
+        return name in self.__portsByName or name in self.__declaredPorts
+
+
+    # Gets the created ports, the declared ones that are not needed yet are left out.
+    def getPorts(self):
+        return self.__ports
+
+
+    def getPortNames(self):
+        return list(self.__portNames)
+
+
+    def getPortDescs(self):
+        """Gets all the ports of the node, created or only declared, in order.
+
+        Returns:
+            list: (name, connectionPointType, color, dataType) tuples.
+
+        """
+
+        result = []
+        for name in self.__portNames:
+            port = self.__portsByName.get(name)
+            if port is None:
+                (connectionPointType, color, dataType) = self.__declaredPorts[name]
+                result.append((name, connectionPointType, color, dataType))
+            else:
+                result.append((name, port.connectionPointType(), port.getColor(), port.getDataType()))
+        return result
+
+
+    def getShownPorts(self):
+        return [port for port in self.__ports if port in self.__shownPorts]
+
+
+    def isPortShown(self, port):
+        return port in self.__shownPorts
 
 
+    def getPortProxyPos(self, connectionPointType):
+        """Gets where the connections of hidden ports end, in the node's coordinates.
+
+        Args:
+            connectionPointType (str): 'In' for the left edge, 'Out' for the right one.
+
+        Returns:
+            QPointF: Middle of the header on that edge.
+
+        """
+
+        y = self.getTitleHeight() * 0.5
+        if connectionPointType == 'In':
+            return QtCore.QPointF(0, y)
+        return QtCore.QPointF(self.size().width(), y)
+
+
+    @classmethod
+    def getPortClass(cls, connectionPointType):
+        """Gets the port class to use with this node class.
+
+        Args:
+            connectionPointType (str): 'In', 'Out' or 'IO'.
+
+        Returns:
+            type: Port class to instantiate.
+
+        """
+
+        return cls._portClasses[connectionPointType]
+
+
+    #########################
+    ## Collapse
+
+    def getCollapseState(self):
+        return self.__collapseState
+
+
+    def isCollapsed(self):
+        return self.__collapseState != NODE_EXPANDED
+
+
+    def setCollapseState(self, state):
+        """Sets which ports the node shows.
+
+        Expanding the node creates all its declared ports. The connections of
+        hidden ports end in the middle of the header's left or right edge.
+
+        Args:
+            state (int): NODE_EXPANDED, NODE_COLLAPSED_TO_CONNECTED or NODE_COLLAPSED.
+
+        """
+
+        if state not in (NODE_EXPANDED, NODE_COLLAPSED_TO_CONNECTED, NODE_COLLAPSED):
+            raise Exception("Invalid collapse state: " + str(state))
+        if state == self.__collapseState:
+            return
+        self.__collapseState = state
+        if state == NODE_EXPANDED:
+            for name in list(self.__portNames):
+                if name in self.__declaredPorts:
+                    self.__createPort(name)
+
+        shownPorts = [port for port in self.__ports if self.__isPortShown(port)]
+        self.__shownPorts = set(shownPorts)
+        self._reorderPorts(shownPorts)
+        self.updateConnectionGeometry()
+        self.update()
+        self.__graph._onNodeCollapseStateChanged(self)
+
+
+    def __isPortShown(self, port):
+        if self.__collapseState == NODE_EXPANDED:
+            return True
+        if self.__collapseState == NODE_COLLAPSED:
+            return False
+        for circle in (port.inCircle(), port.outCircle()):
+            if circle is not None and len(circle.getConnections()) > 0:
+                return True
+        return False
+
+
+    # Called by the port circles when they gain or lose a connection, nodes
+    # collapsed to their connected ports show or hide the port.
+    def _onPortConnectionsChanged(self, port):
+        if self.__collapseState != NODE_COLLAPSED_TO_CONNECTED:
+            return
+        shown = self.__isPortShown(port)
+        if shown == (port in self.__shownPorts):
+            return
+        if shown:
+            self.__shownPorts.add(port)
+            self._showPort(port, self.getShownPorts())
+        else:
+            self.__shownPorts.discard(port)
+            self._hidePort(port, self.getShownPorts())
+        self.updateConnectionGeometry()
+
+
+    @profiledPaint
     def paint(self, painter, option, widget):
         rect = self.windowFrameRect()
         painter.setBrush(self.__color)
 
+        if self.__levelOfDetail == LOD_FAR:
+            if self.__selected:
+                painter.setPen(self.__selectedPen)
+            else:
+                painter.setPen(self.__unselectedPen)
+            painter.drawRect(rect)
+            return
+
         painter.setPen(QtGui.QPen(QtGui.QColor(0, 0, 0, 0), 0))
 
         roundingY = 10
@@ -275,12 +748,12 @@ class Node(QtWidgets.QGraphicsWidget):
         painter.drawRoundedRect(rect, roundingX, roundingY)
 
         # Title BG
-        titleHeight = self.__headerItem.size().height() - 3
+        titleHeight = self.getTitleHeight()
 
         painter.setBrush(self.__color.darker(125))
         roundingY = rect.width() * roundingX / titleHeight
-        painter.drawRoundedRect(0, 0, rect.width(), titleHeight, roundingX, roundingY, QtCore.Qt.AbsoluteSize)
-        painter.drawRect(0, titleHeight * 0.5 + 2, rect.width(), titleHeight * 0.5)
+        painter.drawRoundedRect(QtCore.QRectF(0, 0, rect.width(), titleHeight), roundingX, roundingY, QtCore.Qt.AbsoluteSize)
+        painter.drawRect(QtCore.QRectF(0, titleHeight * 0.5 + 2, rect.width(), titleHeight * 0.5))
 
         painter.setBrush(QtGui.QColor(0, 0, 0, 0))
         if self.__selected:
@@ -303,16 +776,16 @@ class Node(QtWidgets.QGraphicsWidget):
             modifiers = event.modifiers()
             if modifiers == QtCore.Qt.ControlModifier:
                 if not self.isSelected():
-                    self.__graph.selectNode(self, clearSelection=False)
+                    self.__graph.selectNode(self, clearSelection=False, recordUndo=True)
                 else:
-                    self.__graph.deselectNode(self)
+                    self.__graph.deselectNode(self, recordUndo=True)
 
             elif modifiers == QtCore.Qt.ShiftModifier:
                 if not self.isSelected():
-                    self.__graph.selectNode(self, clearSelection=False)
+                    self.__graph.selectNode(self, clearSelection=False, recordUndo=True)
             else:
                 if not self.isSelected():
-                    self.__graph.selectNode(self, clearSelection=True)
+                    self.__graph.selectNode(self, clearSelection=True, recordUndo=True)
 
                 self.__dragging = True
                 self._mouseDownPoint = self.mapToScene(event.pos())
@@ -326,8 +799,15 @@ class Node(QtWidgets.QGraphicsWidget):
 
     def mouseMoveEvent(self, event):
         if self.__dragging:
-            newPos = self.mapToScene(event.pos())
+            # The moves are applied once per frame, with the delta accumulated since the last one.
+            scenePos = event.scenePos()
+            self.__graph.queueManipulation(lambda: self.__dragTo(scenePos))
+        else:
+            super(Node, self).mouseMoveEvent(event)
+
 
+    def __dragTo(self, newPos):
+        if self.__dragging:
             graph = self.getGraph()
             if graph.getSnapToGrid() is True:
                 gridSize = graph.getGridSize()
@@ -343,18 +823,20 @@ class Node(QtWidgets.QGraphicsWidget):
                 newPos = newPos + newPosOffset
 
             delta = newPos - self._lastDragPoint
+            if not self._nodesMoved:
+                self.__graph.beginMoveSelectedNodes()
             self.__graph.moveSelectedNodes(delta)
             self._lastDragPoint = newPos
             self._nodesMoved = True
-        else:
-            super(Node, self).mouseMoveEvent(event)
 
 
     def mouseReleaseEvent(self, event):
         if self.__dragging:
+            self.__graph.flushManipulation()
             if self._nodesMoved:
 
-                newPos = self.mapToScene(event.pos())
+                # The node moved since the event was mapped to it.
+                newPos = event.scenePos()
 
                 delta = newPos - self._mouseDownPoint
                 self.__graph.endMoveSelectedNodes(delta)
@@ -365,6 +847,17 @@ class Node(QtWidgets.QGraphicsWidget):
             super(Node, self).mouseReleaseEvent(event)
 
 
+    # Double clicking a node shows or hides its unconnected ports.
+    def mouseDoubleClickEvent(self, event):
+        if event.button() == QtCore.Qt.LeftButton:
+            if self.isCollapsed():
+                self.setCollapseState(NODE_EXPANDED)
+            else:
+                self.setCollapseState(NODE_COLLAPSED_TO_CONNECTED)
+        else:
+            super(Node, self).mouseDoubleClickEvent(event)
+
+
     #########################
     ## shut down
 
@@ -5,27 +5,20 @@
 
 import json
 from qtpy import QtGui, QtWidgets, QtCore
+from .text_cache import getStaticText, getTextSize
+from .profiler import profiledPaint
 
 
 class PortLabel(QtWidgets.QGraphicsWidget):
     __font = QtGui.QFont('Decorative', 12)
-    __fontMetrics = QtGui.QFontMetrics(__font)
 
     def __init__(self, port, text, hOffset, color, highlightColor):
         super(PortLabel, self).__init__(port)
         self.__port = port
         self.__text = text
-        self.__textItem = QtWidgets.QGraphicsTextItem(text, self)
         self._labelColor = color
+        self.__color = color
         self.__highlightColor = highlightColor
-        self.__textItem.setDefaultTextColor(self._labelColor)
-        self.__textItem.setFont(self.__font)
-        self.__textItem.transform().translate(0, self.__font.pointSizeF() * -0.5)
-        option = self.__textItem.document().defaultTextOption()
-        option.setWrapMode(QtGui.QTextOption.NoWrap)
-        self.__textItem.document().setDefaultTextOption(option)
-        self.__textItem.document().setDocumentMargin(0)
-        self.__textItem.adjustSize()
 
         self.setPreferredSize(self.textSize())
         self.setSizePolicy(QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Fixed))
@@ -44,15 +37,19 @@ class PortLabel(QtWidgets.QGraphicsWidget):
 
 
     def setColor(self, color):
-        self.__textItem.setDefaultTextColor(color)
+        self.__color = color
         self.update()
 
 
     def textSize(self):
-        return QtCore.QSizeF(
-            self.__fontMetrics.width(self.__text),
-            self.__fontMetrics.height()
-            )
+        return getTextSize(self.__text, self.__font)
+
+
+    @profiledPaint
+    def paint(self, painter, option, widget):
+        painter.setFont(self.__font)
+        painter.setPen(self.__color)
+        painter.drawStaticText(QtCore.QPointF(0, 0), getStaticText(self.__text, self.__font))
 
 
     def getPort(self):
@@ -95,99 +92,21 @@ class PortLabel(QtWidgets.QGraphicsWidget):
             if self.__port.outCircle() is not None:
                 self.__port.outCircle().mousePressEvent(event)
 
-    # def paint(self, painter, option, widget):
-    #     super(PortLabel, self).paint(painter, option, widget)
-    #     painter.setPen(QtGui.QPen(QtGui.QColor(0, 0, 255)))
-    #     painter.drawRect(self.windowFrameRect())
 
+class ConnectionPoint(object):
+    """Connection rules shared by PortCircle and FlatPortCircle.
 
-class PortCircle(QtWidgets.QGraphicsWidget):
+    Classes using it call _initConnectionPoint from their constructor and
+    provide getPort.
 
-    __radius = 4.5
-    __diameter = 2 * __radius
+    """
 
-    def __init__(self, port, graph, hOffset, color, connectionPointType):
-        super(PortCircle, self).__init__(port)
-
-        self.__port = port
+    def _initConnectionPoint(self, graph, connectionPointType):
         self._graph = graph
         self._connectionPointType = connectionPointType
         self.__connections = set()
         self._supportsOnlySingleConnections = connectionPointType == 'In'
 
-        self.setSizePolicy(QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Fixed))
-        size = QtCore.QSizeF(self.__diameter, self.__diameter)
-        self.setPreferredSize(size)
-        self.setWindowFrameMargins(0, 0, 0, 0)
-
-        self.transform().translate(self.__radius * hOffset, 0)
-
-        self.__defaultPen = QtGui.QPen(QtGui.QColor(25, 25, 25), 1.0)
-        self.__hoverPen = QtGui.QPen(QtGui.QColor(255, 255, 100), 1.5)
-
-        self._ellipseItem = QtWidgets.QGraphicsEllipseItem(self)
-        self._ellipseItem.setPen(self.__defaultPen)
-        self._ellipseItem.setPos(size.width()/2, size.height()/2)
-        self._ellipseItem.setRect(
-            -self.__radius,
-            -self.__radius,
-            self.__diameter,
-            self.__diameter,
-            )
-        if connectionPointType == 'In':
-            self._ellipseItem.setStartAngle(270 * 16)
-            self._ellipseItem.setSpanAngle(180 * 16)
-
-        self.setColor(color)
-        self.setAcceptHoverEvents(True)
-
-    def getPort(self):
-        return self.__port
-
-
-    def getColor(self):
-        return self.getPort().getColor()
-
-
-    def centerInSceneCoords(self):
-        return self._ellipseItem.mapToScene(0, 0)
-
-
-    def setColor(self, color):
-        self._color = color
-        self._ellipseItem.setBrush(QtGui.QBrush(self._color))
-
-
-    def setDefaultPen(self, pen):
-        self.__defaultPen = pen
-        self._ellipseItem.setPen(self.__defaultPen)
-
-
-    def setHoverPen(self, pen):
-        self.__hoverPen = pen
-
-
-    def highlight(self):
-        self._ellipseItem.setBrush(QtGui.QBrush(self._color.lighter()))
-        # make the port bigger to highlight it can accept the connection.
-        self._ellipseItem.setRect(
-            -self.__radius * 1.3,
-            -self.__radius * 1.3,
-            self.__diameter * 1.3,
-            self.__diameter * 1.3,
-            )
-
-
-    def unhighlight(self):
-        self._ellipseItem.setBrush(QtGui.QBrush(self._color))
-        self._ellipseItem.setRect(
-            -self.__radius,
-            -self.__radius,
-            self.__diameter,
-            self.__diameter,
-            )
-
-
     # ===================
     # Connection Methods
     # ===================
@@ -215,12 +134,19 @@ class PortCircle(QtWidgets.QGraphicsWidget):
             return False
 
         # Check if you're trying to connect to a port on the same node.
-        # TODO: Do propper cycle checking..
         otherPort = otherPortCircle.getPort()
         port = self.getPort()
         if otherPort.getNode() == port.getNode():
             return False
 
+        # Check that the connection would not close a cycle.
+        if self.isInConnectionPoint():
+            cycle = self._graph.wouldCreateCycle(otherPort.getNode(), port.getNode())
+        else:
+            cycle = self._graph.wouldCreateCycle(port.getNode(), otherPort.getNode())
+        if cycle:
+            return False
+
         return True
 
     def addConnection(self, connection):
@@ -242,6 +168,7 @@ class PortCircle(QtWidgets.QGraphicsWidget):
                 self._graph.removeConnection(c)
 
         self.__connections.add(connection)
+        self.__notifyNode()
 
         return True
 
@@ -254,9 +181,16 @@ class PortCircle(QtWidgets.QGraphicsWidget):
         """
 
         self.__connections.remove(connection)
+        self.__notifyNode()
 
         return True
 
+    def __notifyNode(self):
+        # The circle of a MouseGrabber has no port.
+        port = self.getPort()
+        if port is not None:
+            port.getNode()._onPortConnectionsChanged(port)
+
     def getConnections(self):
         """Gets the ports connections list.
         Return:
@@ -265,6 +199,96 @@ class PortCircle(QtWidgets.QGraphicsWidget):
 
         return self.__connections
 
+
+class PortCircle(QtWidgets.QGraphicsWidget, ConnectionPoint):
+
+    __radius = 4.5
+    __diameter = 2 * __radius
+
+    def __init__(self, port, graph, hOffset, color, connectionPointType):
+        super(PortCircle, self).__init__(port)
+
+        self.__port = port
+        self._initConnectionPoint(graph, connectionPointType)
+
+        self.setSizePolicy(QtWidgets.QSizePolicy(QtWidgets.QSizePolicy.Fixed, QtWidgets.QSizePolicy.Fixed))
+        size = QtCore.QSizeF(self.__diameter, self.__diameter)
+        self.setPreferredSize(size)
+        self.setWindowFrameMargins(0, 0, 0, 0)
+
+        self.transform().translate(self.__radius * hOffset, 0)
+
+        self.__defaultPen = QtGui.QPen(QtGui.QColor(25, 25, 25), 1.0)
+        self.__hoverPen = QtGui.QPen(QtGui.QColor(255, 255, 100), 1.5)
+
+        self._ellipseItem = QtWidgets.QGraphicsEllipseItem(self)
+        self._ellipseItem.setPen(self.__defaultPen)
+        self._ellipseItem.setPos(size.width()/2, size.height()/2)
+        self._ellipseItem.setRect(
+            -self.__radius,
+            -self.__radius,
+            self.__diameter,
+            self.__diameter,
+            )
+        if connectionPointType == 'In':
+            self._ellipseItem.setStartAngle(270 * 16)
+            self._ellipseItem.setSpanAngle(180 * 16)
+
+        self.setColor(color)
+        self.setAcceptHoverEvents(True)
+
+    def getPort(self):
+        return self.__port
+
+
+    def getColor(self):
+        return self.getPort().getColor()
+
+
+    def centerInSceneCoords(self):
+        # The connections of the ports a collapsed node hides end on the node.
+        if self.__port is not None:
+            node = self.__port.getNode()
+            if not node.isPortShown(self.__port):
+                return node.mapToScene(node.getPortProxyPos(self._connectionPointType))
+        return self._ellipseItem.mapToScene(0, 0)
+
+
+    def setColor(self, color):
+        self._color = color
+        self._ellipseItem.setBrush(QtGui.QBrush(self._color))
+
+
+    def setDefaultPen(self, pen):
+        self.__defaultPen = pen
+        self._ellipseItem.setPen(self.__defaultPen)
+
+
+    def setHoverPen(self, pen):
+        self.__hoverPen = pen
+
+
+    def highlight(self):
+        self._ellipseItem.setBrush(QtGui.QBrush(self._color.lighter()))
+        # make the port bigger to highlight it can accept the connection.
+        self._ellipseItem.setRect(
+            -self.__radius * 1.3,
+            -self.__radius * 1.3,
+            self.__diameter * 1.3,
+            self.__diameter * 1.3,
+            )
+
+
+    def unhighlight(self):
+        self._ellipseItem.setBrush(QtGui.QBrush(self._color))
+        self._ellipseItem.setRect(
+            -self.__radius,
+            -self.__radius,
+            self.__diameter,
+            self.__diameter,
+            )
+
+
     # ======
     # Events
     # ======
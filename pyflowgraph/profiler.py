@@ -0,0 +1,214 @@
+#
+# Copyright 2015-2017 Eric Thivierge
+#
+
+import time
+import functools
+import collections
+
+from qtpy import QtCore
+
+# Profiler of the graph view handling the current event, None when profiling
+# is disabled. Instrumented code only compares it with None.
+_activeProfiler = None
+
+_eventTypeNames = {}
+
+
+def setActiveProfiler(profiler):
+    """Sets the profiler the instrumented code records into.
+
+    Args:
+        profiler (Profiler): The profiler, or None to stop recording.
+
+    Returns:
+        Profiler: The previous profiler.
+
+    """
+
+    global _activeProfiler
+    previous = _activeProfiler
+    _activeProfiler = profiler
+    return previous
+
+
+def getEventTypeName(eventType):
+    """Gets the name of a QEvent type, e.g. 'MouseMove'.
+
+    Args:
+        eventType (QEvent.Type): Type of the event.
+
+    Returns:
+        str: Name of the type, or its number for unknown types.
+
+    """
+
+    if len(_eventTypeNames) == 0:
+        for name in dir(QtCore.QEvent):
+            value = getattr(QtCore.QEvent, name)
+            if isinstance(value, QtCore.QEvent.Type):
+                _eventTypeNames.setdefault(int(value), name)
+    return _eventTypeNames.get(int(eventType), str(int(eventType)))
+
+
+def profiled(section):
+    """Decorates a function so that its time is recorded under a section name.
+
+    Args:
+        section (str): Name the time is recorded under.
+
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            profiler = _activeProfiler
+            if profiler is None:
+                return function(*args, **kwargs)
+            profiler.beginSection(section)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.endSection()
+        return wrapper
+    return decorator
+
+
+def profiledPaint(paint):
+    """Decorates a paint method so that its time is recorded under the class name of the item.
+
+    The paint methods of base classes called through super are counted as part
+    of the same item.
+
+    """
+
+    @functools.wraps(paint)
+    def wrapper(self, painter, option, widget):
+        profiler = _activeProfiler
+        if profiler is None or profiler.getCurrentItem() is self:
+            return paint(self, painter, option, widget)
+        profiler.beginSection(type(self).__name__, self)
+        try:
+            return paint(self, painter, option, widget)
+        finally:
+            profiler.endSection()
+    return wrapper
+
+
+class Profiler(object):
+    """Timings of the frames painted by a graph view.
+
+    Each frame records the paint time per section: the class name of the items
+    painted by Python, 'background', 'textLayout', and 'other' for the rest of
+    the frame, i.e. the items Qt paints by itself such as the connections and
+    port circles. Times are exclusive, the text laid out while painting a node
+    only counts as 'textLayout'. Each frame also holds the number of items in
+    the painted area per class, and the durations of the events and the counts
+    of the signals since the previous frame.
+
+    """
+
+    def __init__(self, historySize=300):
+        super(Profiler, self).__init__()
+        self.__frames = collections.deque(maxlen=historySize)
+        self.__stack = []
+        self.__frameStart = None
+        self.__events = {}
+        self.__signals = {}
+        self.__sections = {}
+
+    def clear(self):
+        self.__frames.clear()
+        self.__events = {}
+        self.__signals = {}
+
+    def getFrames(self):
+        return list(self.__frames)
+
+    def getLastFrame(self):
+        if len(self.__frames) == 0:
+            return None
+        return self.__frames[-1]
+
+    def getCurrentItem(self):
+        if len(self.__stack) == 0:
+            return None
+        return self.__stack[-1][1]
+
+    def beginSection(self, name, item=None):
+        self.__stack.append([name, item, time.time(), 0.0])
+
+    def endSection(self):
+        (name, item, start, childTime) = self.__stack.pop()
+        elapsed = time.time() - start
+        record = self.__sections.get(name)
+        if record is None:
+            record = self.__sections[name] = {'seconds': 0.0, 'count': 0}
+        record['seconds'] += elapsed - childTime
+        record['count'] += 1
+        if len(self.__stack) > 0:
+            self.__stack[-1][3] += elapsed
+        return elapsed
+
+    def addEvent(self, name, seconds):
+        record = self.__events.get(name)
+        if record is None:
+            record = self.__events[name] = {'seconds': 0.0, 'count': 0}
+        record['seconds'] += seconds
+        record['count'] += 1
+
+    def countSignal(self, name):
+        self.__signals[name] = self.__signals.get(name, 0) + 1
+
+    def beginFrame(self):
+        self.__sections = {}
+        self.__frameStart = time.time()
+        self.beginSection('other')
+
+    def endFrame(self):
+        """Ends the frame started by beginFrame.
+
+        Returns:
+            dict: The frame, with its 'start' time, total 'seconds', and the
+            'paint', 'events' and 'signals' records. The caller adds the
+            'items' counts.
+
+        """
+
+        # Sections left open by an exception are closed with the frame.
+        while len(self.__stack) > 0:
+            self.endSection()
+        frame = {
+            'start': self.__frameStart,
+            'seconds': time.time() - self.__frameStart,
+            'paint': self.__sections,
+            'items': {},
+            'events': self.__events,
+            'signals': self.__signals
+            }
+        self.__frames.append(frame)
+        self.__sections = {}
+        self.__events = {}
+        self.__signals = {}
+        return frame
+
+    def getSummary(self):
+        """Sums the records of all the frames kept.
+
+        Returns:
+            dict: 'frames' count, total 'seconds', and the summed 'paint',
+            'events' and 'signals' records.
+
+        """
+
+        summary = {'frames': len(self.__frames), 'seconds': 0.0, 'paint': {}, 'events': {}, 'signals': {}}
+        for frame in self.__frames:
+            summary['seconds'] += frame['seconds']
+            for key in ('paint', 'events'):
+                for (name, record) in frame[key].items():
+                    total = summary[key].setdefault(name, {'seconds': 0.0, 'count': 0})
+                    total['seconds'] += record['seconds']
+                    total['count'] += record['count']
+            for (name, count) in frame['signals'].items():
+                summary['signals'][name] = summary['signals'].get(name, 0) + count
+        return summary
@@ -4,6 +4,7 @@
 #
 
 from qtpy import QtGui, QtWidgets, QtCore
+from .profiler import profiledPaint
 
 
 class SelectionRect(QtWidgets.QGraphicsWidget):
@@ -33,6 +34,7 @@ class SelectionRect(QtWidgets.QGraphicsWidget):
         self.resize(bottomRight.x() - topLeft.x(), bottomRight.y() - topLeft.y())
 
 
+    @profiledPaint
     def paint(self, painter, option, widget):
         rect = self.windowFrameRect()
         painter.setBrush(self.__backgroundColor)
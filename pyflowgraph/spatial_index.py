@@ -0,0 +1,159 @@
+#
+# Copyright 2015-2017 Eric Thivierge
+#
+
+import math
+
+from qtpy import QtCore
+
+
+class SpatialIndex(object):
+    """Uniform grid over the scene bounds of a set of items.
+
+    Items are bucketed into every grid cell their rectangle overlaps, so
+    rectangle queries only need to visit the cells covering the query.
+
+    """
+
+    def __init__(self, cellSize=300.0):
+        super(SpatialIndex, self).__init__()
+        self.__cellSize = float(cellSize)
+        self.__cells = {}
+        self.__items = {}
+
+    def getCellSize(self):
+        return self.__cellSize
+
+    def __len__(self):
+        return len(self.__items)
+
+    def __contains__(self, item):
+        return item in self.__items
+
+    def __cellRange(self, rect):
+        cellSize = self.__cellSize
+        return (
+            int(math.floor(rect.left() / cellSize)),
+            int(math.floor(rect.top() / cellSize)),
+            int(math.floor(rect.right() / cellSize)),
+            int(math.floor(rect.bottom() / cellSize))
+            )
+
+    def insert(self, item, rect):
+        """Adds or updates the rectangle of an item.
+
+        Args:
+            item (object): Item to store in the index.
+            rect (QRectF): Bounds of the item in scene coordinates.
+
+        """
+
+        cellRange = self.__cellRange(rect)
+        entry = self.__items.get(item)
+        if entry is not None:
+            if entry[1] == cellRange:
+                self.__items[item] = (QtCore.QRectF(rect), cellRange)
+                return
+            self.remove(item)
+
+        self.__items[item] = (QtCore.QRectF(rect), cellRange)
+        (x0, y0, x1, y1) = cellRange
+        cells = self.__cells
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                cell = cells.get((x, y))
+                if cell is None:
+                    cells[(x, y)] = set([item])
+                else:
+                    cell.add(item)
+
+    def remove(self, item):
+        entry = self.__items.pop(item, None)
+        if entry is None:
+            return
+
+        (x0, y0, x1, y1) = entry[1]
+        cells = self.__cells
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                cell = cells[(x, y)]
+                cell.discard(item)
+                if len(cell) == 0:
+                    del cells[(x, y)]
+
+    def clear(self):
+        self.__cells = {}
+        self.__items = {}
+
+    def getRect(self, item):
+        entry = self.__items.get(item)
+        if entry is None:
+            return None
+        return entry[0]
+
+    def items(self):
+        return self.__items.keys()
+
+    def query(self, rect):
+        """Gets the items whose rectangle intersects the given rectangle.
+
+        Args:
+            rect (QRectF): Query rectangle in scene coordinates.
+
+        Returns:
+            set: Items intersecting the rectangle.
+
+        """
+
+        result = set()
+        (x0, y0, x1, y1) = self.__cellRange(rect)
+        cells = self.__cells
+        items = self.__items
+        for x in range(x0, x1 + 1):
+            for y in range(y0, y1 + 1):
+                cell = cells.get((x, y))
+                if cell is None:
+                    continue
+                for item in cell:
+                    if item not in result and items[item][0].intersects(rect):
+                        result.add(item)
+        return result
+
+    def queryChanged(self, oldRect, newRect):
+        """Gets the items that may have entered or left a rectangle which changed
+        from oldRect to newRect.
+
+        Cells lying completely inside both rectangles are skipped, so the cost is
+        proportional to the perimeter of the change rather than its area.
+
+        Args:
+            oldRect (QRectF): Previous query rectangle.
+            newRect (QRectF): New query rectangle.
+
+        Returns:
+            set: Candidate items. The caller has to test them against newRect.
+
+        """
+
+        result = set()
+        cells = self.__cells
+        cellSize = self.__cellSize
+        (x0, y0, x1, y1) = self.__cellRange(oldRect.united(newRect))
+
+        # Range of cells that are completely covered by both rectangles.
+        inner = oldRect.intersected(newRect)
+        ix0 = int(math.ceil(inner.left() / cellSize))
+        iy0 = int(math.ceil(inner.top() / cellSize))
+        ix1 = int(math.floor(inner.right() / cellSize)) - 1
+        iy1 = int(math.floor(inner.bottom() / cellSize)) - 1
+
+        for y in range(y0, y1 + 1):
+            if iy0 <= y <= iy1 and ix0 <= ix1:
+                xs = list(range(x0, ix0)) + list(range(ix1 + 1, x1 + 1))
+            else:
+                xs = range(x0, x1 + 1)
+            for x in xs:
+                cell = cells.get((x, y))
+                if cell is not None:
+                    result.update(cell)
+        return result
@@ -0,0 +1,120 @@
+#
+# Copyright 2015-2017 Eric Thivierge
+#
+
+import collections
+
+from qtpy import QtGui, QtCore
+from .profiler import profiled
+
+# Labels repeat a small vocabulary, so the laid out text and its size are shared
+# by every item drawing the same text with the same font. The least recently
+# used entries are dropped beyond _maxCachedTexts, so that graphs with many
+# unique titles do not grow the caches forever.
+_maxCachedTexts = 5000
+_staticTexts = collections.OrderedDict()
+_textSizes = collections.OrderedDict()
+_fontMetrics = {}
+
+
+def _getFontKey(font):
+    # QFont.key leaves out the spacing and capitalization, which change the
+    # layout of the text.
+    return (
+        font.key(),
+        int(font.letterSpacingType()),
+        font.letterSpacing(),
+        font.wordSpacing(),
+        int(font.capitalization()),
+        font.stretch()
+        )
+
+
+def _getCached(cache, key):
+    value = cache.pop(key, None)
+    if value is not None:
+        # Moved back to the end, as the most recently used.
+        cache[key] = value
+    return value
+
+
+def _addCached(cache, key, value):
+    cache[key] = value
+    if len(cache) > _maxCachedTexts:
+        cache.popitem(last=False)
+
+
+def getStaticText(text, font):
+    """Gets the shared, pre-laid-out static text for a string.
+
+    The text is drawn with the pen of the painter, so the color is not part of
+    the cached data.
+
+    Args:
+        text (str): Text to draw.
+        font (QFont): Font used to draw the text.
+
+    Returns:
+        QStaticText: Static text to draw with QPainter.drawStaticText.
+
+    """
+
+    key = (_getFontKey(font), text)
+    staticText = _getCached(_staticTexts, key)
+    if staticText is None:
+        staticText = _layoutStaticText(text, font)
+        _addCached(_staticTexts, key, staticText)
+    return staticText
+
+
+# Only cache misses lay out text, they are timed when profiling.
+@profiled('textLayout')
+def _layoutStaticText(text, font):
+    staticText = QtGui.QStaticText(text)
+    staticText.setTextFormat(QtCore.Qt.PlainText)
+    staticText.setPerformanceHint(QtGui.QStaticText.AggressiveCaching)
+    staticText.prepare(QtGui.QTransform(), font)
+    return staticText
+
+
+def getTextSize(text, font):
+    """Gets the size of a single line of text.
+
+    Args:
+        text (str): Text to measure.
+        font (QFont): Font used to draw the text.
+
+    Returns:
+        QSizeF: Advance width and line height of the text.
+
+    """
+
+    fontKey = _getFontKey(font)
+    key = (fontKey, text)
+    size = _getCached(_textSizes, key)
+    if size is None:
+        size = _measureText(text, font, fontKey)
+        _addCached(_textSizes, key, size)
+    return QtCore.QSizeF(size)
+
+
+@profiled('textLayout')
+def _measureText(text, font, fontKey):
+    fontMetrics = _fontMetrics.get(fontKey)
+    if fontMetrics is None:
+        fontMetrics = QtGui.QFontMetricsF(font)
+        _fontMetrics[fontKey] = fontMetrics
+    return QtCore.QSizeF(fontMetrics.width(text), fontMetrics.height())
+
+
+def clearTextCache():
+    """Releases all cached static texts and measurements.
+
+    The caches are bounded, this releases their memory right away, e.g. after
+    closing a large graph.
+
+    """
+
+    _staticTexts.clear()
+    _textSizes.clear()
+    _fontMetrics.clear()
@@ -0,0 +1,234 @@
+#
+# Copyright 2015-2017 Eric Thivierge
+#
+
+
+class TopologicalOrder(object):
+    """Topological order of a directed acyclic graph, kept up to date as edges
+    are added and removed.
+
+    Uses the dynamic algorithm of Pearce and Kelly. Every vertex holds an index
+    and every edge goes from a lower to a higher index. Adding an edge that
+    breaks this rule only searches and reorders the vertices whose index lies
+    between the two end points, instead of sorting the whole graph again.
+
+    Several edges can join the same pair of vertices. They are reference
+    counted, so the pair stays linked until the last one is removed.
+
+    Vertices only get successor and predecessor maps once they have edges, so
+    that large graphs of mostly unconnected vertices stay small.
+
+    """
+
+    def __init__(self):
+        super(TopologicalOrder, self).__init__()
+        self.__indices = {}
+        self.__successors = {}
+        self.__predecessors = {}
+        self.__nextIndex = 0
+
+    def __len__(self):
+        return len(self.__indices)
+
+    def __contains__(self, vertex):
+        return vertex in self.__indices
+
+    def addVertex(self, vertex):
+        if vertex in self.__indices:
+            return
+        self.__indices[vertex] = self.__nextIndex
+        self.__nextIndex += 1
+
+    def removeVertex(self, vertex):
+        if vertex not in self.__indices:
+            return
+        for successor in self.__successors.pop(vertex, ()):
+            self.__unlink(self.__predecessors, successor, vertex)
+        for predecessor in self.__predecessors.pop(vertex, ()):
+            self.__unlink(self.__successors, predecessor, vertex)
+        del self.__indices[vertex]
+
+    def __unlink(self, links, vertex, other):
+        vertexLinks = links[vertex]
+        del vertexLinks[other]
+        if len(vertexLinks) == 0:
+            del links[vertex]
+
+    def getIndex(self, vertex):
+        """Gets the position of a vertex in the order.
+
+        Indices only grow and are not contiguous, compare them to each other
+        rather than using them as list positions.
+
+        Args:
+            vertex (object): A vertex of the graph.
+
+        Returns:
+            int: Index of the vertex, None if it is not in the graph.
+
+        """
+
+        return self.__indices.get(vertex)
+
+    def getOrder(self):
+        """Gets all the vertices sorted so that every edge points forward.
+
+        Returns:
+            list: The vertices in topological order.
+
+        """
+
+        indices = self.__indices
+        return sorted(indices, key=indices.get)
+
+    def __searchForward(self, vertex, upperBound):
+        # Vertices reachable from vertex with an index up to upperBound.
+        indices = self.__indices
+        successors = self.__successors
+        visited = set([vertex])
+        stack = [vertex]
+        while stack:
+            current = stack.pop()
+            for successor in successors.get(current, ()):
+                if successor not in visited and indices[successor] <= upperBound:
+                    visited.add(successor)
+                    stack.append(successor)
+        return visited
+
+    def __searchBackward(self, vertex, lowerBound):
+        # Vertices reaching vertex with an index above lowerBound.
+        indices = self.__indices
+        predecessors = self.__predecessors
+        visited = set([vertex])
+        stack = [vertex]
+        while stack:
+            current = stack.pop()
+            for predecessor in predecessors.get(current, ()):
+                if predecessor not in visited and indices[predecessor] > lowerBound:
+                    visited.add(predecessor)
+                    stack.append(predecessor)
+        return visited
+
+    def getDescendants(self, vertex):
+        """Gets the vertices reachable from a vertex.
+
+        Args:
+            vertex (object): A vertex of the graph.
+
+        Returns:
+            set: The vertices reachable through one or more edges, and vertex
+                itself.
+
+        """
+
+        if vertex not in self.__indices:
+            return set([vertex])
+        return self.__searchForward(vertex, float('inf'))
+
+    def getAncestors(self, vertex):
+        """Gets the vertices that reach a vertex.
+
+        Args:
+            vertex (object): A vertex of the graph.
+
+        Returns:
+            set: The vertices reaching vertex through one or more edges, and
+                vertex itself.
+
+        """
+
+        if vertex not in self.__indices:
+            return set([vertex])
+        return self.__searchBackward(vertex, float('-inf'))
+
+    def wouldCreateCycle(self, source, target):
+        """Checks whether an edge from source to target would close a cycle.
+
+        Args:
+            source (object): Vertex the edge would start from.
+            target (object): Vertex the edge would end at.
+
+        Returns:
+            bool: True if target already reaches source.
+
+        """
+
+        if source == target:
+            return True
+        indices = self.__indices
+        if source not in indices or target not in indices:
+            return False
+        upperBound = indices[source]
+        if indices[target] > upperBound or target in self.__successors.get(source, ()):
+            return False
+        return source in self.__searchForward(target, upperBound)
+
+    def addEdge(self, source, target):
+        """Adds an edge, reordering the affected vertices if needed.
+
+        Vertices that are not in the graph yet are added first.
+
+        Args:
+            source (object): Vertex the edge starts from.
+            target (object): Vertex the edge ends at.
+
+        Returns:
+            bool: False if the edge would close a cycle, the graph is left
+                unchanged in that case.
+
+        """
+
+        if source == target:
+            return False
+        self.addVertex(source)
+        self.addVertex(target)
+
+        successors = self.__successors.get(source, {})
+        if target in successors:
+            successors[target] += 1
+            self.__predecessors[target][source] += 1
+            return True
+
+        indices = self.__indices
+        lowerBound = indices[target]
+        upperBound = indices[source]
+        if lowerBound < upperBound:
+            forward = self.__searchForward(target, upperBound)
+            if source in forward:
+                return False
+            backward = self.__searchBackward(source, lowerBound)
+
+            # Everything reaching the source moves in front of everything the
+            # target reaches, reusing the same set of indices.
+            backward = sorted(backward, key=indices.get)
+            forward = sorted(forward, key=indices.get)
+            vertices = backward + forward
+            newIndices = sorted(indices[vertex] for vertex in vertices)
+            for (vertex, index) in zip(vertices, newIndices):
+                indices[vertex] = index
+
+        successors[target] = 1
+        self.__successors[source] = successors
+        self.__predecessors.setdefault(target, {})[source] = 1
+        return True
+
+    def removeEdge(self, source, target):
+        """Removes one edge between two vertices.
+
+        The order stays valid as is, so no vertex is moved.
+
+        Args:
+            source (object): Vertex the edge starts from.
+            target (object): Vertex the edge ends at.
+
+        """
+
+        successors = self.__successors.get(source)
+        if successors is None or target not in successors:
+            return
+        successors[target] -= 1
+        if successors[target] == 0:
+            self.__unlink(self.__successors, source, target)
+            self.__unlink(self.__predecessors, target, source)
+        else:
+            self.__predecessors[target][source] -= 1
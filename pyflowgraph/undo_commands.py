@@ -0,0 +1,224 @@
+#
+# Copyright 2015-2017 Eric Thivierge
+#
+
+from qtpy import QtWidgets, QtCore
+
+UNDO_ID_SELECTION = 1
+
+
+class GraphCommand(QtWidgets.QUndoCommand):
+    """Base class of the commands recorded by GraphView.
+
+    Commands are pushed once their change has been made, so the redo call
+    issued by QUndoStack.push is skipped. Nodes are mostly referred to by
+    name, which stays valid as renames are recorded too. Undo and redo run in
+    a batch of the graph, with recording suspended.
+
+    """
+
+    def __init__(self, graph, text):
+        super(GraphCommand, self).__init__(text)
+        self._graph = graph
+        self.__pushed = False
+
+    def redo(self):
+        if not self.__pushed:
+            self.__pushed = True
+            return
+        with self._graph._replayingUndo():
+            self._redo()
+
+    def undo(self):
+        with self._graph._replayingUndo():
+            self._undo()
+
+    def _redo(self):
+        pass
+
+    def _undo(self):
+        pass
+
+
+class MoveNodesCommand(GraphCommand):
+    """Move of a set of nodes, stored as their names and a single offset."""
+
+    def __init__(self, graph, nodeNames, delta):
+        super(MoveNodesCommand, self).__init__(graph, 'Move Nodes')
+        self.__nodeNames = frozenset(nodeNames)
+        self.__delta = (delta.x(), delta.y())
+
+    def __move(self, dx, dy):
+        graph = self._graph
+        nodes = set(graph.getNode(name) for name in self.__nodeNames)
+        nodes.discard(None)
+        graph.moveNodes(nodes, QtCore.QPointF(dx, dy))
+
+    def _redo(self):
+        self.__move(self.__delta[0], self.__delta[1])
+
+    def _undo(self):
+        self.__move(-self.__delta[0], -self.__delta[1])
+
+
+class SetNodePositionsCommand(GraphCommand):
+    """Nodes placed at new positions, stored as their names and the (x, y)
+    graph positions before and after.
+
+    """
+
+    def __init__(self, graph, nodeNames, oldPositions, newPositions):
+        super(SetNodePositionsCommand, self).__init__(graph, 'Arrange Nodes')
+        self.__nodeNames = list(nodeNames)
+        self.__oldPositions = [(float(x), float(y)) for (x, y) in oldPositions]
+        self.__newPositions = [(float(x), float(y)) for (x, y) in newPositions]
+
+    def __apply(self, positions):
+        graph = self._graph
+        nodes = []
+        nodePositions = []
+        for (name, pos) in zip(self.__nodeNames, positions):
+            node = graph.getNode(name)
+            if node is not None:
+                nodes.append(node)
+                nodePositions.append(pos)
+        graph.setNodePositions(nodes, nodePositions)
+
+    def _redo(self):
+        self.__apply(self.__newPositions)
+
+    def _undo(self):
+        self.__apply(self.__oldPositions)
+
+
+class SelectionCommand(GraphCommand):
+    """Change of the selection, stored as the names that left and entered it.
+
+    Consecutive selection changes merge into one command, so that clicking
+    around does not bury the edits in the history.
+
+    """
+
+    def __init__(self, graph, removedNames, addedNames):
+        super(SelectionCommand, self).__init__(graph, 'Select Nodes')
+        self.__removedNames = frozenset(removedNames)
+        self.__addedNames = frozenset(addedNames)
+
+    def id(self):
+        return UNDO_ID_SELECTION
+
+    def mergeWith(self, other):
+        if not isinstance(other, SelectionCommand):
+            return False
+
+        removedNames = self.__removedNames
+        addedNames = self.__addedNames
+        self.__removedNames = (removedNames - other.__addedNames) | (other.__removedNames - addedNames)
+        self.__addedNames = (addedNames - other.__removedNames) | (other.__addedNames - removedNames)
+        return True
+
+    def __apply(self, deselectNames, selectNames):
+        graph = self._graph
+        for name in deselectNames:
+            node = graph.getNode(name)
+            if node is not None and node.isSelected():
+                graph.deselectNode(node)
+        for name in selectNames:
+            node = graph.getNode(name)
+            if node is not None and not node.isSelected():
+                graph.selectNode(node)
+
+    def _redo(self):
+        self.__apply(self.__removedNames, self.__addedNames)
+
+    def _undo(self):
+        self.__apply(self.__addedNames, self.__removedNames)
+
+
+class RenameNodeCommand(GraphCommand):
+
+    def __init__(self, graph, oldName, newName):
+        super(RenameNodeCommand, self).__init__(graph, 'Rename Node')
+        self.__oldName = oldName
+        self.__newName = newName
+
+    def _redo(self):
+        self._graph.getNode(self.__oldName).setName(self.__newName)
+
+    def _undo(self):
+        self._graph.getNode(self.__newName).setName(self.__oldName)
+
+
+class ConnectionCommand(GraphCommand):
+    """Connection made or removed, stored as the names of its two ports."""
+
+    def __init__(self, graph, edge, added):
+        super(ConnectionCommand, self).__init__(graph, 'Connect Ports' if added else 'Disconnect Ports')
+        self.__edge = tuple(edge)
+        self.__added = added
+
+    def __connect(self):
+        self._graph.connectPorts(*self.__edge)
+
+    def __disconnect(self):
+        connection = self._graph._findConnection(self.__edge)
+        if connection is not None:
+            self._graph.removeConnection(connection)
+
+    def _redo(self):
+        if self.__added:
+            self.__connect()
+        else:
+            self.__disconnect()
+
+    def _undo(self):
+        if self.__added:
+            self.__disconnect()
+        else:
+            self.__connect()
+
+
+class NodesCommand(GraphCommand):
+    """Nodes and connections added or removed.
+
+    Nodes are stored as their names while they are in the graph, and as a
+    serialized fragment while they are not, so that the history does not keep
+    their items alive. The fragment of added nodes is taken when they are
+    removed by undo, so that they come back with the ports added since.
+    Connections are stored as the names of their two ports.
+
+    """
+
+    def __init__(self, graph, nodes, edges, added, text=None):
+        if text is None:
+            text = 'Add Nodes' if added else 'Delete Nodes'
+        super(NodesCommand, self).__init__(graph, text)
+        self.__nodeNames = [node.getName() for node in nodes]
+        self.__edges = [tuple(edge) for edge in edges]
+        self.__added = added
+        self.__fragment = None
+        if not added:
+            self.__fragment = graph._serializeNodes(nodes, self.__edges)
+
+    def __add(self):
+        self._graph._restoreNodes(self.__fragment)
+        self.__fragment = None
+
+    def __remove(self):
+        graph = self._graph
+        nodes = [graph.getNode(name) for name in self.__nodeNames]
+        nodes = [node for node in nodes if node is not None]
+        self.__fragment = graph._serializeNodes(nodes, self.__edges)
+        graph._removeNodes(nodes, self.__edges)
+
+    def _redo(self):
+        if self.__added:
+            self.__add()
+        else:
+            self.__remove()
+
+    def _undo(self):
+        if self.__added:
+            self.__remove()
+        else:
+            self.__add()
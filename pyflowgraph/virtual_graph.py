@@ -0,0 +1,450 @@
+#
+# Copyright 2015-2017 Eric Thivierge
+#
+
+import math
+import heapq
+
+from qtpy import QtCore
+
+from .node import Node, NODE_EXPANDED
+from .topological_order import TopologicalOrder
+
+
+class VirtualGraph(QtCore.QObject):
+    """Lightweight model of a graph shown by a GraphView in virtual mode.
+
+    Nodes are stored as plain records: a position, a size, a color, the
+    description of their ports, shared between all the nodes with the same
+    ports, and their collapse state. Connections are stored as (srcNode, outputName, tgtNode, inputName)
+    tuples of names, like the edges taken by GraphView.buildGraph. The view
+    only creates items for the part of the model around what is on screen.
+
+    Nodes are referred to by name everywhere, and all the signals carry names
+    or edges, so they keep working for nodes that have no item.
+
+    Rectangle queries go through a grid of the node centers, searched with a
+    margin of half the largest node size, which is much cheaper to fill than
+    a SpatialIndex of the node bounds.
+
+    """
+
+    nodeAdded = QtCore.Signal(str)
+    nodeRemoved = QtCore.Signal(str)
+    nodeMoved = QtCore.Signal(str)
+    nodeRenamed = QtCore.Signal(str, str)
+    connectionAdded = QtCore.Signal(object)
+    connectionRemoved = QtCore.Signal(object)
+    selectionChanged = QtCore.Signal(list, list)
+
+    # Size assumed for a node until the view has measured its item.
+    _defaultNodeSize = (160.0, 80.0)
+
+    _gridCellSize = 300.0
+
+    def __init__(self, nodeClass=Node, parent=None):
+        super(VirtualGraph, self).__init__(parent)
+        self.__nodeClass = nodeClass
+        self.__records = {}
+        self.__portSets = {}
+        self.__edges = {}
+        self.__edgeCount = 0
+        self.__selection = set()
+        self.__cells = {}
+        self.__maxNodeSize = self._defaultNodeSize
+        self.__topologicalOrder = TopologicalOrder()
+
+    def getNodeClass(self):
+        return self.__nodeClass
+
+    def __len__(self):
+        return len(self.__records)
+
+    def __contains__(self, name):
+        return name in self.__records
+
+    ################################################
+    ## Nodes
+
+    def __getNodeRect(self, record):
+        (x, y, width, height) = record[:4]
+        return QtCore.QRectF(x - width * 0.5, y - height * 0.5, width, height)
+
+    def __getPortSet(self, ports):
+        # Nodes with the same ports share a single tuple describing them.
+        portSet = tuple((port['name'], port['type'], tuple(port['color']), port['dataType']) for port in ports)
+        return self.__portSets.setdefault(portSet, portSet)
+
+    def __getCell(self, x, y):
+        cellSize = self._gridCellSize
+        return (int(math.floor(x / cellSize)), int(math.floor(y / cellSize)))
+
+    def __insertInGrid(self, name, record):
+        cell = self.__getCell(record[0], record[1])
+        if record[6] == cell:
+            return
+        if record[6] is not None:
+            self.__removeFromGrid(name, record)
+        names = self.__cells.get(cell)
+        if names is None:
+            self.__cells[cell] = set([name])
+        else:
+            names.add(name)
+        record[6] = cell
+
+    def __removeFromGrid(self, name, record):
+        names = self.__cells[record[6]]
+        names.discard(name)
+        if len(names) == 0:
+            del self.__cells[record[6]]
+        record[6] = None
+
+    def addNodes(self, descs):
+        """Adds nodes to the model.
+
+        Args:
+            descs (iterable): Node descriptions in the format taken by
+                GraphView.buildGraph, colors given as (r, g, b, a).
+
+        """
+
+        records = self.__records
+        defaultSize = self._defaultNodeSize
+        # Descriptions usually share their lists of ports, which then only
+        # need to be looked at once.
+        portSets = {}
+        names = []
+        for desc in descs:
+            name = desc['name']
+            if name in records:
+                raise Exception("Node already exists:" + str(name))
+            pos = desc.get('pos', (0.0, 0.0))
+            color = desc.get('color')
+            ports = desc.get('ports', ())
+            entry = portSets.get(id(ports))
+            if entry is None:
+                entry = (ports, self.__getPortSet(ports))
+                portSets[id(ports)] = entry
+            record = [float(pos[0]), float(pos[1]), defaultSize[0], defaultSize[1], tuple(color) if color is not None else None, entry[1], None, desc.get('collapsed', NODE_EXPANDED)]
+            records[name] = record
+            self.__insertInGrid(name, record)
+            self.__topologicalOrder.addVertex(name)
+            names.append(name)
+
+        for name in names:
+            self.nodeAdded.emit(name)
+
+    def addNode(self, desc):
+        self.addNodes([desc])
+
+    def removeNode(self, name):
+        if name not in self.__records:
+            return
+        for edge in list(self.__edges.get(name, ())):
+            self.disconnect(edge)
+        self.__edges.pop(name, None)
+        self.deselectNodes([name])
+        self.__removeFromGrid(name, self.__records.pop(name))
+        self.__topologicalOrder.removeVertex(name)
+        self.nodeRemoved.emit(name)
+
+    def renameNode(self, name, newName):
+        if newName == name:
+            return
+        if newName in self.__records:
+            raise Exception("Node already exists:" + str(newName))
+
+        edges = list(self.__edges.get(name, ()))
+        for edge in edges:
+            self.__removeEdge(edge)
+        record = self.__records.pop(name)
+        self.__removeFromGrid(name, record)
+        self.__records[newName] = record
+        self.__insertInGrid(newName, record)
+        self.__topologicalOrder.removeVertex(name)
+        self.__topologicalOrder.addVertex(newName)
+        if name in self.__selection:
+            self.__selection.remove(name)
+            self.__selection.add(newName)
+        for (srcName, outputName, tgtName, inputName) in edges:
+            self.__addEdge((newName if srcName == name else srcName, outputName, newName if tgtName == name else tgtName, inputName))
+
+        self.nodeRenamed.emit(name, newName)
+
+    def getNodeNames(self):
+        return list(self.__records.keys())
+
+    def getNodeDesc(self, name):
+        """Gets the description of a node in the format taken by buildGraph.
+
+        Args:
+            name (str): Name of the node.
+
+        Returns:
+            dict: The description, None if there is no such node.
+
+        """
+
+        record = self.__records.get(name)
+        if record is None:
+            return None
+        desc = {
+            'name': name,
+            'pos': (record[0], record[1]),
+            'ports': [{'name': portName, 'type': portType, 'color': color, 'dataType': dataType} for (portName, portType, color, dataType) in record[5]]
+            }
+        if record[4] is not None:
+            desc['color'] = record[4]
+        if record[7] != NODE_EXPANDED:
+            desc['collapsed'] = record[7]
+        return desc
+
+    def _getItemKey(self, name):
+        # Nodes with the same key look the same, so the view can reuse the item
+        # of one for the other.
+        record = self.__records[name]
+        return (record[5], record[4], record[7])
+
+    def getCollapseState(self, name):
+        return self.__records[name][7]
+
+    def _setCollapseState(self, name, state):
+        # Updates a record without notifying anyone, used by the view to write
+        # back the state of the items.
+        self.__records[name][7] = state
+
+    def getNodePos(self, name):
+        record = self.__records[name]
+        return QtCore.QPointF(record[0], record[1])
+
+    def setNodePos(self, name, pos):
+        self._setNodeGeometry(name, pos.x(), pos.y())
+        self.nodeMoved.emit(name)
+
+    def _setNodeGeometry(self, name, x, y, width=None, height=None):
+        # Updates a record without notifying anyone, used by the view to write
+        # back what happened to the items.
+        record = self.__records[name]
+        record[0] = x
+        record[1] = y
+        if width is not None:
+            record[2] = width
+            record[3] = height
+            maxSize = self.__maxNodeSize
+            if width > maxSize[0] or height > maxSize[1]:
+                self.__maxNodeSize = (max(width, maxSize[0]), max(height, maxSize[1]))
+        self.__insertInGrid(name, record)
+
+    def getNodeRect(self, name):
+        return self.__getNodeRect(self.__records[name])
+
+    def __iterRings(self, x0, y0, x1, y1):
+        # Cells of a range, in square rings growing from its center.
+        (cx, cy) = ((x0 + x1) // 2, (y0 + y1) // 2)
+        yield (cx, cy)
+        for radius in range(1, max(cx - x0, x1 - cx, cy - y0, y1 - cy) + 1):
+            for x in range(max(cx - radius, x0), min(cx + radius, x1) + 1):
+                if cy - radius >= y0:
+                    yield (x, cy - radius)
+                if cy + radius <= y1:
+                    yield (x, cy + radius)
+            for y in range(max(cy - radius + 1, y0), min(cy + radius - 1, y1) + 1):
+                if cx - radius >= x0:
+                    yield (cx - radius, y)
+                if cx + radius <= x1:
+                    yield (cx + radius, y)
+
+    def getNamesInRect(self, rect, limit=None):
+        """Gets the nodes whose bounds intersect a rectangle.
+
+        Args:
+            rect (QRectF): Rectangle in scene coordinates.
+            limit (int): Maximum number of nodes to return, the ones nearest to
+                the center of the rectangle first. All of them if None.
+
+        Returns:
+            list: Names of the nodes intersecting the rectangle.
+
+        """
+
+        (maxWidth, maxHeight) = self.__maxNodeSize
+        (x0, y0) = self.__getCell(rect.left() - maxWidth * 0.5, rect.top() - maxHeight * 0.5)
+        (x1, y1) = self.__getCell(rect.right() + maxWidth * 0.5, rect.bottom() + maxHeight * 0.5)
+        (left, top, right, bottom) = (rect.left(), rect.top(), rect.right(), rect.bottom())
+        records = self.__records
+        cells = self.__cells
+
+        def collect(names, result):
+            for name in names:
+                (x, y, width, height) = records[name][:4]
+                if x + width * 0.5 >= left and x - width * 0.5 <= right and y + height * 0.5 >= top and y - height * 0.5 <= bottom:
+                    result.append(name)
+
+        # With a limit, the cells are visited from the center outwards until
+        # enough nodes are found, as long as that does not cost more than going
+        # through the occupied cells.
+        result = []
+        if limit is not None:
+            visited = 0
+            for cell in self.__iterRings(x0, y0, x1, y1):
+                names = cells.get(cell)
+                if names is not None:
+                    collect(names, result)
+                    if len(result) >= limit:
+                        return result[:limit]
+                visited += 1
+                if visited > len(cells):
+                    break
+            else:
+                return result
+            result = []
+
+        # Huge rectangles are cheaper to test against the occupied cells.
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > len(cells):
+            for (cell, names) in cells.items():
+                if x0 <= cell[0] <= x1 and y0 <= cell[1] <= y1:
+                    collect(names, result)
+        else:
+            for x in range(x0, x1 + 1):
+                for y in range(y0, y1 + 1):
+                    names = cells.get((x, y))
+                    if names is not None:
+                        collect(names, result)
+
+        if limit is not None and len(result) > limit:
+            (cx, cy) = (rect.center().x(), rect.center().y())
+            result = heapq.nsmallest(limit, result, key=lambda name: (records[name][0] - cx) ** 2 + (records[name][1] - cy) ** 2)
+        return result
+
+    def getBoundingRect(self, names=None):
+        """Gets the bounds of nodes.
+
+        Args:
+            names (iterable): Names of the nodes, all of them if None.
+
+        Returns:
+            QRectF: The united bounds, null if there are no nodes.
+
+        """
+
+        if names is None:
+            records = self.__records.values()
+        else:
+            records = [self.__records[name] for name in names]
+        if len(records) == 0:
+            return QtCore.QRectF()
+
+        left = min(x - width * 0.5 for (x, y, width, height, color, portSet, cell, collapseState) in records)
+        top = min(y - height * 0.5 for (x, y, width, height, color, portSet, cell, collapseState) in records)
+        right = max(x + width * 0.5 for (x, y, width, height, color, portSet, cell, collapseState) in records)
+        bottom = max(y + height * 0.5 for (x, y, width, height, color, portSet, cell, collapseState) in records)
+        return QtCore.QRectF(left, top, right - left, bottom - top)
+
+    ################################################
+    ## Connections
+
+    def __checkPort(self, name, portName, portTypes):
+        record = self.__records.get(name)
+        if record is None:
+            raise Exception("Node not found:" + str(name))
+        for (otherName, portType, color, dataType) in record[5]:
+            if otherName == portName and portType in portTypes:
+                return
+        raise Exception("Node '" + name + "' does not have port:" + portName)
+
+    def __addEdge(self, edge):
+        if not self.__topologicalOrder.addEdge(edge[0], edge[2]):
+            raise Exception("Connecting '" + edge[0] + "' to '" + edge[2] + "' would create a cycle.")
+        self.__edges.setdefault(edge[0], []).append(edge)
+        self.__edges.setdefault(edge[2], []).append(edge)
+        self.__edgeCount += 1
+
+    def __removeEdge(self, edge):
+        self.__topologicalOrder.removeEdge(edge[0], edge[2])
+        self.__edgeCount -= 1
+        for name in (edge[0], edge[2]):
+            edges = self.__edges.get(name)
+            if edges is not None and edge in edges:
+                edges.remove(edge)
+                if len(edges) == 0:
+                    del self.__edges[name]
+
+    def connect(self, edges):
+        """Adds connections to the model.
+
+        Args:
+            edges (iterable): Tuples of (srcNode, outputName, tgtNode,
+                inputName) names.
+
+        """
+
+        newEdges = []
+        for edge in edges:
+            edge = tuple(edge)
+            if edge in self.__edges.get(edge[0], ()):
+                continue
+            self.__checkPort(edge[0], edge[1], ('Out', 'IO'))
+            self.__checkPort(edge[2], edge[3], ('In', 'IO'))
+            self.__addEdge(edge)
+            newEdges.append(edge)
+
+        for edge in newEdges:
+            self.connectionAdded.emit(edge)
+
+    def disconnect(self, edge):
+        edge = tuple(edge)
+        if edge not in self.__edges.get(edge[0], ()):
+            return
+        self.__removeEdge(edge)
+        self.connectionRemoved.emit(edge)
+
+    def getEdgeCount(self):
+        return self.__edgeCount
+
+    def getEdges(self, name):
+        """Gets the connections of a node.
+
+        Args:
+            name (str): Name of the node.
+
+        Returns:
+            tuple: Edges starting or ending at the node.
+
+        """
+
+        return tuple(self.__edges.get(name, ()))
+
+    def hasEdge(self, edge):
+        return tuple(edge) in self.__edges.get(edge[0], ())
+
+    def wouldCreateCycle(self, srcName, tgtName):
+        return self.__topologicalOrder.wouldCreateCycle(srcName, tgtName)
+
+    ################################################
+    ## Selection
+
+    def isSelected(self, name):
+        return name in self.__selection
+
+    def getSelectedNames(self):
+        return list(self.__selection)
+
+    def selectNodes(self, names, clearSelection=False):
+        names = set(name for name in names if name in self.__records)
+        removed = list(self.__selection - names) if clearSelection else []
+        added = list(names - self.__selection)
+        if len(removed) == 0 and len(added) == 0:
+            return
+        self.__selection.difference_update(removed)
+        self.__selection.update(added)
+        self.selectionChanged.emit(removed, added)
+
+    def deselectNodes(self, names):
+        removed = [name for name in names if name in self.__selection]
+        if len(removed) == 0:
+            return
+        self.__selection.difference_update(removed)
+        self.selectionChanged.emit(removed, [])
+
+    def clearSelection(self):
+        self.deselectNodes(list(self.__selection))
@@ -37,5 +37,6 @@ setup(name='pyflowgraph',
       keywords='data flow graph',
       packages=find_packages(exclude=['tests']),
       install_requires=['PySide>=1.2.2,<1.2.4','qtpy','six','future'],
+      extras_require={'layout': ['numpy']},
       zip_safe=False)
 
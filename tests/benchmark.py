@@ -0,0 +1,269 @@
+#
+# Copyright 2015-2017 Eric Thivierge
+#
+import gc
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+
+# Run without a display unless a platform was asked for.
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from qtpy import QtGui, QtWidgets, QtCore, QT_VERSION
+
+# Add the pyflowgraph module to the current environment if it does not already exist
+import imp
+try:
+    imp.find_module('pyflowgraph')
+    found = True
+except ImportError:
+    import os, sys
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..")))
+
+from pyflowgraph.graph_view import GraphView
+from pyflowgraph.graph_view_widget import GraphViewWidget
+from pyflowgraph.node import Node
+
+# Times the common graph operations on generated graphs and writes the results
+# as JSON, so that releases can be compared. Run with --help for the options.
+
+inColor = (128, 170, 170, 255)
+outColor = (32, 255, 32, 255)
+
+
+def makePorts(inputs, outputs):
+    ports = [{'name': name, 'type': 'In', 'color': inColor, 'dataType': 'MyDataX'} for name in inputs]
+    ports += [{'name': name, 'type': 'Out', 'color': outColor, 'dataType': 'MyDataX'} for name in outputs]
+    return ports
+
+
+#########################
+## Generators
+# Each generator returns the node descriptions and edges taken by buildGraph.
+
+# The diamond of tests/bigGraph.py: the node count doubles for depth levels,
+# then halves again.
+def generateDiamond(depth):
+    ports = makePorts(['InPort'], ['OutPort'])
+    nodes = []
+    edges = []
+    counts = [2 ** level for level in range(depth + 1)] + [2 ** level for level in range(depth - 1, -1, -1)]
+    for (level, count) in enumerate(counts):
+        for i in range(count):
+            nodes.append({'name': 'node%d_%d' % (level, i), 'pos': (level * 160, i * 80), 'ports': ports})
+        if level == 0:
+            continue
+        if count > counts[level - 1]:
+            for i in range(count):
+                edges.append(('node%d_%d' % (level - 1, i // 2), 'OutPort', 'node%d_%d' % (level, i), 'InPort'))
+        else:
+            for i in range(count):
+                edges.append(('node%d_%d' % (level - 1, i), 'OutPort', 'node%d_%d' % (level, i), 'InPort'))
+    return (nodes, edges)
+
+
+# Every node reads from up to three nodes among the ones that precede it
+# closely, with the occasional longer edge.
+def generateRandomDag(nodeCount, seed=0):
+    rng = random.Random(seed)
+    ports = makePorts(['in0', 'in1', 'in2'], ['out'])
+    columns = max(int(nodeCount ** 0.5), 1)
+    nodes = [{'name': 'node%d' % i, 'pos': ((i % columns) * 200, (i // columns) * 120), 'ports': ports} for i in range(nodeCount)]
+    edges = []
+    for i in range(1, nodeCount):
+        sources = set()
+        for j in range(rng.randint(1, 3)):
+            span = rng.randint(1, 40) if rng.random() < 0.9 else rng.randint(40, 400)
+            if i - span >= 0:
+                sources.add(i - span)
+        for (j, source) in enumerate(sorted(sources)):
+            edges.append(('node%d' % source, 'out', 'node%d' % i, 'in%d' % j))
+    return (nodes, edges)
+
+
+# A few sources each feeding a wide column of nodes.
+def generateFanOut(sourceCount, fanOut):
+    ports = makePorts(['in'], ['out'])
+    nodes = []
+    edges = []
+    for s in range(sourceCount):
+        source = 'source%d' % s
+        nodes.append({'name': source, 'pos': (s * 600, -200), 'ports': ports})
+        for i in range(fanOut):
+            target = 'target%d_%d' % (s, i)
+            nodes.append({'name': target, 'pos': (s * 600 + 300, i * 80), 'ports': ports})
+            edges.append((source, 'out', target, 'in'))
+    return (nodes, edges)
+
+
+# A chain of nodes with many ports, every output feeding the matching input
+# of the next node.
+def generateManyPorts(nodeCount, portCount):
+    ports = makePorts(['in%d' % k for k in range(portCount)], ['out%d' % k for k in range(portCount)])
+    nodes = [{'name': 'node%d' % i, 'pos': (i * 250, (i % 2) * 100), 'ports': ports} for i in range(nodeCount)]
+    edges = []
+    for i in range(nodeCount - 1):
+        for k in range(portCount):
+            edges.append(('node%d' % i, 'out%d' % k, 'node%d' % (i + 1), 'in%d' % k))
+    return (nodes, edges)
+
+
+generators = {
+    'diamond': (generateDiamond, {'small': {'depth': 6}, 'medium': {'depth': 9}, 'large': {'depth': 11}}),
+    'randomDag': (generateRandomDag, {'small': {'nodeCount': 500}, 'medium': {'nodeCount': 2000}, 'large': {'nodeCount': 10000}}),
+    'fanOut': (generateFanOut, {'small': {'sourceCount': 2, 'fanOut': 250}, 'medium': {'sourceCount': 4, 'fanOut': 1000}, 'large': {'sourceCount': 8, 'fanOut': 2500}}),
+    'manyPorts': (generateManyPorts, {'small': {'nodeCount': 50, 'portCount': 16}, 'medium': {'nodeCount': 200, 'portCount': 32}, 'large': {'nodeCount': 1000, 'portCount': 32}}),
+    }
+
+
+#########################
+## Operations
+
+def sendMouseEvent(graph, eventType, pos, buttons):
+    button = QtCore.Qt.LeftButton if eventType != QtCore.QEvent.MouseMove else QtCore.Qt.NoButton
+    event = QtGui.QMouseEvent(eventType, QtCore.QPointF(pos), button, buttons, QtCore.Qt.NoModifier)
+    QtWidgets.QApplication.sendEvent(graph.viewport(), event)
+
+
+def runCase(app, graph, nodes, edges, dragCount, steps):
+    timings = {}
+    counts = {'nodes': len(nodes), 'edges': len(edges)}
+
+    # Collect the garbage of the previous operations first, so that no
+    # operation pays for freeing the items of another one.
+    def timed(name, function):
+        gc.collect()
+        start = time.time()
+        result = function()
+        timings[name] = time.time() - start
+        return result
+
+    # Nodes and connections created one at a time, the way tools usually do.
+    def construct():
+        for desc in nodes:
+            node = Node(graph, desc['name'])
+            for portDesc in desc['ports']:
+                portClass = Node.getPortClass(portDesc['type'])
+                node.addPort(portClass(node, graph, portDesc['name'], QtGui.QColor(*portDesc['color']), portDesc['dataType']))
+            node.setGraphPos(QtCore.QPointF(*desc['pos']))
+            graph.addNode(node)
+
+    def connect():
+        for edge in edges:
+            graph.connectPorts(*edge)
+
+    timed('construction', construct)
+    timed('connectPorts', connect)
+    # The layout requests posted while building, buildGraph is timed with them.
+    timed('layoutRequests', app.processEvents)
+
+    timed('frameAllNodes', lambda: (graph.frameAllNodes(), app.processEvents()))
+
+    def render():
+        image = QtGui.QImage(graph.viewport().size(), QtGui.QImage.Format_ARGB32_Premultiplied)
+        painter = QtGui.QPainter(image)
+        graph.render(painter, QtCore.QRectF(image.rect()), graph.viewport().rect())
+        painter.end()
+    timed('render', render)
+
+    # Drags a selection rectangle from outside the graph to its center.
+    def rubberBand():
+        rect = graph.scene().itemsBoundingRect()
+        start = graph.mapFromScene(rect.topLeft() - QtCore.QPointF(50, 50))
+        end = graph.mapFromScene(rect.center())
+        sendMouseEvent(graph, QtCore.QEvent.MouseButtonPress, start, QtCore.Qt.LeftButton)
+        for step in range(1, steps + 1):
+            sendMouseEvent(graph, QtCore.QEvent.MouseMove, start + (end - start) * step / steps, QtCore.Qt.LeftButton)
+            app.processEvents()
+        sendMouseEvent(graph, QtCore.QEvent.MouseButtonRelease, end, QtCore.Qt.NoButton)
+    timed('rubberBandSelection', rubberBand)
+    counts['rubberBandSelected'] = len(graph.getSelectedNodes())
+
+    graph.clearSelection()
+    for node in graph.getNodes()[:dragCount]:
+        graph.selectNode(node)
+    counts['dragged'] = len(graph.getSelectedNodes())
+
+    def drag():
+        delta = QtCore.QPointF(7, 3)
+        graph.beginMoveSelectedNodes()
+        for step in range(steps):
+            graph.moveSelectedNodes(delta)
+            app.processEvents()
+        graph.endMoveSelectedNodes(delta * steps)
+    timed('drag', drag)
+
+    timed('deleteSelectedNodes', lambda: (graph.deleteSelectedNodes(), app.processEvents()))
+    timed('reset', lambda: (graph.reset(), app.processEvents()))
+
+    # The bulk path, for comparison with construction, connectPorts and layoutRequests.
+    timed('buildGraph', lambda: (graph.buildGraph(nodes, edges), app.processEvents()))
+    graph.reset()
+    app.processEvents()
+
+    return (timings, counts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Times pyflowgraph operations on generated graphs.')
+    parser.add_argument('--size', choices=('small', 'medium', 'large'), default='small', help='Size of the generated graphs.')
+    parser.add_argument('--graphs', nargs='+', choices=sorted(generators.keys()), default=sorted(generators.keys()), help='Generators to run.')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per graph, the fastest time of each operation is kept.')
+    parser.add_argument('--drag', type=int, default=1000, help='Number of nodes selected for the drag.')
+    parser.add_argument('--steps', type=int, default=20, help='Mouse moves of the rubber band and the drag.')
+    parser.add_argument('--output', default='benchmark.json', help='Path of the JSON results.')
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication(sys.argv)
+
+    widget = GraphViewWidget()
+    graph = GraphView(parent=widget)
+    widget.setGraphView(graph)
+    widget.resize(1600, 900)
+    widget.show()
+    app.processEvents()
+
+    results = []
+    print('%-12s %8s %8s %-20s %10s' % ('graph', 'nodes', 'edges', 'operation', 'seconds'))
+    for name in args.graphs:
+        (generator, sizes) = generators[name]
+        params = sizes[args.size]
+        (nodes, edges) = generator(**params)
+
+        runs = []
+        for run in range(args.repeat):
+            (timings, counts) = runCase(app, graph, nodes, edges, args.drag, args.steps)
+            runs.append(timings)
+        best = dict((operation, min(timings[operation] for timings in runs)) for operation in runs[0])
+        results.append({
+            'graph': name,
+            'params': params,
+            'counts': counts,
+            'seconds': best,
+            'runs': runs
+            })
+
+        for operation in sorted(best):
+            print('%-12s %8d %8d %-20s %10.4f' % (name, len(nodes), len(edges), operation, best[operation]))
+
+    report = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'qt': QT_VERSION,
+        'platform': platform.platform(),
+        'qpa': QtGui.QGuiApplication.platformName(),
+        'size': args.size,
+        'repeat': args.repeat,
+        'results': results
+        }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print('results written to ' + args.output)
+
+
+if __name__ == '__main__':
+    main()
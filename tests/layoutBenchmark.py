@@ -0,0 +1,44 @@
+#
+# Copyright 2015-2017 Eric Thivierge
+#
+import sys
+import time
+import random
+
+# Add the pyflowgraph module to the current environment if it does not already exist
+import imp
+try:
+    imp.find_module('pyflowgraph')
+    found = True
+except ImportError:
+    import os, sys
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..")))
+
+from pyflowgraph.layered_layout import LayeredLayout
+
+# Times the layered layout on random acyclic graphs of growing size. Every node
+# reads from up to three nodes among the ones that precede it closely, with the
+# occasional longer edge to exercise the dummy nodes.
+def generateGraph(nodeCount, seed=0):
+    rng = random.Random(seed)
+    src = []
+    dst = []
+    for i in range(1, nodeCount):
+        for j in range(rng.randint(1, 3)):
+            span = rng.randint(1, 40) if rng.random() < 0.9 else rng.randint(40, 400)
+            source = i - span
+            if source < 0:
+                continue
+            src.append(source)
+            dst.append(i)
+    widths = [rng.uniform(80.0, 200.0) for i in range(nodeCount)]
+    heights = [rng.uniform(40.0, 120.0) for i in range(nodeCount)]
+    return (widths, heights, src, dst)
+
+layout = LayeredLayout()
+print('%10s %10s %10s' % ('nodes', 'edges', 'seconds'))
+for nodeCount in (1000, 5000, 10000, 20000, 50000):
+    (widths, heights, src, dst) = generateGraph(nodeCount)
+    start = time.time()
+    layout.computePositions(widths, heights, src, dst)
+    print('%10d %10d %10.3f' % (nodeCount, len(src), time.time() - start))
@@ -0,0 +1,89 @@
+#
+# Copyright 2015-2017 Eric Thivierge
+#
+import os
+import sys
+import json
+import argparse
+
+# Records the interactions with a graph, or replays them headless and reports
+# the latency of the events:
+#
+#   replayInteractions.py record session.jsonl [--nodes 2000]
+#   replayInteractions.py replay session.jsonl [--speed 1.0] [--output latency.json]
+#
+# Recording opens a window on a generated graph and saves the session when the
+# window is closed.
+
+parser = argparse.ArgumentParser(description='Records or replays interactions with a graph view.')
+parser.add_argument('mode', choices=('record', 'replay'))
+parser.add_argument('path', help='Recording file.')
+parser.add_argument('--nodes', type=int, default=2000, help='Number of nodes of the graph to record on.')
+parser.add_argument('--speed', type=float, default=None, help='Replay speed relative to the recording, as fast as possible by default.')
+parser.add_argument('--output', default=None, help='Path of the JSON latency report.')
+args = parser.parse_args()
+
+if args.mode == 'replay':
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from qtpy import QtGui, QtWidgets, QtCore
+
+# Add the pyflowgraph module to the current environment if it does not already exist
+import imp
+try:
+    imp.find_module('pyflowgraph')
+    found = True
+except ImportError:
+    import os, sys
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..")))
+
+from pyflowgraph.graph_view import GraphView
+from pyflowgraph.graph_view_widget import GraphViewWidget
+from pyflowgraph.interaction_recorder import InteractionRecorder, InteractionReplayer
+
+app = QtWidgets.QApplication(sys.argv)
+
+widget = GraphViewWidget()
+graph = GraphView(parent=widget)
+widget.setGraphView(graph)
+widget.resize(1600, 900)
+widget.show()
+app.processEvents()
+
+if args.mode == 'record':
+    # Chains of nodes laid out in a grid, each node also reading from the row above.
+    columns = 40
+    ports = [
+        {'name': 'InPort', 'type': 'In', 'color': (128, 170, 170, 255), 'dataType': 'MyDataX'},
+        {'name': 'AboveInPort', 'type': 'In', 'color': (128, 170, 170, 255), 'dataType': 'MyDataX'},
+        {'name': 'OutPort', 'type': 'Out', 'color': (32, 255, 32, 255), 'dataType': 'MyDataX'}
+        ]
+    nodes = [{'name': 'node' + str(i), 'pos': ((i % columns) * 220, (i // columns) * 150), 'ports': ports} for i in range(args.nodes)]
+    edges = [('node' + str(i), 'OutPort', 'node' + str(i + 1), 'InPort') for i in range(args.nodes - 1) if (i + 1) % columns != 0]
+    edges += [('node' + str(i), 'OutPort', 'node' + str(i + columns), 'AboveInPort') for i in range(args.nodes - columns)]
+    graph.buildGraph(nodes, edges)
+    graph.frameAllNodes()
+    app.processEvents()
+
+    recorder = InteractionRecorder(graph)
+    recorder.start()
+    app.exec_()
+    recorder.stop()
+    recorder.save(args.path)
+    print('recorded ' + str(len(recorder.getRecords())) + ' records to ' + args.path)
+
+else:
+    replayer = InteractionReplayer(graph)
+    replayer.load(args.path)
+    report = replayer.replay(speed=args.speed)
+
+    print('%-20s %8s %10s %10s %10s %10s' % ('event', 'count', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms'))
+    for (name, stats) in sorted(report['events'].items()) + [('all', report['all'])]:
+        if stats['count'] == 0:
+            continue
+        print('%-20s %8d %10.2f %10.2f %10.2f %10.2f' % (name, stats['count'], stats['p50'] * 1000, stats['p90'] * 1000, stats['p99'] * 1000, stats['max'] * 1000))
+    print('checkpoint drift: ' + str(report['checkpointDrift']))
+
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
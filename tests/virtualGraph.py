@@ -0,0 +1,45 @@
+#
+# Copyright 2015-2017 Eric Thivierge
+#
+import sys
+import time
+from qtpy import QtGui, QtWidgets, QtCore
+
+# Add the pyflowgraph module to the current environment if it does not already exist
+import imp
+try:
+    imp.find_module('pyflowgraph')
+    found = True
+except ImportError:
+    import os, sys
+    sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..")))
+
+from pyflowgraph.graph_view import GraphView
+from pyflowgraph.graph_view_widget import GraphViewWidget
+from pyflowgraph.virtual_graph import VirtualGraph
+
+app = QtWidgets.QApplication(sys.argv)
+
+widget = GraphViewWidget()
+graph = GraphView(parent=widget)
+
+# A grid of chains of nodes, only the ones around the view get items.
+nodeCount = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+columns = 700
+ports = [
+    {'name': 'InPort', 'type': 'In', 'color': (128, 170, 170, 255), 'dataType': 'MyDataX'},
+    {'name': 'OutPort', 'type': 'Out', 'color': (32, 255, 32, 255), 'dataType': 'MyDataX'}
+    ]
+
+start = time.time()
+virtualGraph = VirtualGraph()
+virtualGraph.addNodes({'name': 'node' + str(i), 'pos': ((i % columns) * 220, (i // columns) * 150), 'ports': ports} for i in range(nodeCount))
+virtualGraph.connect(('node' + str(i), 'OutPort', 'node' + str(i + 1), 'InPort') for i in range(nodeCount - 1) if (i + 1) % columns != 0)
+print("nodes:" + str(len(virtualGraph)) + " built in " + str(time.time() - start) + "s")
+
+graph.setVirtualGraph(virtualGraph)
+
+widget.setGraphView(graph)
+widget.show()
+
+sys.exit(app.exec_())